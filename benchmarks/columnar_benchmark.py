@@ -0,0 +1,77 @@
+'''
+Сравнение хранения строк таблицы списком словарей и ColumnarTable.
+
+Измеряется память, которую занимают преобразованные строки листа,
+и время подготовки тела запросов push API частями по 10000 строк.
+
+Запуск из корня репозитория с заполненным .env:
+    python -m benchmarks.columnar_benchmark --rows 100000
+'''
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+from typing import Any, Callable, Tuple
+
+from benchmarks.row_transform_benchmark import make_typed_rows
+from extended_pbipy.serializer import dumps_rows
+from extended_pbipy.utils import get_chunk_bounds
+from src.fake_server.server import make_all_market_tab
+from src.services.api_exchange_v2 import ApiExchangeFlowAllMarket
+
+CHUNK_SIZE = 10000
+
+
+def traced(build: Callable[[], Any]) -> Tuple[Any, int]:
+    '''Возвращает результат build и занятую им память в байтах.'''
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def serialize(rows) -> float:
+    '''Возвращает время сериализации строк частями, как при загрузке.'''
+    started = time.perf_counter()
+    for start, stop in get_chunk_bounds(len(rows), CHUNK_SIZE):
+        dumps_rows(rows[start:stop])
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    values = make_all_market_tab(args.rows)
+    rows = values[3:]
+
+    for typed, table_rows in ((False, rows), (True, make_typed_rows(rows))):
+        flow = ApiExchangeFlowAllMarket('benchmark', 'benchmark', typed=typed)
+        table = flow._create_pbi_table(values[1], 'benchmark')
+        transformer = flow._get_transformer(table)
+
+        dict_rows, dict_size = traced(
+            lambda: list(transformer.transform(table_rows))
+        )
+        columnar, columnar_size = traced(
+            lambda: transformer.transform_table(table_rows)
+        )
+        assert list(columnar) == dict_rows
+
+        mode = 'typed' if typed else 'formatted'
+        print(f'{mode} values, {len(table_rows)} rows')
+        print(f'list of dicts   {dict_size / 2 ** 20:>8.1f} MiB')
+        print(f'ColumnarTable   {columnar_size / 2 ** 20:>8.1f} MiB')
+        print(f'memory ratio {dict_size / columnar_size:.1f}x')
+        print(f'serialize list of dicts  {serialize(dict_rows):>8.3f} s')
+        print(f'serialize ColumnarTable  {serialize(columnar):>8.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+'''
+Сравнение преобразования строк листа по ячейкам и через RowTransformer.
+
+old_convert_rows и old_convert_typed_rows - прежние методы
+ApiExchangeFlowAllMarket, по которым проверяется совпадение строк.
+
+Запуск из корня репозитория с заполненным .env:
+    python -m benchmarks.row_transform_benchmark --rows 100000
+'''
+import argparse
+import logging
+import time
+from typing import Dict, Iterator, List
+
+from extended_pbipy.entities import Table
+from extended_pbipy.enums import ColumnDataTypes
+from src.fake_server.server import make_all_market_tab
+from src.services.api_exchange_v2 import ApiExchangeFlowAllMarket
+from src.services.google_api import serial_number_to_iso
+
+logger = logging.getLogger(__name__)
+
+# Прежние списки ApiExchangeFlowAllMarket, которые заменила разметка
+# листа Весь рынок из sheet_schemas.json
+INT_VALUES = [7, 8, 10, 11, 12, 29, 31, 32, 33]
+DOUBLE_VALUES = [14]
+BOOL_VALUES = [22]
+CITIES = [
+    'Москва', 'Санкт-Петербург', 'Казань', 'Краснодар',
+    'Екатеринбург', 'Новосибирск', 'Хабаровск'
+]
+
+
+def old_convert_rows(
+        table: Table,
+        table_rows: List
+) -> Iterator[Dict]:
+    '''Возвращает генератор строк таблицы PowerBI по строкам листа.'''
+    table_columns = table.columns
+    int_values = INT_VALUES
+    double_values = DOUBLE_VALUES
+    bool_values = BOOL_VALUES
+    cities = CITIES
+
+    for row in table_rows:
+        row_data = {}
+        shifted = False
+        # Добавляются столбцы с подкатегориями
+        categories = {
+            'Категория.1': '',
+            'Категория.2': '',
+            'Категория.3': '',
+            'Категория.4': '',
+            'Категория.5': '',
+        }
+        for value_num in range(len(row)):
+
+            try:
+                # Учитываем смещение индекса после разделения на подкатегории
+                column_idx = value_num + 5 if shifted else value_num
+                column_name = table_columns[column_idx].name
+                row_value = (
+                    row[value_num] if row[value_num] else ''
+                )
+                if '₽' in row_value:
+                    row_value = row_value.replace('₽', '')
+                if value_num in int_values:
+                    if not row_value:
+                        row_value = 0
+                    else:
+                        row_value = ''.join(row_value.split())
+                elif column_name in cities:
+                    if not row_value:
+                        row_value = 0
+                elif value_num in double_values and not row_value:
+                    row_value = 0.0
+                elif value_num in bool_values and not row_value:
+                    row_value = False
+
+                row_data[column_name] = row_value
+
+                if column_name == 'Категория':
+                    shifted = True
+                    # Делим на подкатегории
+                    keys = list(categories.keys())
+                    sub_categories = row_value.split('/')
+                    last_idx = len(sub_categories) - 1
+                    for k_idx in range(len(keys)):
+                        if last_idx >= 0:
+                            last_idx -= 1
+                            categories[keys[k_idx]] = sub_categories[k_idx]
+                        else:
+                            break
+                    for k, v in categories.items():
+                        row_data[k] = v
+
+                if value_num == len(row) - 1:
+                    shifted = False
+
+            except IndexError:
+                logger.error('Index error in add rows', exc_info=True)
+                column_name = 'Undefined'
+                row_data[column_name] = row_value
+
+            except Exception as err:
+                logger.error(f'Error in add rows {err}', exc_info=True)
+                column_name = 'Undefined'
+                row_data[column_name] = row_value
+
+        yield row_data
+
+
+def old_convert_typed_rows(
+        table: Table,
+        table_rows: List
+) -> Iterator[Dict]:
+    '''
+    Возвращает генератор строк таблицы PowerBI по типизированным
+    значениям листа (UNFORMATTED_VALUE).
+
+    Числа и bool приходят готовыми, поэтому строки не разбираются:
+    пустые ячейки заменяются значениями по умолчанию, серийные
+    номера дат переводятся в ISO 8601, категория делится на
+    подкатегории.
+    '''
+    column_names = [column.name for column in table.columns]
+    datetime_columns = {
+        idx for idx, column in enumerate(table.columns)
+        if column.data_type == ColumnDataTypes.Datetime.value
+    }
+    category_idx = (
+        column_names.index('Категория')
+        if 'Категория' in column_names
+        else len(column_names)
+    )
+    sub_categories_count = 5
+
+    # Значения по умолчанию для пустых ячеек по индексу в строке листа
+    empty_values = {}
+    for value_num in range(len(column_names)):
+        column_idx = (
+            value_num + sub_categories_count
+            if value_num > category_idx
+            else value_num
+        )
+        if column_idx >= len(column_names):
+            break
+        if value_num in INT_VALUES:
+            empty_values[value_num] = 0
+        elif column_names[column_idx] in CITIES:
+            empty_values[value_num] = 0
+        elif value_num in DOUBLE_VALUES:
+            empty_values[value_num] = 0.0
+        elif value_num in BOOL_VALUES:
+            empty_values[value_num] = False
+
+    for row in table_rows:
+        row_data = {}
+        for value_num, row_value in enumerate(row):
+            column_idx = (
+                value_num + sub_categories_count
+                if value_num > category_idx
+                else value_num
+            )
+            if column_idx >= len(column_names):
+                logger.error('Index error in add rows')
+                row_data['Undefined'] = row_value
+                continue
+
+            if row_value == '':
+                row_value = empty_values.get(value_num, '')
+            elif (
+                column_idx in datetime_columns
+                and isinstance(row_value, (int, float))
+            ):
+                row_value = serial_number_to_iso(row_value)
+
+            row_data[column_names[column_idx]] = row_value
+
+            if value_num == category_idx:
+                # Делим на подкатегории
+                sub_categories = str(row_value).split('/')
+                for sub_idx in range(sub_categories_count):
+                    row_data[column_names[column_idx + sub_idx + 1]] = (
+                        sub_categories[sub_idx]
+                        if sub_idx < len(sub_categories)
+                        else ''
+                    )
+
+        yield row_data
+
+
+def make_typed_rows(rows: List[List]) -> List[List]:
+    '''Переводит строки листа в значения UNFORMATTED_VALUE.'''
+    typed_rows = []
+    for row in rows:
+        typed_row = []
+        for value_num, value in enumerate(row):
+            if value_num == 13:
+                typed_row.append(45323.5)
+            elif value_num == 22:
+                typed_row.append(value == 'TRUE')
+            elif value.isdigit():
+                typed_row.append(int(value))
+            else:
+                typed_row.append(value)
+        typed_rows.append(typed_row)
+    return typed_rows
+
+
+def measure(name: str, transform, number: int) -> float:
+    '''Печатает лучшее время из number прогонов и возвращает его.'''
+    best = min(
+        timed(transform) for _ in range(number)
+    )
+    print(f'{name:<24} {best:>8.3f} s')
+    return best
+
+
+def timed(transform) -> float:
+    '''Возвращает время одного прогона.'''
+    started = time.perf_counter()
+    transform()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    values = make_all_market_tab(args.rows)
+    # Часть строк с пустыми ячейками в конце и пустыми значениями
+    for row in values[3::7]:
+        row[7] = ''
+        row[12] = ''
+        del row[-3:]
+    rows = values[3:]
+    typed_rows = make_typed_rows(rows)
+
+    for typed, table_rows in ((False, rows), (True, typed_rows)):
+        flow = ApiExchangeFlowAllMarket('benchmark', 'benchmark', typed=typed)
+        table = flow._create_pbi_table(values[1], 'benchmark')
+        old = old_convert_typed_rows if typed else old_convert_rows
+        assert list(old(table, table_rows)) == list(
+            flow._transform_rows(table, table_rows)
+        )
+
+        mode = 'typed' if typed else 'formatted'
+        print(f'{mode} values, {len(table_rows)} rows')
+        old_time = measure(
+            'per cell loop', lambda: list(old(table, table_rows)),
+            args.number
+        )
+        new_time = measure(
+            'RowTransformer',
+            lambda: list(flow._transform_rows(table, table_rows)),
+            args.number
+        )
+        print(f'speedup {old_time / new_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+'''
+Сравнение сериализации датасета и строк старым и новым способом.
+
+Старый путь: to_dict через json.loads(json.dumps(..., cls=PowerBiEncoder))
+и повторная сериализация в requests через json=, для post_dataset
+с отступами indent=4. Новый путь: extended_pbipy.serializer.dumps.
+
+Запуск из корня репозитория:
+    python -m benchmarks.serializer_benchmark --rows 10000 --columns 43
+'''
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+from extended_pbipy.entities import DatasetCreate, PowerBiEncoder, Table
+from extended_pbipy.serializer import dumps, dumps_rows, orjson
+from extended_pbipy.enums import ColumnDataTypes
+from extended_pbipy.table_items import Column
+from extended_pbipy.utils import remove_empty_values
+
+DATA_TYPES = [
+    ColumnDataTypes.String,
+    ColumnDataTypes.Int64,
+    ColumnDataTypes.Double,
+    ColumnDataTypes.Datetime,
+    ColumnDataTypes.Boolean,
+]
+
+
+def make_dataset(tables: int, columns: int) -> DatasetCreate:
+    '''Создает датасет с таблицами из columns столбцов.'''
+    dataset = DatasetCreate(name='benchmark')
+    for table_num in range(tables):
+        table = Table(name=f'Лист {table_num}')
+        for column_num in range(columns):
+            table.add_column(Column(
+                name=f'Столбец {column_num}',
+                data_type=DATA_TYPES[column_num % len(DATA_TYPES)]
+            ))
+        dataset.add_table(table)
+    dataset.clear_empty_data()
+    return dataset
+
+
+def make_rows(rows: int, columns: int) -> list:
+    '''Создает строки таблицы со значениями разных типов.'''
+    now = datetime(2024, 2, 1).isoformat()
+    values = ['Значение ячейки', 12345, 1234.56, now, True]
+    return [
+        {
+            f'Столбец {column_num}': values[column_num % len(values)]
+            for column_num in range(columns)
+        }
+        for _ in range(rows)
+    ]
+
+
+def old_to_dict(dataset: DatasetCreate) -> dict:
+    '''Прежняя реализация DatasetCreate.to_dict.'''
+    obj = remove_empty_values(dataset.push_dataset)
+    return json.loads(
+        s=json.dumps(obj=obj, cls=PowerBiEncoder, ensure_ascii=False)
+    )
+
+
+def old_group_dataset(dataset: DatasetCreate) -> bytes:
+    '''Тело post_group_dataset: to_dict и json= в requests.'''
+    payload = remove_empty_values(old_to_dict(dataset))
+    return json.dumps(payload, allow_nan=False).encode('utf-8')
+
+
+def old_dataset(dataset: DatasetCreate) -> bytes:
+    '''Тело post_dataset: json.dumps с отступами и json= в requests.'''
+    payload = json.dumps(
+        obj=remove_empty_values(dataset.push_dataset),
+        indent=4,
+        cls=PowerBiEncoder
+    )
+    return json.dumps(payload, allow_nan=False).encode('utf-8')
+
+
+def old_rows(rows: list) -> bytes:
+    '''Тело post_group_dataset_rows: json= в requests.'''
+    return json.dumps({'rows': rows}, allow_nan=False).encode('utf-8')
+
+
+def measure(name: str, func, arg, number: int) -> None:
+    '''Печатает среднее время вызова и размер тела запроса.'''
+    seconds = min(timeit.repeat(lambda: func(arg), number=number, repeat=3))
+    print(
+        f'{name:<28} {seconds / number * 1000:>10.3f} ms '
+        f'{len(func(arg)):>12} bytes'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tables', type=int, default=5)
+    parser.add_argument('--columns', type=int, default=43)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.tables, args.columns)
+    rows = make_rows(args.rows, args.columns)
+    assert json.loads(dumps(dataset)) == old_to_dict(dataset)
+    assert json.loads(dumps_rows(rows)) == {'rows': rows}
+
+    print(f'serializer backend: {"orjson" if orjson else "json"}')
+    schema_number = args.number * 100
+    measure('post_dataset old', old_dataset, dataset, schema_number)
+    measure('post_group_dataset old', old_group_dataset, dataset,
+            schema_number)
+    measure('dataset new', dumps, dataset, schema_number)
+    measure('rows old', old_rows, rows, args.number)
+    measure('rows new', dumps_rows, rows, args.number)
+
+
+if __name__ == '__main__':
+    main()
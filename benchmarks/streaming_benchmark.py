@@ -0,0 +1,136 @@
+'''
+Сравнение переноса листа с чтением окнами и потоковой загрузки.
+
+Для каждого размера листа запускается локальный стенд, затем перенос
+выполняется в отдельном процессе, чтобы пик памяти процесса (maxrss)
+относился только к сервису, а не к стенду.
+
+Запуск из корня репозитория с заполненным .env:
+    python -m benchmarks.streaming_benchmark --rows 30000 90000
+'''
+import argparse
+import logging
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+SHEET_ID = 'benchmark-sheet'
+CREDS_PATH = '.cache/fake_server/benchmark_creds.json'
+ENV_LINE = re.compile(r"^(\w+)='(.*)'$")
+
+
+def get_free_port() -> int:
+    '''Возвращает свободный порт на localhost.'''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(rows: int) -> Tuple[subprocess.Popen, Dict[str, str]]:
+    '''
+    Запускает стенд с листом из rows строк.
+
+    Возвращает процесс стенда и переменные окружения для работы с ним.
+    '''
+    server = subprocess.Popen(
+        [
+            sys.executable, '-u', '-m', 'src.fake_server',
+            '--port', str(get_free_port()),
+            '--sheet-id', SHEET_ID,
+            '--sheet-rows', str(rows),
+            '--creds', CREDS_PATH,
+            '--count-rows-only',
+        ],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    env = {}
+    for line in server.stdout:
+        if line.startswith('# google_sheet_id'):
+            break
+        match = ENV_LINE.match(line.strip())
+        if match:
+            env[match.group(1)] = match.group(2)
+    port = int(env['GAPI_ENDPOINT'].rsplit(':', 1)[1])
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server, env
+
+
+def run_transfer(stream: bool, window_rows: int) -> None:
+    '''Переносит лист и выводит время и пик памяти процесса.'''
+    logging.disable(logging.WARNING)
+    from src.services.api_exchange_v2 import ApiExchangeFlowAllMarket
+
+    started = time.perf_counter()
+    ApiExchangeFlowAllMarket(
+        SHEET_ID,
+        'benchmark',
+        window_rows=window_rows,
+        force=True,
+        stream=stream
+    ).run()
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux измеряется в КиБ
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    print(f'{elapsed:.2f} {peak:.1f}')
+
+
+def measure(
+        env: Dict[str, str],
+        stream: bool,
+        window_rows: int
+) -> List[str]:
+    '''Запускает перенос в отдельном процессе и возвращает его вывод.'''
+    args = [
+        sys.executable, '-m', 'benchmarks.streaming_benchmark',
+        '--child', '--window-rows', str(window_rows),
+    ]
+    if stream:
+        args.append('--stream')
+    result = subprocess.run(
+        args,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout.split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[30000])
+    parser.add_argument('--window-rows', type=int, default=5000)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        run_transfer(args.stream, args.window_rows)
+        return
+
+    print(f'{"rows":>8} {"mode":>8} {"time, s":>10} {"peak, MiB":>10}')
+    for rows in args.rows:
+        server, env = start_server(rows)
+        try:
+            for stream in (False, True):
+                elapsed, peak = measure(env, stream, args.window_rows)
+                mode = 'stream' if stream else 'windowed'
+                print(f'{rows:>8} {mode:>8} {elapsed:>10} {peak:>10}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,35 +7,66 @@ from .table_items import Column, Measure
 from .utils import remove_empty_values
 
 
+def get_serializable(obj):
+    '''
+    Возвращает словарь или список, в котором объект хранит свои данные.
+
+    Для объектов, которые не относятся к сущностям PowerBI, выбрасывает
+    TypeError, как того ждут json.JSONEncoder и orjson.
+    '''
+    if isinstance(obj, Columns):
+        return obj.columns
+    elif isinstance(obj, Measures):
+        return obj.measures
+    if isinstance(obj, Column):
+        return obj.column
+    elif isinstance(obj, Measure):
+        return obj.measure
+    elif isinstance(obj, DatasetCreate):
+        return obj.push_dataset
+    elif isinstance(obj, Tables):
+        return obj.tables
+    elif isinstance(obj, Table):
+        return obj.table
+    # elif isinstance(obj, Relationships):
+    #    return obj.relationships
+    # elif isinstance(obj, Relationship):
+    #    return obj.relationship
+    elif isinstance(obj, DataSources):
+        return obj.datasources
+    elif isinstance(obj, DataSource):
+        return obj.data_source
+    raise TypeError(
+        f'Object of type {type(obj).__name__} is not JSON serializable'
+    )
+
+
+def to_plain(value):
+    '''
+    Преобразует сущности PowerBI в словари и списки за один проход.
+
+    Дает тот же результат, что json.loads(json.dumps(value,
+    cls=PowerBiEncoder)), без промежуточной строки.
+    '''
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return to_plain(get_serializable(value))
+
+
 class PowerBiEncoder(json.JSONEncoder):
 
     def __init__(self, *args, **kwargs):
         json.JSONEncoder.__init__(self, *args, **kwargs)
 
     def default(self, obj):
-        if isinstance(obj, Columns):
-            return obj.columns
-        elif isinstance(obj, Measures):
-            return obj.measures
-        if isinstance(obj, Column):
-            return obj.column
-        elif isinstance(obj, Measure):
-            return obj.measure
-        elif isinstance(obj, DatasetCreate):
-            return obj.push_dataset
-        elif isinstance(obj, Tables):
-            return obj.tables
-        elif isinstance(obj, Table):
-            return obj.table
-        # elif isinstance(obj, Relationships):
-        #    return obj.relationships
-        # elif isinstance(obj, Relationship):
-        #    return obj.relationship
-        elif isinstance(obj, DataSources):
-            return obj.datasources
-        elif isinstance(obj, DataSource):
-            return obj.data_source
-        return json.JSONEncoder.default(self, obj)
+        try:
+            return get_serializable(obj)
+        except TypeError:
+            return json.JSONEncoder.default(self, obj)
 
 
 class DatasourceConnectionDetails:
@@ -401,8 +432,7 @@ class Table():
         self.table = remove_empty_values(self.table)
 
     def to_dict(self) -> dict:
-        obj = remove_empty_values(self.table)
-        return json.loads(s=json.dumps(obj=obj, cls=PowerBiEncoder, ensure_ascii=False))
+        return to_plain(remove_empty_values(self.table))
 
     def to_json(self) -> str:
         obj = remove_empty_values(self.table)
@@ -688,8 +718,7 @@ class DatasetCreate:
         self.push_dataset = remove_empty_values(self.push_dataset)
 
     def to_dict(self) -> dict:
-        obj = remove_empty_values(self.push_dataset)
-        return json.loads(s=json.dumps(obj=obj, cls=PowerBiEncoder, ensure_ascii=False))
+        return to_plain(remove_empty_values(self.push_dataset))
 
     def to_json(self) -> str:
         obj = remove_empty_values(self.push_dataset)
@@ -23,30 +23,6 @@ class ColumnDataTypes(Enum):
     Currency = 'Currency'
     Variant = 'Variant'
 
-    @staticmethod
-    def convert_from_python(data_type):
-        '''Соответствие типов Python и PowerBI.'''
-        data_types = {
-            float: ColumnDataTypes.Decimal,
-            int: ColumnDataTypes.Int64,
-            str: ColumnDataTypes.String,
-            bool: ColumnDataTypes.Boolean
-        }
-        types = data_types.keys()
-
-        def _define_type(data, count: int = 0):
-            try:
-                if count == len(types):
-                    return str
-                types[count](data)
-                return types[count]
-            except Exception:
-                return _define_type(data, count+1)
-
-        defined = _define_type(data_type)
-
-        return data_types.get(defined)
-
 
 class ColumnAggregationMethods(Enum):
     """Represents all the aggregation methods you can
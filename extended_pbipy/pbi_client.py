@@ -1,16 +1,162 @@
-import json
-from typing import Dict, List, Union
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, Callable, Dict, Iterable, List, Sequence, Tuple, Union
+)
 
 from pbipy.datasets import Dataset
 from pbipy.groups import Group
 from pbipy.powerbi import PowerBI
+from pbipy.reports import Report
+from requests import HTTPError, Response, Session
 
-from .entities import DatasetCreate, PowerBiEncoder, Table
-from .utils import remove_empty_values
+from .entities import DatasetCreate, Table
+from .retry import (
+    RETRY_STATUSES, THROTTLE_STATUSES, AimdLimiter, RetryPolicy,
+    parse_retry_after
+)
+from .serializer import JSON_HEADERS, dumps
+from .utils import get_chunk_bounds, remove_empty_values
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Push API на число строк в одном запросе
+MAX_ROWS_PER_REQUEST = 10000
 
 
 class ExtendedPowerBI(PowerBI):
-    '''Клиент для PowerBI API с эндпойнтами для Push Dataset.'''
+    '''
+    Клиент для PowerBI API с эндпойнтами для Push Dataset.
+
+    Запросы, на которые API ответил 429 или 5xx, повторяются по
+    retry_policy. Если задан upload_limiter, число параллельных
+    запросов при загрузке строк частями подстраивается под ответы
+    API о превышении лимита. base_url заменяет адрес API, например
+    на адрес локального стенда.
+    '''
+
+    def __init__(
+            self,
+            bearer_token: str = None,
+            session: Session = None,
+            retry_policy: RetryPolicy = None,
+            upload_limiter: AimdLimiter = None,
+            base_url: str = None
+    ) -> None:
+        super().__init__(bearer_token=bearer_token, session=session)
+        if session is not None:
+            self.session = session
+        if bearer_token is None:
+            # Токен подставляет авторизация сессии, запросы не должны
+            # уходить с заголовком 'Bearer None'
+            self.session.headers.pop('Authorization', None)
+        if base_url:
+            self.BASE_URL = base_url.rstrip('/')
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.upload_limiter = upload_limiter
+
+    def _with_retries(
+            self,
+            send: Callable[..., Response],
+            *args,
+            **kwargs
+    ) -> Response:
+        '''Выполняет запрос, повторяя его на 429 и 5xx.'''
+        max_retries = self.retry_policy.max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                return send(*args, **kwargs)
+            except HTTPError as err:
+                response = err.response
+                if (
+                    response is None
+                    or response.status_code not in RETRY_STATUSES
+                    or attempt == max_retries
+                ):
+                    raise
+                status = response.status_code
+                if (
+                    status in THROTTLE_STATUSES
+                    and self.upload_limiter is not None
+                ):
+                    self.upload_limiter.record_throttle()
+                delay = self.retry_policy.get_delay(
+                    attempt,
+                    parse_retry_after(response.headers.get('Retry-After'))
+                )
+                logger.warning(
+                    f'PowerBI API responded {status}, '
+                    f'retry {attempt + 1} in {delay:.1f}s'
+                )
+                time.sleep(delay)
+
+    def _send_json(
+            self,
+            method: str,
+            resource: str,
+            session: Session,
+            payload: Any = None,
+            params: dict = None
+    ) -> Response:
+        '''
+        Отправляет запрос с телом, сериализованным через dumps.
+
+        В отличие от json= в requests, сущности PowerBI и строки
+        пишутся в компактные байты за один проход.
+        '''
+        response = session.request(
+            method,
+            resource,
+            params=params,
+            data=dumps(payload) if payload is not None else None,
+            headers=JSON_HEADERS if payload is not None else None
+        )
+        self._raise_errors(response)
+        return response
+
+    def get(
+            self,
+            resource: str,
+            session: Session,
+            params: dict = None,
+            **kwargs
+    ) -> Response:
+        return self._with_retries(
+            super().get, resource, session, params, **kwargs
+        )
+
+    def post(
+            self,
+            resource: str,
+            session: Session,
+            payload: dict = None,
+            params: dict = None,
+            **kwargs
+    ) -> Response:
+        return self._with_retries(
+            self._send_json, 'post', resource, session, payload, params
+        )
+
+    def put(
+            self,
+            resource: str,
+            session: Session,
+            payload: dict
+    ) -> Response:
+        return self._with_retries(
+            self._send_json, 'put', resource, session, payload
+        )
+
+    def delete(
+            self,
+            resource: str,
+            session: Session,
+            params: dict = None
+    ) -> Response:
+        return self._with_retries(super().delete, resource, session, params)
 
     def post_dataset(
             self,
@@ -33,20 +179,15 @@ class ExtendedPowerBI(PowerBI):
             A datset resource with the id.
         """
 
-        if isinstance(dataset, DatasetCreate):
-
-            payload = json.dumps(
-                obj=dataset._prep_for_post(),
-                indent=4,
-                cls=PowerBiEncoder
-            )
+        if not isinstance(dataset, DatasetCreate):
+            dataset = remove_empty_values(dataset)
 
         resource_path = (
             f'{self.BASE_URL}/datasets?'
             f'defaultRetentionPolicy={default_retention_policy}'
         )
 
-        raw = self.post_raw(resource_path, self.session, payload)
+        raw = self.post_raw(resource_path, self.session, dataset)
 
         return Dataset(id=raw.get('id'), session=self.session, raw=raw)
 
@@ -75,10 +216,8 @@ class ExtendedPowerBI(PowerBI):
             A datset resource with the id.
         """
 
-        if isinstance(dataset, DatasetCreate):
-            dataset = dataset.to_dict()
-
-        dataset = remove_empty_values(dataset)
+        if not isinstance(dataset, DatasetCreate):
+            dataset = remove_empty_values(dataset)
 
         if isinstance(group, Group):
             group_id = group.id
@@ -141,7 +280,7 @@ class ExtendedPowerBI(PowerBI):
         resource_path = (
             f'{self.BASE_URL}/datasets/{dataset_id}/tables/{table_name}/rows'
         )
-        raw = self.post(resource_path, self.session, rows)
+        raw = self.post(resource_path, self.session, {'rows': rows})
 
         return raw
 
@@ -197,10 +336,234 @@ class ExtendedPowerBI(PowerBI):
             f'{self.BASE_URL}/groups/{group_id}/datasets/{dataset_id}'
             f'/tables/{table_name}/rows'
         )
-        raw = self.post(resource_path, self.session, rows)
+        raw = self.post(resource_path, self.session, {'rows': rows})
 
         return raw
 
+    def post_group_dataset_rows_chunked(
+            self,
+            group_id: str,
+            dataset_id: str,
+            table_name: str,
+            rows: Sequence[Dict],
+            chunk_size: int = MAX_ROWS_PER_REQUEST,
+            max_workers: int = 1
+    ) -> List[Dict[str, Any]]:
+        """Adds data rows to the specified table in batches of
+        `chunk_size` rows, uploading up to `max_workers` batches
+        concurrently.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        dataset_id : str
+            The dataset id
+
+        table_name: str
+            The dataset table name you want to post rows
+            to.
+
+        rows : sequence
+            An array of data rows pushed to a dataset table.
+            Any sequence supporting `len` and slicing, rows of
+            a batch are taken only when the batch is sent.
+
+        chunk_size : int (optional, Default=10000)
+            Rows per request, capped at the push API limit
+            of 10000 rows.
+
+        max_workers : int (optional, Default=1)
+            Number of concurrent requests. With `1` batches
+            are uploaded one by one in the order of `rows`,
+            otherwise the row order in the table is not
+            guaranteed. With `upload_limiter` set this is the
+            upper bound, the actual concurrency follows the
+            limiter.
+
+        ### Returns
+        ----
+        List[Dict]
+            One item per batch with its `chunk` number,
+            `rows` count and upload time in `elapsed` seconds.
+        """
+        chunk_size = max(1, min(chunk_size, MAX_ROWS_PER_REQUEST))
+        chunks = get_chunk_bounds(len(rows), chunk_size)
+        limiter = self.upload_limiter if max_workers > 1 else None
+
+        def post_chunk(chunk_num: int) -> Dict[str, Any]:
+            # Строки части собираются только перед ее отправкой
+            start, stop = chunks[chunk_num]
+            return self._post_rows_chunk(
+                group_id=group_id,
+                dataset_id=dataset_id,
+                table_name=table_name,
+                rows=rows[start:stop],
+                chunk_num=chunk_num,
+                limiter=limiter
+            )
+
+        if max_workers <= 1 or len(chunks) <= 1:
+            return [post_chunk(chunk_num) for chunk_num in range(len(chunks))]
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='pbi-rows'
+        ) as executor:
+            return list(executor.map(post_chunk, range(len(chunks))))
+
+    def post_group_dataset_rows_stream(
+            self,
+            group_id: str,
+            dataset_id: str,
+            chunks: Iterable[Tuple[str, Sequence[Dict]]],
+            max_workers: int = 1,
+            queue_size: int = None
+    ) -> List[Dict[str, Any]]:
+        """Adds data rows produced by `chunks` to the tables of
+        the specified dataset while the chunks are still being
+        produced.
+
+        Chunks are taken from `chunks` in the calling thread and
+        put into a bounded queue, `max_workers` threads upload
+        them. A worker takes a chunk only when it may send a
+        request, and taking the next chunk from `chunks` waits
+        while the queue is full, so no more than
+        `queue_size + max_workers` chunks are held at once.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        dataset_id : str
+            The dataset id
+
+        chunks : iterable
+            `(table_name, rows)` pairs, usually a generator.
+            Each chunk is sent in one request, so it should
+            not exceed the push API limit of 10000 rows.
+
+        max_workers : int (optional, Default=1)
+            Number of concurrent requests. With `upload_limiter`
+            set and `max_workers > 1` the actual concurrency
+            follows the limiter.
+
+        queue_size : int (optional, Default=None)
+            Chunks waiting for upload, `max_workers` by default.
+
+        ### Returns
+        ----
+        List[Dict]
+            One item per chunk with its `chunk` number, `table`,
+            `rows` count and upload time in `elapsed` seconds.
+        """
+        max_workers = max(1, max_workers)
+        limiter = self.upload_limiter if max_workers > 1 else None
+        pending = queue.Queue(maxsize=queue_size or max_workers)
+        results = []
+        errors = []
+        failed = threading.Event()
+
+        def upload() -> None:
+            while True:
+                # Часть вынимается из очереди, только когда лимитер
+                # разрешает запрос, поэтому ожидающие части остаются
+                # в очереди и задерживают чтение новых строк
+                if limiter is not None:
+                    limiter.acquire()
+                try:
+                    item = pending.get()
+                    if item is None:
+                        return
+                    # После ошибки оставшиеся части только вынимаются
+                    # из очереди, чтобы не блокировать производителя
+                    if failed.is_set():
+                        continue
+                    chunk_num, table_name, rows = item
+                    result = self._post_rows_chunk(
+                        group_id=group_id,
+                        dataset_id=dataset_id,
+                        table_name=table_name,
+                        rows=rows,
+                        chunk_num=chunk_num
+                    )
+                    if limiter is not None:
+                        limiter.record_success()
+                    result['table'] = table_name
+                    results.append(result)
+                except Exception as err:
+                    errors.append(err)
+                    failed.set()
+                finally:
+                    # Отправленные строки не держатся, пока поток ждет
+                    item = rows = None
+                    if limiter is not None:
+                        limiter.release()
+
+        workers = [
+            threading.Thread(
+                target=upload, name=f'pbi-rows-{worker_num}', daemon=True
+            )
+            for worker_num in range(max_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for chunk_num, (table_name, rows) in enumerate(chunks):
+                if failed.is_set():
+                    break
+                pending.put((chunk_num, table_name, rows))
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            for _ in workers:
+                pending.put(None)
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+        return sorted(results, key=lambda result: result['chunk'])
+
+    def _post_rows_chunk(
+            self,
+            group_id: str,
+            dataset_id: str,
+            table_name: str,
+            rows: Sequence[Dict],
+            chunk_num: int,
+            limiter: AimdLimiter = None
+    ) -> Dict[str, Any]:
+        '''Отправляет одну часть строк и возвращает ее статистику.'''
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            started = time.perf_counter()
+            self.post_group_dataset_rows(
+                group_id=group_id,
+                dataset_id=dataset_id,
+                table_name=table_name,
+                rows=rows
+            )
+            elapsed = time.perf_counter() - started
+            if limiter is not None:
+                limiter.record_success()
+        finally:
+            if limiter is not None:
+                limiter.release()
+        logger.debug(
+            f'Posted chunk {chunk_num} of {len(rows)} rows '
+            f'to {table_name} in {elapsed:.3f}s'
+        )
+        return {
+            'chunk': chunk_num,
+            'rows': len(rows),
+            'elapsed': elapsed,
+        }
+
     def get_tables(self, dataset_id: str) -> Dict:
         """Returns a list of tables tables within the specified dataset from
         "My Workspace".
@@ -266,8 +629,88 @@ class ExtendedPowerBI(PowerBI):
         raw = self.get_raw(resource_path, self.session)
         return raw
 
+    def clone_group_report(
+            self,
+            group_id: str,
+            report_id: str,
+            name: str,
+            target_dataset: str = None,
+            target_group: str = None
+    ) -> Report:
+        """Clones the specified report from the specified workspace.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        report_id : str
+            The report id.
+
+        name : str
+            The new report name.
+
+        target_dataset : str (optional, Default=None)
+            The dataset id to bind the cloned report to.
+
+        target_group : str (optional, Default=None)
+            The workspace id to clone the report into.
+
+        ### Returns
+        ----
+        Report
+            The cloned report.
+        """
+        payload = remove_empty_values({
+            'name': name,
+            'targetModelId': target_dataset,
+            'targetWorkspaceId': target_group,
+        })
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/reports/{report_id}/Clone'
+        )
+        raw = self.post_raw(resource_path, self.session, payload)
+
+        return Report(
+            id=raw.get('id'),
+            session=self.session,
+            group_id=target_group or group_id,
+            raw=raw
+        )
+
+    def rebind_group_report(
+            self,
+            group_id: str,
+            report_id: str,
+            dataset_id: str
+    ) -> Report:
+        """Rebinds the specified report from the specified workspace
+        to the specified dataset.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        report_id : str
+            The report id.
+
+        dataset_id : str
+            The id of the dataset to bind the report to.
+
+        ### Returns
+        ----
+        Report
+            The rebound report.
+        """
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/reports/{report_id}/Rebind'
+        )
+        self.post(resource_path, self.session, {'datasetId': dataset_id})
+
+        return Report(id=report_id, session=self.session, group_id=group_id)
 
-'''    def put_dataset(
+    def put_dataset(
             self,
             dataset_id: str,
             table_name: str,
@@ -295,31 +738,20 @@ class ExtendedPowerBI(PowerBI):
 
         ### Usage
         ----
-            >>> push_datasets_service = power_bi_client.push_datasets()
-            >>> push_datasets_service.put_dataset(
+            >>> pbi.put_dataset(
                 dataset_id='8ea21119-fb8f-4592-b2b8-141b824a2b7e',
                 table_name='sales_table',
                 table=new_table_sales
             )
         """
-
-        if isinstance(table, Table):
-
-            del table['rows']
-
-            table = json.dumps(
-                obj=table,
-                indent=4,
-                cls=PowerBiEncoder
-            )
-
-        content = self.power_bi_session.make_request(
-            method='put',
-            endpoint=f'myorg/datasets/{dataset_id}/tables/{table_name}',
-            data=table
+        resource_path = (
+            f'{self.BASE_URL}/datasets/{dataset_id}/tables/{table_name}'
+        )
+        response = self.put(
+            resource_path, self.session, self._prep_table(table)
         )
 
-        return content
+        return response.json() if response.content else {}
 
     def put_group_dataset(
             self,
@@ -353,35 +785,25 @@ class ExtendedPowerBI(PowerBI):
 
         ### Usage
         ----
-            >>> push_datasets_service = power_bi_client.push_datasets()
-            >>> push_datasets_service.put_group_dataset(
+            >>> pbi.put_group_dataset(
                 group_id='f78705a2-bead-4a5c-ba57-166794b05c78',
                 dataset_id='8ea21119-fb8f-4592-b2b8-141b824a2b7e',
                 table_name='sales_table',
                 table=new_table_sales
             )
         """
-
-        if isinstance(table, Table):
-
-            del table['rows']
-
-            table = json.dumps(
-                obj=table,
-                indent=4,
-                cls=PowerBiEncoder
-            )
-
-        content = self.power_bi_session.make_request(
-            method='put',
-            endpoint=f'myorg/groups/{group_id}/datasets/{dataset_id}/tables/{table_name}',
-            data=table
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/datasets/{dataset_id}'
+            f'/tables/{table_name}'
+        )
+        response = self.put(
+            resource_path, self.session, self._prep_table(table)
         )
 
-        return content
+        return response.json() if response.content else {}
 
     def delete_dataset_rows(self, dataset_id: str, table_name: str) -> None:
-        """Delets All rows from the specified table within the specified
+        """Deletes all rows from the specified table within the specified
         dataset from "My Workspace".
 
         ### Parameters
@@ -390,24 +812,20 @@ class ExtendedPowerBI(PowerBI):
             The dataset id
 
         table_name: str
-            The dataset table name you want to post rows
-            to.
+            The dataset table name you want to delete rows
+            from.
 
         ### Usage
         ----
-            >>> push_datasets_service = power_bi_client.push_datasets()
-            >>> push_datasets_service.post_dataset_rows(
+            >>> pbi.delete_dataset_rows(
                 dataset_id='8ea21119-fb8f-4592-b2b8-141b824a2b7e',
                 table_name='sales_table'
             )
         """
-
-        content = self.power_bi_session.make_request(
-            method='delete',
-            endpoint=f'myorg/datasets/{dataset_id}/tables/{table_name}/rows'
+        resource_path = (
+            f'{self.BASE_URL}/datasets/{dataset_id}/tables/{table_name}/rows'
         )
-
-        return content
+        self.delete(resource_path, self.session)
 
     def delete_group_dataset_rows(
             self,
@@ -427,23 +845,27 @@ class ExtendedPowerBI(PowerBI):
             The dataset id
 
         table_name: str
-            The dataset table name you want to post rows
-            to..
+            The dataset table name you want to delete rows
+            from.
 
         ### Usage
         ----
-            >>> push_datasets_service = power_bi_client.push_datasets()
-            >>> push_datasets_service.post_group_dataset_rows(
+            >>> pbi.delete_group_dataset_rows(
                 group_id='f78705a2-bead-4a5c-ba57-166794b05c78',
                 dataset_id='8ea21119-fb8f-4592-b2b8-141b824a2b7e',
                 table_name='sales_table'
             )
         """
-
-        content = self.power_bi_session.make_request(
-            method='delete',
-            endpoint=f'myorg/groups/{group_id}/datasets/{dataset_id}/tables/{table_name}/rows'
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/datasets/{dataset_id}'
+            f'/tables/{table_name}/rows'
         )
+        self.delete(resource_path, self.session)
 
-        return content
-'''
+    def _prep_table(self, table: Union[Table, dict]) -> dict:
+        '''Готовит схему таблицы для PUT запроса, строки не передаются.'''
+        if isinstance(table, Table):
+            table = table.to_dict()
+        table = dict(table)
+        table.pop('rows', None)
+        return table
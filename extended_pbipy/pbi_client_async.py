@@ -0,0 +1,451 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import httpx
+from pbipy.datasets import Dataset
+from pbipy.groups import Group
+from pbipy.powerbi import PowerBI
+from pbipy.reports import Report
+from requests import Session
+
+from .entities import DatasetCreate
+from .pbi_client import MAX_ROWS_PER_REQUEST
+from .retry import (
+    RETRY_STATUSES, THROTTLE_STATUSES, AimdLimiter, RetryPolicy,
+    parse_retry_after
+)
+from .serializer import JSON_HEADERS, dumps, dumps_rows
+from .utils import get_chunk_bounds, remove_empty_values
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncExtendedPowerBI:
+    '''
+    Асинхронный клиент для PowerBI API с эндпойнтами для Push Dataset.
+
+    Все запросы идут через общий пул keep-alive соединений
+    httpx.AsyncClient, поэтому один воркер может параллельно
+    отправлять много запросов. Перед каждым запросом токен берется
+    у token_provider без обращения к сети, а если его нет или срок
+    истек, token_refresher получает новый в отдельном потоке, не
+    блокируя event loop. Токен можно задать и один раз через
+    bearer_token.
+    Возвращаемые Dataset и Report получают синхронную сессию session,
+    чтобы с ними можно было работать методами pbipy.
+    Повторы, подстройка числа параллельных загрузок и base_url
+    работают так же, как в ExtendedPowerBI.
+    '''
+
+    BASE_URL = PowerBI.BASE_URL
+
+    def __init__(
+            self,
+            bearer_token: str = None,
+            token_provider: Callable[[], Optional[str]] = None,
+            token_refresher: Callable[[], str] = None,
+            session: Session = None,
+            max_connections: int = 20,
+            max_keepalive_connections: int = 20,
+            timeout: float = 60.0,
+            retry_policy: RetryPolicy = None,
+            upload_limiter: AimdLimiter = None,
+            base_url: str = None
+    ):
+        if base_url:
+            self.BASE_URL = base_url.rstrip('/')
+        self.bearer_token = bearer_token
+        self.token_provider = token_provider
+        self.token_refresher = token_refresher
+        self.session = session
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.upload_limiter = upload_limiter
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        '''Возвращает общий httpx.AsyncClient, создавая его при первом вызове.'''
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout
+            )
+        return self._client
+
+    async def _get_headers(self) -> Dict[str, str]:
+        '''Возвращает заголовок авторизации с актуальным токеном.'''
+        token = self.bearer_token
+        if self.token_provider is not None:
+            token = self.token_provider()
+        if token is None and self.token_refresher is not None:
+            # Обновление токена может идти по сети, выносим из event loop
+            token = await asyncio.to_thread(self.token_refresher)
+        return {'Authorization': f'Bearer {token}'}
+
+    async def _request(
+            self,
+            method: str,
+            resource: str,
+            payload: Any = None,
+            content: bytes = None
+    ) -> Optional[Dict]:
+        '''
+        Выполняет запрос к API и возвращает json ответа, если он есть.
+
+        Как и pbipy, добавляет к ошибке тело ответа API. На 429 и 5xx
+        повторяет запрос по retry_policy. Тело сериализуется через
+        dumps один раз и переиспользуется в повторах, уже
+        сериализованное тело передается в content.
+        '''
+        if content is None and payload is not None:
+            content = dumps(payload)
+        max_retries = self.retry_policy.max_retries
+        for attempt in range(max_retries + 1):
+            headers = await self._get_headers()
+            if content is not None:
+                headers.update(JSON_HEADERS)
+            response = await self._get_client().request(
+                method,
+                resource,
+                content=content,
+                headers=headers
+            )
+            if (
+                response.status_code not in RETRY_STATUSES
+                or attempt == max_retries
+            ):
+                break
+            if (
+                response.status_code in THROTTLE_STATUSES
+                and self.upload_limiter is not None
+            ):
+                self.upload_limiter.record_throttle()
+            delay = self.retry_policy.get_delay(
+                attempt,
+                parse_retry_after(response.headers.get('retry-after'))
+            )
+            logger.warning(
+                f'PowerBI API responded {response.status_code}, '
+                f'retry {attempt + 1} in {delay:.1f}s'
+            )
+            await asyncio.sleep(delay)
+
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as err:
+            raise httpx.HTTPStatusError(
+                f'{err}. Additional information from API: {response.text}',
+                request=err.request,
+                response=err.response
+            ) from err
+
+        if not response.content:
+            return None
+        return response.json()
+
+    async def post_group_dataset(
+            self,
+            group: Union[str, Group],
+            dataset: Union[dict, DatasetCreate],
+            default_retention_policy: str = 'basicFIFO'
+    ) -> Dataset:
+        """Creates a new dataset in the specified workspace.
+
+        ### Parameters
+        ----
+        group : Union[str, Group]
+            The workspace ID.
+
+        dataset : Union[dict, Dataset]
+            The dataset you want to post.
+
+        default_retention_policy : str (optional, Default=None)
+            The default retention policy.
+
+        ### Returns
+        ----
+        Dataset
+            A datset resource with the id.
+        """
+
+        if not isinstance(dataset, DatasetCreate):
+            dataset = remove_empty_values(dataset)
+
+        if isinstance(group, Group):
+            group_id = group.id
+        else:
+            group_id = group
+
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/datasets?'
+            f'defaultRetentionPolicy={default_retention_policy}'
+        )
+
+        raw = await self._request('post', resource_path, dataset)
+
+        return Dataset(
+            id=raw.get('id'), group_id=group_id, session=self.session, raw=raw
+        )
+
+    async def post_group_dataset_rows(
+            self,
+            group_id: str,
+            dataset_id: str,
+            table_name: str,
+            rows: List[Dict]
+    ) -> None:
+        """Adds new data rows to the specified table,
+        within the specified dataset, from the specified workspace.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        dataset_id : str
+            The dataset id
+
+        table_name: str
+            The dataset table name you want to post rows
+            to.
+
+        rows : list
+            An array of data rows pushed to a dataset table.
+        """
+        # Сборка тела нагружает CPU, выносим из event loop
+        content = await asyncio.to_thread(dumps_rows, rows)
+        await self._post_rows_content(
+            group_id, dataset_id, table_name, content
+        )
+
+    async def _post_rows_content(
+            self,
+            group_id: str,
+            dataset_id: str,
+            table_name: str,
+            content: bytes
+    ) -> None:
+        '''Отправляет строки таблицы, уже сериализованные в json.'''
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/datasets/{dataset_id}'
+            f'/tables/{table_name}/rows'
+        )
+        await self._request('post', resource_path, content=content)
+
+    async def post_group_dataset_rows_chunked(
+            self,
+            group_id: str,
+            dataset_id: str,
+            table_name: str,
+            rows: Sequence[Dict],
+            chunk_size: int = MAX_ROWS_PER_REQUEST,
+            max_workers: int = 1
+    ) -> List[Dict[str, Any]]:
+        """Adds data rows to the specified table in batches of
+        `chunk_size` rows, sending up to `max_workers` batches
+        concurrently.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        dataset_id : str
+            The dataset id
+
+        table_name: str
+            The dataset table name you want to post rows
+            to.
+
+        rows : sequence
+            An array of data rows pushed to a dataset table.
+            Any sequence supporting `len` and slicing, rows of
+            a batch are taken only when the batch is sent.
+
+        chunk_size : int (optional, Default=10000)
+            Rows per request, capped at the push API limit
+            of 10000 rows.
+
+        max_workers : int (optional, Default=1)
+            Number of concurrent requests. With `1` batches
+            are uploaded one by one in the order of `rows`,
+            otherwise the row order in the table is not
+            guaranteed. With `upload_limiter` set this is the
+            upper bound, the actual concurrency follows the
+            limiter.
+
+        ### Returns
+        ----
+        List[Dict]
+            One item per batch with its `chunk` number,
+            `rows` count and upload time in `elapsed` seconds.
+        """
+        chunk_size = max(1, min(chunk_size, MAX_ROWS_PER_REQUEST))
+        chunks = get_chunk_bounds(len(rows), chunk_size)
+        semaphore = asyncio.Semaphore(max(max_workers, 1))
+        limiter = self.upload_limiter if max_workers > 1 else None
+
+        def dump_chunk(start: int, stop: int) -> bytes:
+            return dumps_rows(rows[start:stop])
+
+        async def post_chunk(chunk_num: int) -> Dict[str, Any]:
+            start, stop = chunks[chunk_num]
+            async with semaphore:
+                # Строки части собираются и сериализуются только перед
+                # ее отправкой и в отдельном потоке, не блокируя event loop
+                content = await asyncio.to_thread(dump_chunk, start, stop)
+                if limiter is not None:
+                    await limiter.aacquire()
+                try:
+                    started = time.perf_counter()
+                    await self._post_rows_content(
+                        group_id, dataset_id, table_name, content
+                    )
+                    elapsed = time.perf_counter() - started
+                    if limiter is not None:
+                        limiter.record_success()
+                finally:
+                    if limiter is not None:
+                        await limiter.arelease()
+            logger.debug(
+                f'Posted chunk {chunk_num} of {stop - start} rows '
+                f'to {table_name} in {elapsed:.3f}s'
+            )
+            return {
+                'chunk': chunk_num,
+                'rows': stop - start,
+                'elapsed': elapsed,
+            }
+
+        if max_workers <= 1:
+            return [
+                await post_chunk(chunk_num) for chunk_num in range(len(chunks))
+            ]
+
+        return list(await asyncio.gather(
+            *(post_chunk(chunk_num) for chunk_num in range(len(chunks)))
+        ))
+
+    async def get_group_tables(self, group_id: str, dataset_id: str) -> Dict:
+        """Returns a list of tables tables within the specified dataset from
+        the specified workspace.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        dataset_id : str
+            The dataset ID you want to query.
+
+        ### Returns
+        ----
+        Dict
+            A collection of `Tables` resources.
+        """
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/datasets/{dataset_id}/tables'
+        )
+
+        raw = await self._request('get', resource_path)
+        return raw.get('value', raw)
+
+    async def dashboards_in_group(self, group: str) -> Dict:
+        '''Возвращает все дашборды.'''
+        resource_path = f'{self.BASE_URL}/groups/{group}/dashboards'
+        raw = await self._request('get', resource_path)
+        return raw.get('value', raw)
+
+    async def clone_group_report(
+            self,
+            group_id: str,
+            report_id: str,
+            name: str,
+            target_dataset: str = None,
+            target_group: str = None
+    ) -> Report:
+        """Clones the specified report from the specified workspace.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        report_id : str
+            The report id.
+
+        name : str
+            The new report name.
+
+        target_dataset : str (optional, Default=None)
+            The dataset id to bind the cloned report to.
+
+        target_group : str (optional, Default=None)
+            The workspace id to clone the report into.
+
+        ### Returns
+        ----
+        Report
+            The cloned report.
+        """
+        payload = remove_empty_values({
+            'name': name,
+            'targetModelId': target_dataset,
+            'targetWorkspaceId': target_group,
+        })
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/reports/{report_id}/Clone'
+        )
+        raw = await self._request('post', resource_path, payload)
+
+        return Report(
+            id=raw.get('id'),
+            session=self.session,
+            group_id=target_group or group_id,
+            raw=raw
+        )
+
+    async def rebind_group_report(
+            self,
+            group_id: str,
+            report_id: str,
+            dataset_id: str
+    ) -> Report:
+        """Rebinds the specified report from the specified workspace
+        to the specified dataset.
+
+        ### Parameters
+        ----
+        group_id : str
+            The workspace id.
+
+        report_id : str
+            The report id.
+
+        dataset_id : str
+            The id of the dataset to bind the report to.
+
+        ### Returns
+        ----
+        Report
+            The rebound report.
+        """
+        resource_path = (
+            f'{self.BASE_URL}/groups/{group_id}/reports/{report_id}/Rebind'
+        )
+        await self._request(
+            'post', resource_path, {'datasetId': dataset_id}
+        )
+
+        return Report(id=report_id, session=self.session, group_id=group_id)
+
+    async def aclose(self) -> None:
+        '''Закрывает пул соединений.'''
+        if self._client is not None:
+            await self._client.aclose()
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# Статусы ответа, после которых запрос можно повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Статусы, которыми API сообщает о превышении лимита запросов
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''
+    Возвращает паузу в секундах из заголовка Retry-After.
+
+    Заголовок содержит число секунд или HTTP дату.
+    '''
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    '''
+    Политика повторов запросов к PowerBI API.
+
+    Пауза перед повтором берется из Retry-After, если API его вернул,
+    иначе выбирается случайно от нуля до экспоненциально растущей
+    границы (full jitter), чтобы параллельные запросы не повторялись
+    одновременно.
+    '''
+
+    def __init__(
+            self,
+            max_retries: int = 5,
+            backoff_base: float = 1.0,
+            backoff_max: float = 60.0
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def get_delay(
+            self,
+            attempt: int,
+            retry_after: Optional[float] = None
+    ) -> float:
+        '''Возвращает паузу перед повтором номер attempt с нуля.'''
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        )
+
+
+class AimdLimiter:
+    '''
+    Ограничитель числа параллельных запросов по схеме AIMD.
+
+    После каждого успешного запроса лимит растет на increase / limit,
+    то есть примерно на increase за окно из limit запросов. При
+    ответе о превышении лимита API лимит умножается на decrease, но
+    не чаще раза за окно, чтобы пачка 429 от одновременно отправленных
+    запросов не обрушила его до минимума.
+    Подходит и для потоков (acquire/release), и для asyncio
+    (aacquire/arelease), но один объект используется только одним
+    из способов.
+    '''
+
+    def __init__(
+            self,
+            initial: int = 4,
+            minimum: int = 1,
+            maximum: int = 16,
+            increase: float = 1.0,
+            decrease: float = 0.5
+    ):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.increase = increase
+        self.decrease = decrease
+        self._limit = float(min(max(initial, minimum), self.maximum))
+        self._in_flight = 0
+        self._since_decrease = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._acondition: Optional[asyncio.Condition] = None
+        self.throttled = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        '''Текущее число одновременно разрешенных запросов.'''
+        return int(self._limit)
+
+    def record_success(self) -> None:
+        '''Учитывает успешный запрос и увеличивает лимит.'''
+        with self._condition:
+            self._since_decrease += 1
+            self._limit = min(
+                self._limit + self.increase / self._limit, self.maximum
+            )
+            self._condition.notify_all()
+
+    def record_throttle(self) -> None:
+        '''Учитывает ответ о превышении лимита и уменьшает лимит.'''
+        with self._lock:
+            self.throttled += 1
+            if self._since_decrease < self.limit and self.decreases:
+                return
+            self._limit = max(self._limit * self.decrease, self.minimum)
+            self._since_decrease = 0
+            self.decreases += 1
+
+    def acquire(self) -> None:
+        '''Ждет, пока число запросов в работе не станет меньше лимита.'''
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    def release(self) -> None:
+        '''Освобождает место после завершения запроса.'''
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    async def aacquire(self) -> None:
+        '''Асинхронный вариант acquire.'''
+        if self._acondition is None:
+            self._acondition = asyncio.Condition()
+        async with self._acondition:
+            await self._acondition.wait_for(
+                lambda: self._in_flight < self.limit
+            )
+            self._in_flight += 1
+
+    async def arelease(self) -> None:
+        '''Асинхронный вариант release.'''
+        async with self._acondition:
+            self._in_flight -= 1
+            self._acondition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает текущий лимит и счетчики ограничителя.'''
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'throttled': self.throttled,
+                'decreases': self.decreases,
+            }
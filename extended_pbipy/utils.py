@@ -27,3 +27,27 @@ def remove_empty_values(
             new_d[k] = v
 
     return new_d
+
+
+def get_chunk_bounds(total: int, chunk_size: int) -> list:
+    """
+    Split `total` rows into consecutive chunks of at most `chunk_size`
+    items.
+
+    Parameters
+    ----------
+    `total` : `int`
+        Number of rows.
+    `chunk_size` : `int`
+        Maximum number of rows in a chunk.
+
+    Returns
+    -------
+    `list`
+        `(start, stop)` bounds of the chunks in the original order.
+    """
+
+    return [
+        (start, min(start + chunk_size, total))
+        for start in range(0, total, chunk_size)
+    ]
@@ -2,8 +2,18 @@ import uvicorn
 
 from src.api.handlers import pbi_router
 from src.core.config import app, LOGGING_CONFIG, settings
+from src.services.google_api_async import async_google_client
+from src.services.pbi_api import async_pbi
+from src.services.pbi_token import token_manager
+from src.services.report_pool import report_pool
 
 app.include_router(pbi_router)
+app.add_event_handler('startup', token_manager.start)
+app.add_event_handler('startup', report_pool.prewarm)
+app.add_event_handler('shutdown', token_manager.stop)
+app.add_event_handler('shutdown', async_google_client.aclose)
+app.add_event_handler('shutdown', async_pbi.aclose)
+app.add_event_handler('shutdown', report_pool.shutdown)
 
 
 if __name__ == '__main__':
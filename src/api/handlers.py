@@ -2,8 +2,15 @@ import logging
 
 from fastapi import APIRouter
 
-from src.schemas.entities import ReportData, ReportRequestData, SheetReportID
+from src.schemas.entities import (
+    ReportData, ReportRequestData, ServiceMetrics, SheetReportID
+)
 from src.services.api_exchange_v2 import ApiExchangeFlowAllMarket
+from src.services.google_api import client_registry
+from src.services.pbi_api import async_pbi, pbi
+from src.services.rate_limiter import sheets_read_limiter
+from src.services.report_pool import report_pool
+from src.services.values_cache import values_cache
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +25,24 @@ async def run_app(data: SheetReportID) -> ReportData:
 
     exchange = ApiExchangeFlowAllMarket(
         sheet_id=sheet_id,
-        pbi_report_id=report_id
+        pbi_report_id=report_id,
+        window_rows=data.window_rows,
+        force=data.force,
+        typed=data.typed,
+        sheet_titles=data.sheet_titles,
+        concurrency=data.concurrency,
+        mode=data.mode,
+        delta_key=data.delta_key,
+        delta_threshold=data.delta_threshold,
+        stream=data.stream
     )
-    new_report = exchange.run()
+    new_report = await exchange.arun()
     # print(new_report)
-    report_data = ReportData(report_id=new_report.id, embed_url='url')
+    report_data = ReportData(
+        report_id=new_report.id,
+        embed_url='url',
+        modified=exchange.modified
+    )
 
     return report_data
 
@@ -31,3 +51,16 @@ async def run_app(data: SheetReportID) -> ReportData:
 async def get_report(report_data: ReportRequestData) -> ReportData:
     '''URL для запроса данных отчета.'''
     return ReportData
+
+
+@pbi_router.get(path='/metrics', response_model=ServiceMetrics)
+async def get_metrics() -> ServiceMetrics:
+    '''URL для запроса счетчиков клиентов, кеша и лимитеров.'''
+    return ServiceMetrics(
+        google_clients=client_registry.stats(),
+        values_cache=values_cache.stats(),
+        google_rate_limiter=sheets_read_limiter.stats(),
+        pbi_upload_limiter=pbi.upload_limiter.stats(),
+        pbi_async_upload_limiter=async_pbi.upload_limiter.stats(),
+        pbi_report_pool=report_pool.stats()
+    )
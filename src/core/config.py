@@ -1,10 +1,11 @@
+import os
 from logging import config
 
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from .logger import LOGGING_CONFIG
+from .logger import LOG_DIR, LOGGING_CONFIG
 
 
 class Settings(BaseSettings):
@@ -21,17 +22,53 @@ class Settings(BaseSettings):
     GAPI_CREDS: str
     GAPI_SCOPES: str
     GAPI_URL: str
+    GAPI_ENDPOINT: str = ''
+    GAPI_MAX_CONNECTIONS: int = 20
+    GAPI_TIMEOUT: float = 60.0
+    GAPI_WINDOW_ROWS: int = 5000
+    GAPI_READS_PER_MINUTE: int = 300
+    GAPI_USER_READS_PER_MINUTE: int = 60
+    GAPI_QUOTA_UTILIZATION: float = 0.95
+    GAPI_MAX_WAITERS: int = 100
+    GAPI_MAX_WAIT: float = 120.0
+    GAPI_MAX_RETRIES: int = 5
+    GAPI_BACKOFF_BASE: float = 1.0
+    GAPI_BACKOFF_MAX: float = 64.0
     PBI_AUTH_URL: str
     PBI_CLIENT_ID: str
     PBI_CLIENT_SECRET: str
     PBI_SCOPES: str
     PBI_GROUP: str
+    PBI_API_URL: str = 'https://api.powerbi.com/v1.0/myorg'
+    PBI_MAX_CONNECTIONS: int = 20
+    PBI_TIMEOUT: float = 60.0
+    PBI_ROWS_CHUNK_SIZE: int = 10000
+    PBI_UPLOAD_CONCURRENCY: int = 4
+    PBI_UPLOAD_MAX_CONCURRENCY: int = 16
+    PBI_UPLOAD_QUEUE_CHUNKS: int = 4
+    PBI_MAX_RETRIES: int = 5
+    PBI_BACKOFF_BASE: float = 1.0
+    PBI_BACKOFF_MAX: float = 60.0
+    PBI_TOKEN_CACHE: str = '.cache/pbi_token.json'
+    PBI_TOKEN_REFRESH_MARGIN: float = 300.0
+    PBI_REPORT_POOL_SIZE: int = 1
+    PBI_REPORT_POOL_WORKERS: int = 2
+    PBI_REPORT_POOL_GENERIC_NAME: str = ''
     SHEETS_URL: str
+    SHEET_SCHEMAS_PATH: str = 'sheet_schemas.json'
+    TYPE_INFERENCE_SAMPLE_ROWS: int = 1000
+    SYNC_STATE_DB: str = 'sync_state.sqlite3'
+    ROW_DELTA_KEY: str = '№'
+    ROW_DELTA_THRESHOLD: float = 0.0
+    ROW_DELTA_MAX_STALE_RUNS: int = 10
+    VALUES_CACHE_DIR: str = '.cache/values'
+    VALUES_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
 
 
 settings = Settings()
 
-# Конфиг логера
+# Конфиг логера, файловому обработчику нужна папка логов
+os.makedirs(LOG_DIR, exist_ok=True)
 config.dictConfig(LOGGING_CONFIG)
 
 # Конфиг fastapi
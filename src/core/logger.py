@@ -1,3 +1,6 @@
+import os
+
+LOG_DIR = 'logs'
 LOG_HANDLER = ['console',]
 LOG_FORMAT_VERBOSE = (
     '%(asctime)s - %(name)s - %(levelname)s: '
@@ -22,7 +25,7 @@ LOGGING_CONFIG = {
             'level': 'INFO',
             'class': 'logging.handlers.RotatingFileHandler',
             'formatter': 'verbose',
-            'filename': 'logs/pbi_log.log',
+            'filename': os.path.join(LOG_DIR, 'pbi_log.log'),
             'mode': 'a',
             'backupCount': 5,
             'maxBytes': 50000,
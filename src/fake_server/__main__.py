@@ -0,0 +1,86 @@
+'''
+Локальный стенд Google Sheets и PowerBI API.
+
+Запуск из корня репозитория:
+    python -m src.fake_server --port 8001 --latency 0.05 \
+        --max-concurrency 6 --sheet-rows 100000
+
+Стенд выводит переменные окружения, с которыми сервис работает
+со стендом вместо настоящих API.
+'''
+import argparse
+
+import uvicorn
+
+from .faults import FaultConfig
+from .server import FakeServer, make_all_market_tab
+
+
+def parse_args() -> argparse.Namespace:
+    '''Разбирает аргументы командной строки.'''
+    parser = argparse.ArgumentParser(
+        description='Fake Google Sheets and PowerBI API'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--max-concurrency', type=int, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-status', type=int, default=503)
+    parser.add_argument('--max-payload-bytes', type=int, default=0)
+    parser.add_argument('--max-rows-per-request', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--sheet-id', default='fake-sheet')
+    parser.add_argument('--sheet-rows', type=int, default=1000)
+    parser.add_argument('--tabs', type=int, default=1)
+    parser.add_argument(
+        '--creds', default='.cache/fake_server/creds.json',
+        help='path of the Google service account file to write'
+    )
+    parser.add_argument(
+        '--count-rows-only', action='store_true',
+        help='do not keep pushed rows in memory'
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    server = FakeServer(
+        host=args.host,
+        port=args.port,
+        faults=FaultConfig(
+            latency=args.latency,
+            latency_jitter=args.latency_jitter,
+            max_concurrency=args.max_concurrency,
+            throttle_rate=args.throttle_rate,
+            retry_after=args.retry_after,
+            failure_rate=args.failure_rate,
+            failure_status=args.failure_status,
+            max_payload_bytes=args.max_payload_bytes,
+            max_rows_per_request=args.max_rows_per_request,
+            seed=args.seed
+        ),
+        keep_rows=not args.count_rows_only
+    )
+    tabs = {
+        'Весь рынок' if tab == 0 else f'Весь рынок {tab}':
+            make_all_market_tab(args.sheet_rows, seed=tab)
+        for tab in range(args.tabs)
+    }
+    server.store.put_spreadsheet(args.sheet_id, 'Весь рынок', tabs)
+
+    for name, value in server.env(creds_path=args.creds).items():
+        print(f"{name}='{value}'")
+    print(f"# google_sheet_id='{args.sheet_id}'")
+
+    uvicorn.run(
+        server.app, host=args.host, port=args.port, log_level='warning'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, FastAPI, Query, Request
+from fastapi.responses import JSONResponse
+
+from .faults import FaultConfig, FaultInjector
+from .store import FakeStore
+
+# Пути стенда, к которым не применяются задержки и сбои
+CONTROL_PREFIX = '/_fake'
+PBI_PREFIX = '/v1.0/myorg'
+TOKEN_LIFETIME = 3599
+
+
+def google_error(status_code: int, message: str) -> JSONResponse:
+    '''Возвращает ошибку в формате Google API.'''
+    statuses = {400: 'INVALID_ARGUMENT', 404: 'NOT_FOUND'}
+    return JSONResponse(
+        status_code=status_code,
+        content={'error': {
+            'code': status_code,
+            'message': message,
+            'status': statuses.get(status_code, 'UNKNOWN'),
+        }}
+    )
+
+
+def pbi_error(status_code: int, code: str, message: str) -> JSONResponse:
+    '''Возвращает ошибку в формате PowerBI API.'''
+    return JSONResponse(
+        status_code=status_code,
+        content={'error': {'code': code, 'message': message}}
+    )
+
+
+def token_response(prefix: str) -> Dict[str, Any]:
+    '''Возвращает ответ эндпойнта токена OAuth 2.0.'''
+    return {
+        'token_type': 'Bearer',
+        'expires_in': TOKEN_LIFETIME,
+        'ext_expires_in': TOKEN_LIFETIME,
+        'access_token': f'{prefix}-{uuid.uuid4().hex}',
+    }
+
+
+def get_google_router(store: FakeStore) -> APIRouter:
+    '''Возвращает эндпойнты Google Sheets и Drive API.'''
+    router = APIRouter()
+
+    @router.get('/v4/spreadsheets/{sheet_id}/values:batchGet')
+    async def batch_get_values(
+            sheet_id: str,
+            ranges: List[str] = Query(default=[]),
+            valueRenderOption: str = 'FORMATTED_VALUE'
+    ):
+        formatted = valueRenderOption == 'FORMATTED_VALUE'
+        value_ranges = []
+        for cell_range in ranges:
+            values = store.get_values(sheet_id, cell_range, formatted)
+            if values is None:
+                return google_error(
+                    400, f'Unable to parse range: {cell_range}'
+                )
+            value_ranges.append(values)
+        return {'spreadsheetId': sheet_id, 'valueRanges': value_ranges}
+
+    @router.get('/v4/spreadsheets/{sheet_id}/values/{cell_range:path}')
+    async def get_values(
+            sheet_id: str,
+            cell_range: str,
+            valueRenderOption: str = 'FORMATTED_VALUE'
+    ):
+        formatted = valueRenderOption == 'FORMATTED_VALUE'
+        values = store.get_values(sheet_id, cell_range, formatted)
+        if values is None:
+            return google_error(400, f'Unable to parse range: {cell_range}')
+        return values
+
+    @router.get('/v4/spreadsheets/{sheet_id}')
+    async def get_spreadsheet(
+            sheet_id: str,
+            ranges: List[str] = Query(default=[])
+    ):
+        spreadsheet = store.get_spreadsheet(sheet_id, ranges)
+        if spreadsheet is None:
+            return google_error(404, 'Requested entity was not found.')
+        return spreadsheet
+
+    @router.get('/drive/v3/files/{file_id}')
+    async def get_file(file_id: str):
+        file = store.get_file(file_id)
+        if file is None:
+            return google_error(404, f'File not found: {file_id}.')
+        return file
+
+    @router.post('/google/token')
+    async def get_google_token():
+        return token_response('fake-google')
+
+    return router
+
+
+def get_pbi_router(store: FakeStore, faults: FaultInjector) -> APIRouter:
+    '''Возвращает эндпойнты PowerBI REST API для push датасетов.'''
+    router = APIRouter()
+
+    async def post_dataset(request: Request, group_id: str = None):
+        dataset = await request.json()
+        if not dataset.get('name') or not dataset.get('tables'):
+            return pbi_error(
+                400, 'InvalidRequest', 'Dataset name and tables required'
+            )
+        return JSONResponse(
+            status_code=201, content=store.create_dataset(group_id, dataset)
+        )
+
+    async def get_tables(dataset_id: str, group_id: str = None):
+        tables = store.get_tables(dataset_id)
+        if tables is None:
+            return pbi_error(404, 'ItemNotFound', f'Dataset {dataset_id}')
+        return {'value': tables}
+
+    async def put_table(
+            request: Request,
+            dataset_id: str,
+            table_name: str,
+            group_id: str = None
+    ):
+        schema = store.put_table(
+            dataset_id, table_name, await request.json()
+        )
+        if schema is None:
+            return pbi_error(404, 'ItemNotFound', f'Table {table_name}')
+        return schema
+
+    async def post_rows(
+            request: Request,
+            dataset_id: str,
+            table_name: str,
+            group_id: str = None
+    ):
+        rows = (await request.json()).get('rows')
+        if not isinstance(rows, list):
+            return pbi_error(400, 'InvalidRequest', 'Rows array required')
+        max_rows = faults.config.max_rows_per_request
+        if max_rows and len(rows) > max_rows:
+            return pbi_error(
+                400,
+                'InvalidRequest',
+                f'Request contains {len(rows)} rows, limit is {max_rows}'
+            )
+        if not store.add_rows(dataset_id, table_name, rows):
+            return pbi_error(404, 'ItemNotFound', f'Table {table_name}')
+        faults.counters['rows'] += len(rows)
+        return {}
+
+    async def delete_rows(
+            dataset_id: str,
+            table_name: str,
+            group_id: str = None
+    ):
+        if not store.delete_rows(dataset_id, table_name):
+            return pbi_error(404, 'ItemNotFound', f'Table {table_name}')
+        return {}
+
+    async def clone_report(request: Request, group_id: str, report_id: str):
+        payload = await request.json()
+        return store.clone_report(
+            group_id=payload.get('targetWorkspaceId') or group_id,
+            report_id=report_id,
+            name=payload.get('name'),
+            target_dataset=payload.get('targetModelId')
+        )
+
+    async def rebind_report(request: Request, group_id: str, report_id: str):
+        dataset_id = (await request.json()).get('datasetId')
+        if not store.rebind_report(report_id, dataset_id):
+            return pbi_error(404, 'ItemNotFound', f'Report {report_id}')
+        return {}
+
+    async def get_reports(group_id: str):
+        return {'value': store.get_reports(group_id)}
+
+    async def get_dashboards(group_id: str):
+        return {'value': []}
+
+    tables_path = '/datasets/{dataset_id}/tables'
+    rows_path = tables_path + '/{table_name}/rows'
+    for prefix in ('', '/groups/{group_id}'):
+        router.add_api_route(
+            prefix + '/datasets', post_dataset, methods=['POST']
+        )
+        router.add_api_route(prefix + tables_path, get_tables)
+        router.add_api_route(
+            prefix + tables_path + '/{table_name}', put_table, methods=['PUT']
+        )
+        router.add_api_route(prefix + rows_path, post_rows, methods=['POST'])
+        router.add_api_route(
+            prefix + rows_path, delete_rows, methods=['DELETE']
+        )
+    reports_path = '/groups/{group_id}/reports'
+    router.add_api_route(
+        reports_path + '/{report_id}/Clone', clone_report, methods=['POST']
+    )
+    router.add_api_route(
+        reports_path + '/{report_id}/Rebind', rebind_report, methods=['POST']
+    )
+    router.add_api_route(reports_path, get_reports)
+    router.add_api_route('/groups/{group_id}/dashboards', get_dashboards)
+
+    return router
+
+
+def get_auth_router(base_url: str) -> APIRouter:
+    '''Возвращает эндпойнты Azure AD для получения токена PowerBI.'''
+    router = APIRouter()
+
+    @router.get('/{tenant}/v2.0/.well-known/openid-configuration')
+    async def get_openid_configuration(tenant: str):
+        return {
+            'issuer': f'{base_url}/{tenant}/v2.0',
+            'authorization_endpoint': (
+                f'{base_url}/{tenant}/oauth2/v2.0/authorize'
+            ),
+            'token_endpoint': f'{base_url}/{tenant}/oauth2/v2.0/token',
+        }
+
+    @router.post('/{tenant}/oauth2/v2.0/token')
+    async def get_pbi_token(tenant: str):
+        return token_response('fake-pbi')
+
+    return router
+
+
+def get_control_router(store: FakeStore, faults: FaultInjector) -> APIRouter:
+    '''Возвращает эндпойнты управления стендом.'''
+    router = APIRouter(prefix=CONTROL_PREFIX)
+
+    @router.get('/stats')
+    async def get_stats():
+        return {'requests': faults.stats(), 'store': store.stats()}
+
+    @router.post('/reset')
+    async def reset():
+        store.reset()
+        faults.reset()
+        return {}
+
+    @router.get('/faults')
+    async def get_faults() -> FaultConfig:
+        return faults.config
+
+    @router.put('/faults')
+    async def put_faults(config: FaultConfig) -> FaultConfig:
+        faults.configure(config)
+        return faults.config
+
+    @router.put('/spreadsheets/{sheet_id}')
+    async def put_spreadsheet(sheet_id: str, request: Request):
+        body = await request.json()
+        return store.put_spreadsheet(
+            sheet_id, body.get('name', sheet_id), body.get('tabs', {})
+        )
+
+    @router.post('/spreadsheets/{sheet_id}/tabs/{title}/rows')
+    async def append_rows(sheet_id: str, title: str, request: Request):
+        body = await request.json()
+        return store.append_rows(sheet_id, title, body.get('rows', []))
+
+    @router.get('/datasets/{dataset_id}/tables/{table_name}/rows')
+    async def get_rows(dataset_id: str, table_name: str):
+        table = store.get_table(dataset_id, table_name)
+        if table is None:
+            return pbi_error(404, 'ItemNotFound', f'Table {table_name}')
+        return {'count': table['row_count'], 'value': table['rows']}
+
+    return router
+
+
+def create_app(
+        store: FakeStore = None,
+        faults: FaultInjector = None,
+        base_url: str = 'http://127.0.0.1:8001'
+) -> FastAPI:
+    '''
+    Создает приложение локального стенда Google Sheets и PowerBI API.
+
+    Стенд принимает любой токен авторизации. К запросам всех API,
+    кроме эндпойнтов управления /_fake, применяются задержки,
+    ограничения и сбои из faults.
+    '''
+    store = store or FakeStore()
+    faults = faults or FaultInjector()
+    app = FastAPI(title='Fake Google Sheets and PowerBI API')
+    app.state.store = store
+    app.state.faults = faults
+
+    @app.middleware('http')
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith(CONTROL_PREFIX):
+            return await call_next(request)
+        content_length = int(request.headers.get('content-length') or 0)
+        faults.enter()
+        started = time.perf_counter()
+        try:
+            await faults.delay()
+            failure = faults.check(content_length)
+            if failure is not None:
+                return JSONResponse(**failure)
+            faults.counters['bytes'] += content_length
+            return await call_next(request)
+        finally:
+            faults.exit()
+            faults.counters['busy_ms'] += int(
+                (time.perf_counter() - started) * 1000
+            )
+
+    app.include_router(get_google_router(store))
+    app.include_router(get_pbi_router(store, faults), prefix=PBI_PREFIX)
+    app.include_router(get_auth_router(base_url))
+    app.include_router(get_control_router(store, faults))
+    return app
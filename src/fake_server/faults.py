@@ -0,0 +1,128 @@
+import asyncio
+import random
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class FaultConfig(BaseModel):
+    '''Параметры задержек, ограничений и сбоев локального стенда.'''
+    # Задержка каждого ответа в секундах и ее случайный разброс
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # Число одновременных запросов, сверх которого API отвечает 429,
+    # 0 - без ограничения
+    max_concurrency: int = 0
+    # Доля запросов, на которые API случайно отвечает 429
+    throttle_rate: float = 0.0
+    # Значение Retry-After в ответах 429
+    retry_after: float = 1.0
+    # Доля запросов, которые завершаются ошибкой failure_status
+    failure_rate: float = 0.0
+    failure_status: int = 503
+    # Ограничения размера тела запроса в байтах, 0 - без ограничения,
+    # и числа строк в одном запросе push API
+    max_payload_bytes: int = 0
+    max_rows_per_request: int = 10000
+    # Зерно генератора случайных сбоев для воспроизводимых прогонов
+    seed: Optional[int] = None
+
+
+class FaultInjector:
+    '''
+    Применяет к запросам стенда задержку, ограничения и сбои.
+
+    Решение принимается до обработки запроса: сначала проверяется
+    размер тела и число одновременных запросов, затем случайные 429
+    и ошибки. Счетчики позволяют сравнить поведение клиента
+    с ответами стенда.
+    '''
+
+    def __init__(self, config: FaultConfig = None):
+        self.configure(config or FaultConfig())
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counters: Counter = Counter()
+
+    def configure(self, config: FaultConfig) -> None:
+        '''Применяет новые параметры.'''
+        self.config = config
+        self._random = random.Random(config.seed)
+
+    def reset(self) -> None:
+        '''Сбрасывает счетчики.'''
+        self.peak_in_flight = self.in_flight
+        self.counters.clear()
+
+    async def delay(self) -> None:
+        '''Выдерживает задержку ответа.'''
+        latency = self.config.latency
+        if self.config.latency_jitter:
+            latency += self._random.uniform(0, self.config.latency_jitter)
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+    def check(self, content_length: int) -> Optional[Dict[str, Any]]:
+        '''
+        Возвращает статус, тело и заголовки ответа с ошибкой или None.
+
+        Вызывается, когда запрос уже учтен в in_flight.
+        '''
+        config = self.config
+        if (
+            config.max_payload_bytes
+            and content_length > config.max_payload_bytes
+        ):
+            self.counters['too_large'] += 1
+            return {
+                'status_code': 413,
+                'content': {'error': {
+                    'code': 'RequestEntityTooLarge',
+                    'message': (
+                        f'Payload of {content_length} bytes exceeds '
+                        f'{config.max_payload_bytes}'
+                    ),
+                }},
+            }
+        if (
+            config.max_concurrency
+            and self.in_flight > config.max_concurrency
+        ) or self._random.random() < config.throttle_rate:
+            self.counters['throttled'] += 1
+            return {
+                'status_code': 429,
+                'content': {'error': {
+                    'code': 'TooManyRequests',
+                    'message': 'Rate limit is exceeded',
+                }},
+                'headers': {'Retry-After': f'{config.retry_after:g}'},
+            }
+        if self._random.random() < config.failure_rate:
+            self.counters['failed'] += 1
+            return {
+                'status_code': config.failure_status,
+                'content': {'error': {
+                    'code': 'InjectedFailure',
+                    'message': 'Injected failure',
+                }},
+            }
+        return None
+
+    def enter(self) -> None:
+        '''Учитывает начало запроса.'''
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.counters['requests'] += 1
+
+    def exit(self) -> None:
+        '''Учитывает завершение запроса.'''
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает счетчики запросов и ответов с ошибками.'''
+        return {
+            **self.counters,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+        }
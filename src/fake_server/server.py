@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, List
+
+import uvicorn
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from .app import PBI_PREFIX, create_app
+from .faults import FaultConfig, FaultInjector
+from .store import FakeStore
+
+# Число столбцов листа Весь рынок (A:AL)
+ALL_MARKET_COLUMNS = 38
+
+
+def get_free_port(host: str = '127.0.0.1') -> int:
+    '''Возвращает свободный локальный порт.'''
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def make_all_market_tab(rows: int, seed: int = 0) -> List[List[Any]]:
+    '''
+    Создает лист в формате Весь рынок.
+
+    Первая строка - служебная, во второй заголовок, третья пустая,
+    данные начинаются с четвертой строки.
+    '''
+    rng = random.Random(seed)
+    header = [f'Столбец {column}' for column in range(ALL_MARKET_COLUMNS)]
+    header[0] = '№'
+    header[23] = 'Москва'
+    header[30] = 'Категория'
+    values = [['Весь рынок'], header, []]
+    for row_num in range(rows):
+        row = [
+            str(rng.randint(1, 10 ** 6)) for _ in range(ALL_MARKET_COLUMNS)
+        ]
+        row[0] = str(row_num + 1)
+        row[8] = f'{rng.randint(1, 10 ** 5)} ₽'
+        row[13] = '2024-02-01'
+        row[14] = f'{rng.random() * 100:.2f}'
+        row[22] = rng.choice(['TRUE', 'FALSE'])
+        row[30] = rng.choice([
+            'Одежда/Платья/Летние', 'Обувь/Кроссовки', 'Аксессуары'
+        ])
+        values.append(row)
+    return values
+
+
+def write_service_account_file(path: str, base_url: str) -> str:
+    '''
+    Записывает файл сервисного аккаунта Google для стенда.
+
+    Токен запрашивается у стенда, ключ создается заново и нужен
+    только для подписи запроса токена.
+    '''
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as creds_file:
+        json.dump({
+            'type': 'service_account',
+            'project_id': 'fake-project',
+            'private_key_id': 'fake-key',
+            'private_key': private_key,
+            'client_email': 'fake@fake-project.iam.gserviceaccount.com',
+            'client_id': 'fake-client',
+            'token_uri': f'{base_url}/google/token',
+        }, creds_file)
+    return path
+
+
+class FakeServer:
+    '''
+    Локальный стенд Google Sheets и PowerBI API в фоновом потоке.
+
+    Используется в тестах и бенчмарках как контекстный менеджер:
+    with FakeServer(faults=FaultConfig(latency=0.05)) as server: ...
+    Адреса для настроек сервиса возвращает env.
+    '''
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = None,
+            faults: FaultConfig = None,
+            keep_rows: bool = True
+    ):
+        self.host = host
+        self.port = port or get_free_port(host)
+        self.base_url = f'http://{host}:{self.port}'
+        self.store = FakeStore(keep_rows=keep_rows)
+        self.faults = FaultInjector(faults)
+        self.app = create_app(self.store, self.faults, self.base_url)
+        self._server = None
+        self._thread = None
+
+    def env(
+            self,
+            creds_path: str = '.cache/fake_server/creds.json',
+            group_id: str = 'fake-group'
+    ) -> Dict[str, str]:
+        '''
+        Возвращает переменные окружения сервиса для работы со стендом.
+
+        Записывает файл сервисного аккаунта Google по creds_path.
+        '''
+        return {
+            'GAPI_CREDS': write_service_account_file(
+                creds_path, self.base_url
+            ),
+            'GAPI_ENDPOINT': self.base_url,
+            'PBI_API_URL': f'{self.base_url}{PBI_PREFIX}',
+            'PBI_AUTH_URL': f'{self.base_url}/fake-tenant',
+            'PBI_CLIENT_ID': 'fake-client',
+            'PBI_CLIENT_SECRET': 'fake-secret',
+            'PBI_GROUP': group_id,
+        }
+
+    def start(self, timeout: float = 10.0) -> 'FakeServer':
+        '''Запускает сервер и ждет, пока он начнет принимать запросы.'''
+        config = uvicorn.Config(
+            self.app,
+            host=self.host,
+            port=self.port,
+            log_level='warning',
+            access_log=False
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(
+            target=self._server.run, name='fake-server', daemon=True
+        )
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError('Fake server did not start')
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        '''Останавливает сервер.'''
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+
+    def __enter__(self) -> 'FakeServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,372 @@
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Диапазон A1: 'Лист'!A1:AL100, Лист!A:AL, A1:B2 или только название
+A1_RANGE = re.compile(
+    r"^(?:(?:'(?P<quoted>(?:[^']|'')+)'|(?P<plain>[^!]+))!)?"
+    r"(?P<first_col>[A-Z]*)(?P<first_row>\d*)"
+    r"(?::(?P<last_col>[A-Z]*)(?P<last_row>\d*))?$"
+)
+
+
+def column_number(letters: str) -> int:
+    '''Возвращает номер столбца с 1 по его буквенному обозначению.'''
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def parse_a1_range(
+        cell_range: str,
+        default_title: str
+) -> Tuple[str, int, int, Optional[int], Optional[int]]:
+    '''
+    Разбирает диапазон в нотации A1.
+
+    Возвращает название листа, первый столбец и строку с нуля и
+    последний столбец и строку не включительно, None - до конца листа.
+    '''
+    match = A1_RANGE.match(cell_range)
+    if match is None or not (
+        match.group('first_col') or match.group('first_row')
+    ):
+        # Диапазон без ячеек - это название листа целиком
+        title = cell_range.strip("'").replace("''", "'")
+        return title, 0, 0, None, None
+
+    title = match.group('quoted')
+    if title is not None:
+        title = title.replace("''", "'")
+    else:
+        title = match.group('plain') or default_title
+    first_col = column_number(match.group('first_col')) or 1
+    first_row = int(match.group('first_row') or 1)
+    last_col = column_number(match.group('last_col') or '') or None
+    last_row = (
+        int(match.group('last_row')) if match.group('last_row') else None
+    )
+    if match.group('last_col') is None and match.group('last_row') is None:
+        # Одна ячейка
+        last_col, last_row = first_col, first_row
+    return title, first_col - 1, first_row - 1, last_col, last_row
+
+
+def format_value(value: Any) -> Any:
+    '''Возвращает значение ячейки так, как его отдает FORMATTED_VALUE.'''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class FakeStore:
+    '''
+    Данные локального стенда Google Sheets и PowerBI в памяти.
+
+    Хранит таблицы с листами и метаданными файла на диске, а также
+    датасеты, таблицы, строки и отчеты PowerBI. Строки датасетов
+    сохраняются, только если keep_rows, иначе считается их число.
+    '''
+
+    def __init__(self, keep_rows: bool = True):
+        self.keep_rows = keep_rows
+        self._lock = threading.Lock()
+        self.spreadsheets: Dict[str, Dict[str, List[List[Any]]]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self.reports: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        '''Удаляет все данные стенда.'''
+        with self._lock:
+            self.spreadsheets.clear()
+            self.files.clear()
+            self.datasets.clear()
+            self.reports.clear()
+
+    # Google Sheets и Drive
+
+    def put_spreadsheet(
+            self,
+            sheet_id: str,
+            name: str,
+            tabs: Dict[str, List[List[Any]]]
+    ) -> Dict[str, Any]:
+        '''Создает или заменяет таблицу и поднимает версию файла.'''
+        with self._lock:
+            self.spreadsheets[sheet_id] = {
+                title: [list(row) for row in rows]
+                for title, rows in tabs.items()
+            }
+            version = int(self.files.get(sheet_id, {}).get('version', 0))
+            self.files[sheet_id] = {
+                'id': sheet_id,
+                'name': name,
+                'version': str(version + 1),
+                'modifiedTime': datetime.now(timezone.utc).isoformat(),
+            }
+            return dict(self.files[sheet_id])
+
+    def append_rows(
+            self,
+            sheet_id: str,
+            title: str,
+            rows: List[List[Any]]
+    ) -> Dict[str, Any]:
+        '''Дописывает строки в конец листа и поднимает версию файла.'''
+        with self._lock:
+            self.spreadsheets[sheet_id][title].extend(
+                list(row) for row in rows
+            )
+            file = self.files[sheet_id]
+            file['version'] = str(int(file['version']) + 1)
+            file['modifiedTime'] = datetime.now(timezone.utc).isoformat()
+            return dict(file)
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        '''Возвращает метаданные файла, как files.get.'''
+        with self._lock:
+            file = self.files.get(file_id)
+            return dict(file) if file else None
+
+    def get_spreadsheet(
+            self,
+            sheet_id: str,
+            ranges: List[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        '''Возвращает свойства листов, как spreadsheets.get.'''
+        with self._lock:
+            tabs = self.spreadsheets.get(sheet_id)
+            if tabs is None:
+                return None
+            titles = list(tabs)
+            if ranges:
+                default_title = titles[0] if titles else ''
+                wanted = {
+                    parse_a1_range(cell_range, default_title)[0]
+                    for cell_range in ranges
+                }
+                titles = [title for title in titles if title in wanted]
+            sheets = [
+                {
+                    'properties': {
+                        'sheetId': index,
+                        'title': title,
+                        'index': index,
+                        'gridProperties': {
+                            'rowCount': len(tabs[title]),
+                            'columnCount': max(
+                                (len(row) for row in tabs[title]), default=0
+                            ),
+                        },
+                    },
+                }
+                for index, title in enumerate(titles)
+            ]
+            return {
+                'spreadsheetId': sheet_id,
+                'properties': {'title': self.files[sheet_id]['name']},
+                'sheets': sheets,
+            }
+
+    def get_values(
+            self,
+            sheet_id: str,
+            cell_range: str,
+            formatted: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        '''
+        Возвращает значения диапазона, как values.get.
+
+        Пустые строки и ячейки в конце диапазона не возвращаются.
+        '''
+        with self._lock:
+            tabs = self.spreadsheets.get(sheet_id)
+            if tabs is None:
+                return None
+            title, first_col, first_row, last_col, last_row = (
+                parse_a1_range(cell_range, next(iter(tabs), ''))
+            )
+            rows = tabs.get(title)
+            if rows is None:
+                return None
+            values = []
+            for row in rows[first_row:last_row]:
+                cells = row[first_col:last_col]
+                while cells and cells[-1] in ('', None):
+                    cells = cells[:-1]
+                if formatted:
+                    cells = [format_value(cell) for cell in cells]
+                values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        response = {'range': cell_range, 'majorDimension': 'ROWS'}
+        if values:
+            response['values'] = values
+        return response
+
+    # PowerBI
+
+    def create_dataset(
+            self,
+            group_id: Optional[str],
+            dataset: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        '''Создает push датасет по описанию из запроса.'''
+        dataset_id = str(uuid.uuid4())
+        with self._lock:
+            self.datasets[dataset_id] = {
+                'id': dataset_id,
+                'name': dataset.get('name'),
+                'group_id': group_id,
+                'tables': {
+                    table['name']: {
+                        'schema': table,
+                        'row_count': 0,
+                        'rows': [],
+                    }
+                    for table in dataset.get('tables', [])
+                },
+            }
+        return {
+            'id': dataset_id,
+            'name': dataset.get('name'),
+            'defaultRetentionPolicy': 'None',
+        }
+
+    def get_table(
+            self,
+            dataset_id: str,
+            table_name: str
+    ) -> Optional[Dict[str, Any]]:
+        '''Возвращает таблицу датасета или None.'''
+        dataset = self.datasets.get(dataset_id)
+        if dataset is None:
+            return None
+        return dataset['tables'].get(table_name)
+
+    def get_tables(self, dataset_id: str) -> Optional[List[Dict[str, Any]]]:
+        '''Возвращает таблицы датасета, как GetTables.'''
+        with self._lock:
+            dataset = self.datasets.get(dataset_id)
+            if dataset is None:
+                return None
+            return [{'name': name} for name in dataset['tables']]
+
+    def put_table(
+            self,
+            dataset_id: str,
+            table_name: str,
+            schema: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        '''Заменяет схему таблицы, строки сохраняются.'''
+        with self._lock:
+            table = self.get_table(dataset_id, table_name)
+            if table is None:
+                return None
+            table['schema'] = schema
+            return schema
+
+    def add_rows(
+            self,
+            dataset_id: str,
+            table_name: str,
+            rows: List[Dict[str, Any]]
+    ) -> bool:
+        '''Добавляет строки в таблицу, возвращает False, если ее нет.'''
+        with self._lock:
+            table = self.get_table(dataset_id, table_name)
+            if table is None:
+                return False
+            table['row_count'] += len(rows)
+            if self.keep_rows:
+                table['rows'].extend(rows)
+            return True
+
+    def delete_rows(self, dataset_id: str, table_name: str) -> bool:
+        '''Удаляет все строки таблицы, возвращает False, если ее нет.'''
+        with self._lock:
+            table = self.get_table(dataset_id, table_name)
+            if table is None:
+                return False
+            table['row_count'] = 0
+            table['rows'] = []
+            return True
+
+    def clone_report(
+            self,
+            group_id: str,
+            report_id: str,
+            name: str,
+            target_dataset: str = None
+    ) -> Dict[str, Any]:
+        '''
+        Клонирует отчет.
+
+        Неизвестный отчет считается шаблоном, созданным вне стенда.
+        '''
+        with self._lock:
+            template = self.reports.setdefault(report_id, {
+                'id': report_id,
+                'name': report_id,
+                'datasetId': None,
+                'group_id': group_id,
+            })
+            clone_id = str(uuid.uuid4())
+            self.reports[clone_id] = {
+                'id': clone_id,
+                'name': name,
+                'datasetId': target_dataset or template['datasetId'],
+                'group_id': group_id,
+            }
+            return self._report_json(self.reports[clone_id])
+
+    def rebind_report(self, report_id: str, dataset_id: str) -> bool:
+        '''Привязывает отчет к датасету, возвращает False, если его нет.'''
+        with self._lock:
+            report = self.reports.get(report_id)
+            if report is None or dataset_id not in self.datasets:
+                return False
+            report['datasetId'] = dataset_id
+            return True
+
+    def get_reports(self, group_id: str) -> List[Dict[str, Any]]:
+        '''Возвращает отчеты рабочей области.'''
+        with self._lock:
+            return [
+                self._report_json(report)
+                for report in self.reports.values()
+                if report['group_id'] == group_id
+            ]
+
+    @staticmethod
+    def _report_json(report: Dict[str, Any]) -> Dict[str, Any]:
+        '''Возвращает отчет в формате ответа API.'''
+        return {
+            'id': report['id'],
+            'name': report['name'],
+            'datasetId': report['datasetId'],
+            'webUrl': f'https://app.powerbi.com/reports/{report["id"]}',
+            'embedUrl': (
+                f'https://app.powerbi.com/reportEmbed?reportId={report["id"]}'
+            ),
+        }
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает число объектов стенда и принятых строк.'''
+        with self._lock:
+            return {
+                'spreadsheets': len(self.spreadsheets),
+                'datasets': len(self.datasets),
+                'reports': len(self.reports),
+                'rows': sum(
+                    table['row_count']
+                    for dataset in self.datasets.values()
+                    for table in dataset['tables'].values()
+                ),
+            }
@@ -1,18 +1,53 @@
+from enum import Enum
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 
 
+class SyncMode(str, Enum):
+    '''Режимы синхронизации гугл таблицы с PowerBI.'''
+    # Новый датасет со всеми строками и клон отчета
+    FULL = 'full'
+    # Дозагрузка строк, добавленных в конец листов, в прежний датасет
+    APPEND = 'append'
+    # Перезаливка строк в прежний датасет без клонирования отчета
+    RELOAD = 'reload'
+    # Отправка только новых строк по отпечаткам строк
+    DELTA = 'delta'
+
+
 class SheetReportID(BaseModel):
     '''Схема данных для запуска процесса переноса данных.'''
     google_sheet_id: str
     pbi_report_id: str
+    window_rows: Optional[int] = None
+    force: bool = False
+    typed: bool = False
+    sheet_titles: Optional[List[str]] = None
+    concurrency: int = 1
+    mode: SyncMode = SyncMode.FULL
+    delta_key: Optional[str] = None
+    delta_threshold: Optional[float] = None
+    stream: bool = False
 
 
 class ReportData(BaseModel):
     '''Схема данных отчета для фронтенда.'''
     report_id: str
     embed_url: str
+    modified: bool = True
 
 
 class ReportRequestData(BaseModel):
     '''Схема данных для запроса данных отчета.'''
     pbi_report_id: str
+
+
+class ServiceMetrics(BaseModel):
+    '''Схема счетчиков клиентов и кешей сервиса.'''
+    google_clients: Dict[str, int]
+    values_cache: Dict[str, float]
+    google_rate_limiter: Dict[str, int]
+    pbi_upload_limiter: Dict[str, int]
+    pbi_async_upload_limiter: Dict[str, int]
+    pbi_report_pool: Dict[str, int]
@@ -0,0 +1,82 @@
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, model_validator
+
+from extended_pbipy.enums import ColumnDataTypes
+
+# Название листа или таблицы, подходящее под любое значение
+ANY = '*'
+
+
+class ColumnSpec(BaseModel):
+    '''
+    Описание столбца листа.
+
+    Незаданные поля столбца по номеру дополняются полями столбца
+    по названию заголовка.
+    '''
+    # Название столбца в PowerBI вместо заголовка листа
+    name: Optional[str] = None
+    # Ожидаемый заголовок листа, расхождение попадает в лог
+    header: Optional[str] = None
+    # Тип столбца, Currency создается как Double с форматом Currency
+    type: ColumnDataTypes = ColumnDataTypes.String
+    format: str = ''
+    # Значение пустых ячеек, None - пустая строка
+    empty: Union[bool, int, float, str, None] = None
+    # Убирать пробелы внутри значения, как в числах с разрядами
+    strip_spaces: bool = False
+
+
+class SplitSpec(BaseModel):
+    '''Столбец, значение которого делится на несколько столбцов.'''
+    # Номер столбца листа с нуля
+    column: int
+    # Названия столбцов частей, вставляются сразу после column
+    names: List[str]
+    separator: str = '/'
+
+
+class SheetLayout(BaseModel):
+    '''Разметка листа: строки заголовка и данных, столбцы и их типы.'''
+    # Номер строки заголовка и первой строки данных с единицы
+    header_row: int = 1
+    data_start_row: int = 2
+    # Столбцы по номеру столбца листа с нуля
+    columns: Dict[int, ColumnSpec] = {}
+    # Столбцы по заголовку, где бы они ни находились
+    named_columns: Dict[str, ColumnSpec] = {}
+    split: Optional[SplitSpec] = None
+
+    @model_validator(mode='after')
+    def check_rows(self) -> 'SheetLayout':
+        if self.header_row < 1 or self.data_start_row <= self.header_row:
+            raise ValueError(
+                'header_row must be positive and precede data_start_row'
+            )
+        if any(column < 0 for column in self.columns):
+            raise ValueError('Column numbers must not be negative')
+        if self.split is not None and not self.split.names:
+            raise ValueError('Split column needs at least one part name')
+        return self
+
+
+class MappingFile(BaseModel):
+    '''
+    Файл соответствия листов гугл таблиц и таблиц PowerBI.
+
+    sheets задает разметку по id гугл таблицы и названию листа,
+    ANY подходит под любую таблицу или лист.
+    '''
+    layouts: Dict[str, SheetLayout]
+    sheets: Dict[str, Dict[str, str]] = {ANY: {ANY: 'default'}}
+
+    @model_validator(mode='after')
+    def check_layouts(self) -> 'MappingFile':
+        for sheet_id, tabs in self.sheets.items():
+            for title, layout in tabs.items():
+                if layout not in self.layouts:
+                    raise ValueError(
+                        f'Unknown layout {layout} for {sheet_id}/{title}'
+                    )
+        return self
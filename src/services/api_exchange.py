@@ -1,15 +1,20 @@
+import asyncio
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List
 
 from pbipy.datasets import Dataset
 from pbipy.reports import Report
 
-from extended_pbipy.entities import DatasetCreate, DataSource, Table
-from extended_pbipy.enums import ColumnDataTypes, DataSourceType
+from extended_pbipy.entities import DatasetCreate, Table
+from extended_pbipy.enums import ColumnDataTypes
 from extended_pbipy.table_items import Column
 from src.core.config import settings
-from .google_api import get_values, get_file, get_sheet_titles
+from .google_api import (
+    get_batch_values, get_file, get_sheet_titles, get_values
+)
+from .google_api_async import async_google_client
 from .pbi_api import pbi
+from .type_inference import get_parser, type_inference
 
 
 logger = logging.getLogger(__name__)
@@ -24,9 +29,10 @@ class ApiExchangeFlow:
             pbi_report_id: str
     ):
         self.sheet_id = sheet_id
-        self.table_file = self._get_file_name(self.sheet_id)
+        self.table_file = None
         self.report_id = pbi_report_id
         self._table_rows = {}
+        self._column_parsers = {}
         # self.cell_values = self._get_table_values(self.sheet_id)
 
         # self.column_headers = None
@@ -38,7 +44,17 @@ class ApiExchangeFlow:
         '''Запрашивает данные из гугл таблицы по ее id.'''
         sheet_data = get_values(sheet_id, cell_range)
         logger.info(f'Received data from {cell_range}')
-        return sheet_data.get('values')
+        return sheet_data.get('values', [])
+
+    def _get_tables_values(
+            self,
+            sheet_id: str,
+            sheet_titles: List[str]
+    ) -> Dict[str, List[List]]:
+        '''Запрашивает данные всех переданных листов одним запросом.'''
+        tables_values = get_batch_values(sheet_id, sheet_titles)
+        logger.info(f'Received data from {len(tables_values)} sheets')
+        return tables_values
 
     def _get_file_name(self, sheet_id: str) -> str:
         '''
@@ -49,6 +65,11 @@ class ApiExchangeFlow:
         file = get_file(sheet_id)
         return file.get('name')
 
+    async def _aget_file_name(self, sheet_id: str) -> str:
+        '''Асинхронно запрашивает имя файла гугл таблицы.'''
+        file = await async_google_client.get_file(sheet_id)
+        return file.get('name')
+
     def _get_titles(self, sheet_id: str) -> Dict:
         '''Вернуть все названия листов файла.'''
         return get_sheet_titles(sheet_id)
@@ -70,35 +91,29 @@ class ApiExchangeFlow:
     def _create_pbi_table(
             self,
             column_headers: List,
-            row_values: List,
+            rows: List[List],
             table_name: str
     ) -> Table:
         '''
         Создает объект таблицы со столбцами, как первая строка в таблице гугл.
+
+        Типы столбцов выводятся по выборке строк под заголовком.
         '''
         new_table = Table(name=table_name)
         empty_name_counter = 0
-
-        if column_headers:
-            for header_idx in range(len(column_headers)):
-
-                try:
-                    data_type = ColumnDataTypes.convert_from_python(
-                        row_values[header_idx]
-                    )
-                except IndexError:
-                    logger.error('Index error in create pbi table.')
-                    data_type = 'String'
-
-                column_name = column_headers[header_idx]
-                if not column_headers[header_idx]:
-                    empty_name_counter += 1
-                    column_name = f'Undefined {empty_name_counter}'
-                column = Column(
-                    name=column_name,
-                    data_type=data_type
-                )
-                new_table.add_column(column)
+        column_types = type_inference.infer(column_headers, rows)
+        self._column_parsers[table_name] = list(map(get_parser, column_types))
+
+        for column_name, column_type in zip(column_headers, column_types):
+            if not column_name:
+                empty_name_counter += 1
+                column_name = f'Undefined {empty_name_counter}'
+            column = Column(
+                name=column_name,
+                data_type=column_type.data_type,
+                format_string=column_type.format_string
+            )
+            new_table.add_column(column)
 
         return new_table
 
@@ -106,6 +121,13 @@ class ApiExchangeFlow:
         '''Добавляет строки в таблицу PowerBI.'''
         self._table_rows[table.name] = []
         table_columns = table.columns
+        parsers = self._column_parsers.get(table.name, [])
+        typed_columns = {
+            column_num
+            for column_num, column in enumerate(table_columns)
+            if column.data_type != ColumnDataTypes.String.value
+        }
+        unparsed = 0
 
         for row in table_rows:
             row_data = {}
@@ -113,9 +135,16 @@ class ApiExchangeFlow:
 
                 try:
                     column_name = table_columns[value_num].name
-                    row_value = (
-                        row[value_num] if row[value_num] else '--Empty--'
-                    )
+                    if value_num in typed_columns:
+                        try:
+                            row_value = parsers[value_num](row[value_num])
+                        except ValueError:
+                            unparsed += 1
+                            row_value = None
+                    else:
+                        row_value = (
+                            row[value_num] if row[value_num] else '--Empty--'
+                        )
                     row_data[column_name] = row_value
 
                 except IndexError:
@@ -130,60 +159,65 @@ class ApiExchangeFlow:
 
             self._table_rows[table.name].append(row_data)
 
+        if unparsed:
+            logger.warning(
+                f'{table.name}: {unparsed} values do not match inferred '
+                f'column types and are sent empty'
+            )
+
         # return table
 
     def _create_dataset(self) -> DatasetCreate:
-        '''
-        Создает объект DatasetCreate с таблицей данных.
+        '''Запрашивает листы гугл таблицы и создает объект DatasetCreate.'''
+        tables_values = self._get_tables_values(
+            self.sheet_id, list(get_sheet_titles(self.sheet_id))
+        )
+        return self._build_dataset(tables_values)
 
-        Подключает DataSource к таблице гугл по url.
-        '''
+    async def _acreate_dataset(self) -> DatasetCreate:
+        '''Асинхронно запрашивает листы и создает объект DatasetCreate.'''
+        sheet_titles = await async_google_client.get_sheet_titles(
+            self.sheet_id
+        )
+        tables_values = await async_google_client.get_batch_values(
+            self.sheet_id, sheet_titles
+        )
+        logger.info(f'Received data from {len(tables_values)} sheets')
+        # Преобразование строк нагружает CPU, выносим из event loop
+        return await asyncio.to_thread(self._build_dataset, tables_values)
+
+    def _build_dataset(
+            self,
+            tables_values: Dict[str, List[List]]
+    ) -> DatasetCreate:
+        '''Создает объект DatasetCreate с таблицей данных.'''
         new_dataset = DatasetCreate(name=self.table_file)
-        for range_title in get_sheet_titles(self.sheet_id):
+        for range_title, values in tables_values.items():
             try:
-                values = self._get_table_values(self.sheet_id, range_title)
                 # Найти самую длинную строку (предполагаемо заголовок)
                 longest = self._get_longest_row(values)
+                # Берем строки ниже предполагаемого заголовка
+                rows = values[longest + 1:]
                 # Создать таблицу со столбцами и типами данных, как в строках ниже
-                row_with_data = (
-                    longest + 2
-                    if len(values) - 2 > longest
-                    else longest
-                )
-
                 pbi_table = self._create_pbi_table(
-                    values[longest],
-                    values[row_with_data],
-                    range_title
+                    values[longest], rows, range_title
                 )
-                # Берем строки ниже предполагаемого заголовка
-                self._add_rows(pbi_table, values[longest:])
+                self._add_rows(pbi_table, rows)
                 new_dataset.add_table(pbi_table)
             except Exception as err:
                 logger.error(f'Error create dataset {err}', exc_info=True)
 
-        connection_details = {
-            'path': f'{settings.SHEETS_URL}/{self.sheet_id}',
-            'kind': 'GoogleSheets'
-        }
-        datasource = DataSource(
-            data_source_type='Web',
-            connection_details=connection_details
-        )
-        # new_dataset.add_data_source(datasource)
-
         new_dataset.clear_empty_data()
-        print(new_dataset)
+        logger.debug(f'Dataset created {new_dataset}')
 
         return new_dataset
 
-    def _push_dataset(self) -> Dataset:
+    def _push_dataset(self, new_dataset: DatasetCreate) -> Dataset:
         '''
         Отправляет данные в PowerBI.
 
         Возвращает созданный Dataset и список созданных таблиц.
         '''
-        new_dataset = self._create_dataset()
         dataset_created = pbi.post_group_dataset(
             group=settings.PBI_GROUP,
             dataset=new_dataset,
@@ -195,14 +229,44 @@ class ApiExchangeFlow:
         '''Отправляет запрос на добавление строки в таблицу.'''
         logger.info(f'Adding rows to table {table_name}')
 
-        # table = self._add_rows(table)
-        pbi.post_group_dataset_rows(
+        # Push API принимает не больше 10000 строк за запрос
+        chunks = pbi.post_group_dataset_rows_chunked(
             group_id=dataset.group_id,
             dataset_id=dataset.id,
             table_name=table_name,
-            rows=table_rows
+            rows=table_rows,
+            chunk_size=settings.PBI_ROWS_CHUNK_SIZE,
+            max_workers=settings.PBI_UPLOAD_MAX_CONCURRENCY
+        )
+        rows_count = sum(chunk['rows'] for chunk in chunks)
+        slowest = max((chunk['elapsed'] for chunk in chunks), default=0)
+        logger.info(
+            f'Added {rows_count} rows to {table_name} in {len(chunks)} '
+            f'requests, slowest {slowest:.3f}s.'
+        )
+
+    def _transfer(self, new_dataset: DatasetCreate) -> Report:
+        '''
+        Создает датасет в PowerBI, заполняет его строками и
+        клонирует отчет с привязкой к новому датасету.
+        '''
+        dataset = self._push_dataset(new_dataset)
+        for table, rows in self._table_rows.items():
+            self._post_dataset_rows(dataset, table, rows)
+        logger.info('Data transfer finished.')
+
+        logger.info(f'Cloning report {self.report_id}')
+
+        cloned_report = pbi.clone_group_report(
+            group_id=settings.PBI_GROUP,
+            report_id=self.report_id,
+            name=self.table_file,
+            target_dataset=dataset.id
         )
-        logger.info('Added rows to table.')
+
+        logger.info(f'Report {self.report_id} cloned.')
+
+        return cloned_report
 
     def run(self) -> Report:
         '''
@@ -213,21 +277,25 @@ class ApiExchangeFlow:
         '''
         try:
             logger.info('Starting data transfer.')
-            dataset = self._push_dataset()
-            for table, rows in self._table_rows.items():
-                self._post_dataset_rows(dataset, table, rows)
-            logger.info('Data transfer finished.')
+            self.table_file = self._get_file_name(self.sheet_id)
+            new_dataset = self._create_dataset()
+            return self._transfer(new_dataset)
 
-            logger.info(f'Cloning report {self.report_id}')
-
-            cloned_report = pbi.report(
-                report=self.report_id, group=settings.PBI_GROUP
-            ).clone(name=self.table_file, target_dataset=dataset.id)
+        except Exception as err:
+            logger.error(f'Error in data transfer {err}.', exc_info=True)
 
-            logger.info(f'Report {self.report_id} cloned.')
+    async def arun(self) -> Report:
+        '''
+        Асинхронный вариант run для вызова из обработчиков FastAPI.
 
-            return cloned_report
-            # return dataset
+        Данные из гугл таблицы запрашиваются без блокировки event loop,
+        синхронный клиент PowerBI выполняется в отдельном потоке.
+        '''
+        try:
+            logger.info('Starting data transfer.')
+            self.table_file = await self._aget_file_name(self.sheet_id)
+            new_dataset = await self._acreate_dataset()
+            return await asyncio.to_thread(self._transfer, new_dataset)
 
         except Exception as err:
             logger.error(f'Error in data transfer {err}.', exc_info=True)
@@ -1,234 +1,464 @@
+import asyncio
+import json
 import logging
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+)
 
 from pbipy.datasets import Dataset
 from pbipy.reports import Report
 
 from extended_pbipy.entities import DatasetCreate, Table
-from extended_pbipy.enums import ColumnDataTypes
-from extended_pbipy.table_items import Column
 from src.core.config import settings
-from .google_api import get_values, get_file, get_sheet_titles
-from .pbi_api import pbi
+from src.schemas.entities import SyncMode
+from .google_api import (
+    FILE_REVISION_FIELDS, LAST_COLUMN, SheetReadError, column_letter,
+    get_batch_ranges, get_batch_values, get_file, get_file_revision,
+    get_header_hash, get_sheet_titles, get_sheets_properties, get_values,
+    iter_values
+)
+from .google_api_async import async_google_client
+from .pbi_api import async_pbi, pbi
+from .report_pool import report_pool
+from .row_delta import compute_row_delta, get_row_fingerprints
+from .row_transform import RowTransformer
+from .schema_mapping import CompiledLayout, schema_mapping
+from .streaming import iter_chunks, prefetch
+from .sync_state import sync_state
 
 
 logger = logging.getLogger(__name__)
 
 
 class ApiExchangeFlowAllMarket:
-    '''Класс для создания датасета по листу Весь рынок.'''
+    '''
+    Класс для создания датасета по листам гугл таблицы.
+
+    Столбцы, их типы и преобразование строк каждого листа задаются
+    разметкой из файла соответствия, по умолчанию - листа Весь рынок.
+    '''
 
     def __init__(
             self,
             sheet_id: str,
-            pbi_report_id: str
+            pbi_report_id: str,
+            window_rows: int = None,
+            force: bool = False,
+            typed: bool = False,
+            sheet_titles: List[str] = None,
+            concurrency: int = 1,
+            mode: SyncMode = SyncMode.FULL,
+            delta_key: str = None,
+            delta_threshold: float = None,
+            stream: bool = False
     ):
         self.sheet_id = sheet_id
-        self.table_file = self._get_file_name(self.sheet_id)
+        self.table_file = None
         self.report_id = pbi_report_id
-        self._table_rows = {}
+        # Ревизия файла, по которой определяется наличие изменений
+        self.revision = None
+        self.modified_time = None
+        self.force = force
+        self.modified = True
+        # Если задано, листы читаются окнами по window_rows строк
+        self.window_rows = window_rows
+        # Значения запрашиваются без форматирования в исходных типах
+        self.typed = typed
+        # Подмножество листов книги, по умолчанию все листы
+        self.sheet_titles = sheet_titles
+        # Число листов, загружаемых и преобразуемых параллельно
+        self.concurrency = concurrency
+        self.mode = mode
+        # Бизнес ключ строк и доля изменений и удалений от числа строк,
+        # после которой таблица в режиме delta перезаписывается целиком
+        self.delta_key = delta_key or settings.ROW_DELTA_KEY
+        self.delta_threshold = (
+            settings.ROW_DELTA_THRESHOLD
+            if delta_threshold is None
+            else delta_threshold
+        )
+        self._row_fingerprints = {}
+        # Число запусков подряд с незаписанными изменениями по таблице
+        self._stale_runs: Dict[str, int] = {}
+        # Строки листов отправляются по мере чтения, без сборки таблиц,
+        # в режиме full и при полной перезагрузке в режиме append
+        self.stream = stream
+        # Строки таблиц по названию таблицы, при чтении окнами -
+        # по столбцам в ColumnarTable
+        self._table_rows: Dict[str, Sequence[Dict]] = {}
+        # Число прочитанных строк и хеш заголовка по названию листа
+        self._tab_states = {}
+        # Листы книги, выбранные для переноса
+        self._selected_titles: List[str] = []
 
     def _get_table_values(self, sheet_id: str, cell_range: str) -> List[List]:
         '''Запрашивает данные из гугл таблицы по ее id.'''
         sheet_data = get_values(sheet_id, cell_range)
         logger.info(f'Received data from {cell_range}')
-        return sheet_data.get('values')
+        return sheet_data.get('values', [])
+
+    def _get_tables_values(
+            self,
+            sheet_id: str,
+            sheet_titles: List[str]
+    ) -> Dict[str, List[List]]:
+        '''Запрашивает данные всех переданных листов одним запросом.'''
+        tables_values = get_batch_values(
+            sheet_id, sheet_titles, revision=self.revision, typed=self.typed
+        )
+        logger.info(f'Received data from {len(tables_values)} sheets')
+        return tables_values
+
+    def _get_file(self, sheet_id: str) -> Dict[str, Any]:
+        '''Запрашивает имя и ревизию файла гугл таблицы.'''
+        return get_file(sheet_id, fields=FILE_REVISION_FIELDS)
+
+    async def _aget_file(self, sheet_id: str) -> Dict[str, Any]:
+        '''Асинхронно запрашивает имя и ревизию файла гугл таблицы.'''
+        return await async_google_client.get_file(
+            sheet_id, fields=FILE_REVISION_FIELDS
+        )
+
+    def _set_file_info(self, file: Dict[str, Any]) -> None:
+        '''Сохраняет имя и ревизию файла гугл таблицы.'''
+        self.table_file = file.get('name')
+        self.revision = get_file_revision(file)
+        self.modified_time = file.get('modifiedTime')
+
+    def _get_sync_options(self) -> str:
+        '''
+        Возвращает параметры, от которых зависят данные датасета:
+        выбранные листы и режим значений.
+        '''
+        return json.dumps(
+            {
+                'sheet_titles': sorted(self.sheet_titles or []),
+                'typed': self.typed,
+            },
+            ensure_ascii=False
+        )
 
-    def _get_file_name(self, sheet_id: str) -> str:
+    def _get_synced_report(self) -> Optional[Report]:
         '''
-        Запрашивает данные о файле гугл таблицы.
+        Возвращает ранее созданный отчет, если таблица не менялась
+        с последней синхронизации с теми же листами и режимом значений.
 
-        Возвразает имя файла.
+        Режим reload всегда перезаливает датасет.
         '''
-        file = get_file(sheet_id)
-        return file.get('name')
+        if (
+            self.force
+            or self.revision is None
+            or self.mode == SyncMode.RELOAD
+        ):
+            return None
+
+        state = sync_state.get_sheet_state(self.sheet_id, self.report_id)
+        if not state or state.get('revision') != self.revision:
+            return None
+        if state.get('sync_options') != self._get_sync_options():
+            logger.info(
+                f'Sheet {self.sheet_id} sync options changed since revision '
+                f'{self.revision}, transfer required.'
+            )
+            return None
+
+        logger.info(
+            f'Sheet {self.sheet_id} not modified since revision '
+            f'{self.revision}, skipping transfer.'
+        )
+        self.modified = False
+        return Report(
+            state.get('report_id'),
+            pbi.session,
+            group_id=settings.PBI_GROUP
+        )
 
     def _get_titles(self, sheet_id: str) -> Dict:
         '''Вернуть все названия листов файла.'''
         return get_sheet_titles(sheet_id)
 
-    def _get_columns(self, values: List[List]):
-        '''Извлекает заголовки столбцов.'''
-        columns = values[1]
-        columns[0] = '№'
-        first_part = columns[:31]
-        second_part = columns[31:]
-        new_part = [
-            'Категория.1', 'Категория.2', 'Категория.3',
-            'Категория.4', 'Категория.5'
-        ]
-        columns = first_part + new_part + second_part
-        return columns
+    def _get_layout(self, title: str) -> CompiledLayout:
+        '''Возвращает разметку листа из файла соответствия.'''
+        return schema_mapping.get(self.sheet_id, title)
+
+    def _create_pbi_table(self, header: List, table_name: str) -> Table:
+        '''
+        Создает объект таблицы со столбцами по заголовку листа.
+
+        Типы столбцов и части делимого столбца задает разметка листа.
+        '''
+        layout = self._get_layout(table_name)
+        layout.validate_header(header, table_name)
+        return layout.create_table(header, table_name)
 
-    def _create_pbi_table(
+    def _add_rows(self, table: Table, table_rows: List) -> Table:
+        '''
+        Добавляет строки в таблицу PowerBI.
+
+        Лист уже прочитан целиком, поэтому строки хранятся словарями:
+        они сериализуются быстрее, чем собираются из ColumnarTable.
+        '''
+        self._table_rows[table.name] = list(
+            self._transform_rows(table, table_rows)
+        )
+
+    def _transform_rows(
             self,
-            column_headers: List,
-            table_name: str
-    ) -> Table:
-        '''
-        Создает объект таблицы со столбцами, как первая строка в таблице гугл.
-        '''
-        new_table = Table(name=table_name)
-
-        data_types = {
-            ColumnDataTypes.Int64: [
-                7, 12, 15, 16, 17, 18, 19, 20, 21, 28, 29, 36, 37, 38
-            ],
-            ColumnDataTypes.Currency: [8, 10, 11],
-            ColumnDataTypes.Datetime: [13],
-            ColumnDataTypes.Double: [9, 10, 11, 14],
-            ColumnDataTypes.Boolean: [22]
-            # строковые значения [1, 2, 3, 4, 5, 6, 23, 24, 25, 26, 27, 30, 31, 32, 33, 34, 35, 39, 40, 41, 42]
-        }
+            table: Table,
+            table_rows: List
+    ) -> Iterator[Dict]:
+        '''Возвращает генератор строк таблицы PowerBI по строкам листа.'''
+        return self._get_transformer(table).transform(table_rows)
 
-        if column_headers:
-            for header_idx in range(len(column_headers)):
-                format_string = ''
-
-                try:
-                    data_type = ColumnDataTypes.String
-                    for k, v in data_types.items():
-                        if header_idx in v:
-
-                            if k == ColumnDataTypes.Currency:
-                                data_type = ColumnDataTypes.Double
-                                format_string = 'Currency'
-                            else:
-                                data_type = k
-                            break
-                except IndexError:
-                    logger.error('Index error in create pbi table.')
-                    data_type = 'String'
-
-                column_name = column_headers[header_idx]
-
-                column = Column(
-                    name=column_name,
-                    data_type=data_type,
-                    format_string=format_string
-                )
-                new_table.add_column(column)
+    def _get_transformer(self, table: Table) -> RowTransformer:
+        '''
+        Возвращает преобразователь строк таблицы.
 
-        return new_table
+        План преобразования хранится в разметке листа, при чтении
+        окнами и повторных синхронизациях он переиспользуется.
+        '''
+        return self._get_layout(table.name).get_transformer(
+            [column.name for column in table.columns], self.typed
+        )
 
-    def _add_rows(self, table: Table, table_rows: List) -> Table:
-        '''Добавляет строки в таблицу PowerBI.'''
-        self._table_rows[table.name] = []
-        table_columns = table.columns
-        int_values = [7, 8, 10, 11, 12, 29, 31, 32, 33]
-        double_values = [14]
-        bool_values = [22]
-        cities = [
-            'Москва', 'Санкт-Петербург', 'Казань', 'Краснодар',
-            'Екатеринбург', 'Новосибирск', 'Хабаровск'
-        ]
+    def _select_titles(self, sheet_titles: List[str]) -> List[str]:
+        '''Оставляет листы из заданного подмножества в порядке книги.'''
+        if not self.sheet_titles:
+            selected = list(sheet_titles)
+        else:
+            selected = [
+                title for title in sheet_titles if title in self.sheet_titles
+            ]
+            missing = set(self.sheet_titles) - set(selected)
+            if missing:
+                logger.warning(f'Sheets not found in file: {missing}')
+        self._selected_titles = selected
+        return selected
 
-        # Добавляются столбцы с подкатегориями
-        categories = {
-            'Категория.1': '',
-            'Категория.2': '',
-            'Категория.3': '',
-            'Категория.4': '',
-            'Категория.5': '',
-        }
-        shifted = False
-
-        for row in table_rows:
-            row_data = {}
-            for value_num in range(len(row)):
-
-                try:
-                    # Учитываем смещение индекса после разделения на подкатегории
-                    column_idx = value_num + 5 if shifted else value_num
-                    column_name = table_columns[column_idx].name
-                    row_value = (
-                        row[value_num] if row[value_num] else ''
-                    )
-                    if '₽' in row_value:
-                        row_value = row_value.replace('₽', '')
-                    if value_num in int_values:
-                        if not row_value:
-                            row_value = 0
-                        else:
-                            row_value = ''.join(row_value.split())
-                    elif column_name in cities:
-                        if not row_value:
-                            row_value = 0
-                    elif value_num in double_values and not row_value:
-                        row_value = 0.0
-                    elif value_num in bool_values and not row_value:
-                        row_value = False
-
-                    row_data[column_name] = row_value
-
-                    if column_name == 'Категория':
-                        shifted = True
-                        # Делим на подкатегории
-                        keys = list(categories.keys())
-                        sub_categories = row_value.split('/')
-                        last_idx = len(sub_categories) - 1
-                        for k_idx in range(len(keys)):
-                            if last_idx >= 0:
-                                last_idx -= 1
-                                categories[keys[k_idx]] = sub_categories[k_idx]
-                            else:
-                                break
-                        for k, v in categories.items():
-                            row_data[k] = v
-
-                    if value_num == len(row) - 1:
-                        shifted = False
-
-                except IndexError:
-                    logger.error('Index error in add rows', exc_info=True)
-                    column_name = 'Undefined'
-                    row_data[column_name] = row_value
-
-                except Exception as err:
-                    logger.error(f'Error in add rows {err}', exc_info=True)
-                    column_name = 'Undefined'
-                    row_data[column_name] = row_value
-
-            self._table_rows[table.name].append(row_data)
+    def _map_tables(
+            self,
+            load_table: Callable[[str], Optional[Table]],
+            sheet_titles: List[str]
+    ) -> List[Optional[Table]]:
+        '''
+        Загружает и преобразует листы функцией load_table.
+
+        При concurrency > 1 листы обрабатываются параллельно в пуле
+        потоков, порядок результата совпадает с порядком листов.
+        '''
+        if self.concurrency <= 1 or len(sheet_titles) <= 1:
+            return [load_table(title) for title in sheet_titles]
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix='sheet'
+        ) as executor:
+            return list(executor.map(load_table, sheet_titles))
 
     def _create_dataset(self) -> DatasetCreate:
+        '''Запрашивает листы гугл таблицы и создает объект DatasetCreate.'''
+        if self.window_rows:
+            return self._create_dataset_windowed()
+
+        sheet_titles = self._select_titles(get_sheet_titles(self.sheet_id))
+        if self.concurrency > 1:
+            return self._assemble_dataset(
+                self._map_tables(self._load_table, sheet_titles)
+            )
+
+        tables_values = self._get_tables_values(self.sheet_id, sheet_titles)
+        return self._build_dataset(tables_values)
+
+    def _load_table(self, range_title: str) -> Optional[Table]:
+        '''Запрашивает один лист и создает по нему таблицу PowerBI.'''
+        sheet_data = get_values(
+            self.sheet_id,
+            range_title,
+            revision=self.revision,
+            typed=self.typed
+        )
+        logger.info(f'Received data from {range_title}')
+        return self._build_table(range_title, sheet_data.get('values', []))
+
+    def _create_dataset_windowed(self) -> DatasetCreate:
+        '''
+        Создает объект DatasetCreate, читая листы окнами строк.
+
+        Заголовок берется из первого окна, строки каждого окна
+        преобразуются сразу после получения.
         '''
-        Создает объект DatasetCreate с таблицей данных.
+        sheets_properties = get_sheets_properties(self.sheet_id)
+        sheet_titles = self._select_titles(list(sheets_properties))
+
+        def load_table(range_title: str) -> Optional[Table]:
+            return self._load_table_windowed(
+                range_title, sheets_properties[range_title]
+            )
+
+        return self._assemble_dataset(
+            self._map_tables(load_table, sheet_titles)
+        )
+
+    def _load_table_windowed(
+            self,
+            range_title: str,
+            grid: Dict[str, int]
+    ) -> Optional[Table]:
+        '''
+        Читает лист окнами строк и создает по нему таблицу PowerBI.
+
+        Окнами читаются большие листы, поэтому строки хранятся
+        по столбцам в ColumnarTable: памяти нужно в 2.7-5.5 раза
+        меньше, но словари строк собираются при отправке.
+        '''
+        try:
+            layout = self._get_layout(range_title)
+            # В первое окно должны попасть строки заголовка
+            window_rows = max(self.window_rows, layout.data_start_idx)
+            # Размеры листа известны, окна не требуют доп. запросов
+            blocks = iter_values(
+                self.sheet_id,
+                range_title,
+                window_rows,
+                row_count=grid.get('rowCount', 0),
+                column_count=grid.get('columnCount', 0),
+                typed=self.typed
+            )
+            first_block = next(blocks, [])
+
+            header = layout.get_header(first_block)
+            pbi_table = self._create_pbi_table(header, range_title)
+
+            transformer = self._get_transformer(pbi_table)
+            table_rows = transformer.transform_table(
+                layout.get_rows(first_block)
+            )
+            row_count = len(first_block)
+            for block_num, block in enumerate(blocks, start=1):
+                transformer.transform_table(block, table_rows)
+                if block:
+                    # API не возвращает пустые строки в конце окна
+                    row_count = block_num * window_rows + len(block)
+            logger.info(f'Received {len(table_rows)} rows from {range_title}')
+
+            self._table_rows[pbi_table.name] = table_rows
+            self._set_tab_state(range_title, header, row_count)
+            return pbi_table
+        except SheetReadError:
+            # Без листа датасет неполный, перенос прерывается
+            raise
+        except Exception as err:
+            logger.error(f'Error create dataset {err}', exc_info=True)
+
+    async def _acreate_dataset(self) -> DatasetCreate:
+        '''Асинхронно запрашивает листы и создает объект DatasetCreate.'''
+        if self.window_rows:
+            return await asyncio.to_thread(self._create_dataset_windowed)
+
+        sheet_titles = self._select_titles(
+            await async_google_client.get_sheet_titles(self.sheet_id)
+        )
+        if self.concurrency > 1:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def load_table(range_title: str) -> Optional[Table]:
+                async with semaphore:
+                    sheet_data = await async_google_client.get_values(
+                        self.sheet_id,
+                        range_title,
+                        revision=self.revision,
+                        typed=self.typed
+                    )
+                    return await asyncio.to_thread(
+                        self._build_table,
+                        range_title,
+                        sheet_data.get('values', [])
+                    )
+
+            tables = await asyncio.gather(
+                *(load_table(title) for title in sheet_titles)
+            )
+            return self._assemble_dataset(tables)
+
+        tables_values = await async_google_client.get_batch_values(
+            self.sheet_id,
+            sheet_titles,
+            revision=self.revision,
+            typed=self.typed
+        )
+        logger.info(f'Received data from {len(tables_values)} sheets')
+        # Преобразование строк нагружает CPU, выносим из event loop
+        return await asyncio.to_thread(self._build_dataset, tables_values)
+
+    def _build_table(
+            self,
+            range_title: str,
+            values: List[List]
+    ) -> Optional[Table]:
+        '''
+        Создает таблицу PowerBI по значениям листа.
 
         Создает словарь с названием таблицы и ее строками.
         '''
-        new_dataset = DatasetCreate(name=self.table_file)
-        for range_title in get_sheet_titles(self.sheet_id):
-            try:
-                values = self._get_table_values(self.sheet_id, range_title)
+        try:
+            layout = self._get_layout(range_title)
+            header = layout.get_header(values)
 
-                columns = self._get_columns(values)
+            # Создать таблицу со столбцами и типами данных
+            pbi_table = self._create_pbi_table(header, range_title)
 
-                # Создать таблицу со столбцами и типами данных
-                pbi_table = self._create_pbi_table(
-                    columns,
-                    range_title
-                )
+            # Создаем словарь с соответствием столбца и строк
+            if len(values) >= layout.data_start_idx:
+                self._add_rows(pbi_table, layout.get_rows(values))
 
-                # Создаем словарь с соответствием столбца и строк
-                if len(values) > 2:
-                    self._add_rows(pbi_table, values[3:])
+            self._set_tab_state(range_title, header, len(values))
+            return pbi_table
+        except Exception as err:
+            logger.error(f'Error create dataset {err}', exc_info=True)
 
+    def _set_tab_state(
+            self,
+            range_title: str,
+            header: List,
+            row_count: int
+    ) -> None:
+        '''Запоминает число прочитанных строк листа и хеш заголовка.'''
+        self._tab_states[range_title] = {
+            'row_count': row_count,
+            'header_hash': get_header_hash(header),
+        }
+
+    def _build_dataset(
+            self,
+            tables_values: Dict[str, List[List]]
+    ) -> DatasetCreate:
+        '''Создает объект DatasetCreate с таблицами данных листов.'''
+        return self._assemble_dataset([
+            self._build_table(range_title, values)
+            for range_title, values in tables_values.items()
+        ])
+
+    def _assemble_dataset(
+            self,
+            tables: List[Optional[Table]]
+    ) -> DatasetCreate:
+        '''Собирает объект DatasetCreate из созданных таблиц.'''
+        new_dataset = DatasetCreate(name=self.table_file)
+        for pbi_table in tables:
+            if pbi_table is not None:
                 new_dataset.add_table(pbi_table)
-            except Exception as err:
-                logger.error(f'Error create dataset {err}', exc_info=True)
 
         new_dataset.clear_empty_data()
 
         return new_dataset
 
-    def _push_dataset(self) -> Dataset:
+    def _push_dataset(self, new_dataset: DatasetCreate) -> Dataset:
         '''
         Отправляет данные в PowerBI.
 
         Возвращает созданный Dataset и список созданных таблиц.
         '''
-        new_dataset = self._create_dataset()
         dataset_created = pbi.post_group_dataset(
             group=settings.PBI_GROUP,
             dataset=new_dataset,
@@ -240,42 +470,615 @@ class ApiExchangeFlowAllMarket:
             self,
             dataset: Dataset,
             table_name: str,
-            table_rows: List
+            table_rows: Sequence[Dict]
     ) -> None:
         '''Отправляет запрос на добавление строки в таблицу.'''
         logger.info(f'Adding rows to table {table_name}')
 
-        pbi.post_group_dataset_rows(
+        # Push API принимает не больше 10000 строк за запрос
+        chunks = pbi.post_group_dataset_rows_chunked(
             group_id=dataset.group_id,
             dataset_id=dataset.id,
             table_name=table_name,
-            rows=table_rows
+            rows=table_rows,
+            chunk_size=settings.PBI_ROWS_CHUNK_SIZE,
+            max_workers=settings.PBI_UPLOAD_MAX_CONCURRENCY
+        )
+        self._log_chunks(table_name, chunks)
+
+    async def _apost_dataset_rows(
+            self,
+            dataset: Dataset,
+            table_name: str,
+            table_rows: Sequence[Dict]
+    ) -> None:
+        '''Асинхронно отправляет строки таблицы частями.'''
+        logger.info(f'Adding rows to table {table_name}')
+
+        chunks = await async_pbi.post_group_dataset_rows_chunked(
+            group_id=dataset.group_id,
+            dataset_id=dataset.id,
+            table_name=table_name,
+            rows=table_rows,
+            chunk_size=settings.PBI_ROWS_CHUNK_SIZE,
+            max_workers=settings.PBI_UPLOAD_MAX_CONCURRENCY
+        )
+        self._log_chunks(table_name, chunks)
+
+    def _log_chunks(self, table_name: str, chunks: List[Dict]) -> None:
+        '''Логирует итог загрузки строк таблицы.'''
+        rows_count = sum(chunk['rows'] for chunk in chunks)
+        slowest = max((chunk['elapsed'] for chunk in chunks), default=0)
+        logger.info(
+            f'Added {rows_count} rows to {table_name} in {len(chunks)} '
+            f'requests, slowest {slowest:.3f}s.'
+        )
+
+    def _save_state(self, dataset_id: str, report_id: str) -> None:
+        '''
+        Сохраняет состояние синхронизации таблицы и ее листов.
+
+        Ревизия файла сохраняется, только если прочитаны все выбранные
+        листы. Иначе следующий запуск не пропускается как неизмененный
+        и перечитывает таблицу. Отпечатки строк сохраняются вместе
+        с датасетом в режиме delta и удаляются в остальных режимах,
+        которые пишут строки мимо них.
+        '''
+        revision = self.revision
+        unread = [
+            title for title in self._selected_titles
+            if title not in self._tab_states
+        ]
+        if unread:
+            logger.warning(
+                f'Sheets {unread} were not read, revision {revision} '
+                'is not saved.'
+            )
+            revision = None
+        sync_state.save_sheet_state(
+            sheet_id=self.sheet_id,
+            template_report_id=self.report_id,
+            revision=revision,
+            modified_time=self.modified_time,
+            dataset_id=dataset_id,
+            report_id=report_id,
+            sync_options=self._get_sync_options()
+        )
+        sync_state.save_tab_states(
+            self.sheet_id, self.report_id, self._tab_states
+        )
+        if self.mode == SyncMode.DELTA:
+            sync_state.save_stale_runs(
+                self.sheet_id, self.report_id, self._stale_runs
+            )
+            for table_name, rows in self._table_rows.items():
+                fingerprints = self._row_fingerprints.get(table_name)
+                if fingerprints is None:
+                    fingerprints = get_row_fingerprints(rows, self.delta_key)
+                sync_state.save_row_fingerprints(
+                    self.sheet_id, self.report_id, table_name, dataset_id,
+                    fingerprints
+                )
+        else:
+            sync_state.clear_delta_state(self.sheet_id, self.report_id)
+
+    async def _atransfer(self, new_dataset: DatasetCreate) -> Report:
+        '''
+        Асинхронный вариант _transfer.
+
+        Строки всех таблиц отправляются параллельно через общий пул
+        соединений асинхронного клиента PowerBI.
+        '''
+        dataset = await async_pbi.post_group_dataset(
+            group=settings.PBI_GROUP,
+            dataset=new_dataset,
+            default_retention_policy=None
+        )
+        await asyncio.gather(*(
+            self._apost_dataset_rows(dataset, table, rows)
+            for table, rows in self._table_rows.items()
+        ))
+        logger.info('Data transfer finished.')
+
+        report = await report_pool.aacquire(
+            self.report_id, self.table_file, dataset.id
+        )
+        if report is None:
+            logger.info(f'Cloning report {self.report_id}')
+
+            report = await async_pbi.clone_group_report(
+                group_id=settings.PBI_GROUP,
+                report_id=self.report_id,
+                name=self.table_file,
+                target_dataset=dataset.id
+            )
+
+            logger.info(f'Report {self.report_id} cloned.')
+        report_pool.refill(self.report_id, self.table_file)
+
+        await asyncio.to_thread(self._save_state, dataset.id, report.id)
+
+        return report
+
+    def _transfer(self, new_dataset: DatasetCreate) -> Report:
+        '''
+        Создает датасет в PowerBI, заполняет его строками и привязывает
+        к нему копию отчета из пула или клонирует отчет, если пул пуст.
+        '''
+        dataset = self._push_dataset(new_dataset)
+        for table, rows in self._table_rows.items():
+            self._post_dataset_rows(dataset, table, rows)
+        logger.info('Data transfer finished.')
+
+        report = self._get_report(dataset)
+        self._save_state(dataset.id, report.id)
+
+        return report
+
+    def _get_report(self, dataset: Dataset) -> Report:
+        '''
+        Привязывает к датасету копию отчета из пула или клонирует
+        отчет, если пул пуст.
+        '''
+        report = report_pool.acquire(
+            self.report_id, self.table_file, dataset.id
+        )
+        if report is None:
+            logger.info(f'Cloning report {self.report_id}')
+
+            report = pbi.clone_group_report(
+                group_id=settings.PBI_GROUP,
+                report_id=self.report_id,
+                name=self.table_file,
+                target_dataset=dataset.id
+            )
+
+            logger.info(f'Report {self.report_id} cloned.')
+        report_pool.refill(self.report_id, self.table_file)
+        return report
+
+    def _get_headers(self, sheet_titles: List[str]) -> Dict[str, List]:
+        '''Запрашивает строки заголовков листов одним запросом.'''
+        last_column = column_letter(LAST_COLUMN)
+        cell_ranges = []
+        for title in sheet_titles:
+            header_row = self._get_layout(title).layout.header_row
+            cell_ranges.append(
+                f"'{title}'!A{header_row}:{last_column}{header_row}"
+            )
+        ranges_values = get_batch_ranges(
+            self.sheet_id, cell_ranges, typed=self.typed
+        )
+        return {
+            title: header_values[0] if header_values else []
+            for title, header_values in zip(sheet_titles, ranges_values)
+        }
+
+    def _iter_table_rows(
+            self,
+            table: Table,
+            header: List,
+            grid: Dict[str, int]
+    ) -> Iterator[Dict]:
+        '''
+        Возвращает генератор строк таблицы PowerBI, читая лист окнами.
+
+        Следующее окно запрашивается, пока преобразуется текущее.
+        После последнего окна запоминает состояние листа.
+        '''
+        layout = self._get_layout(table.name)
+        # В первое окно должны попасть строки заголовка
+        window_rows = max(
+            self.window_rows or settings.GAPI_WINDOW_ROWS,
+            layout.data_start_idx
+        )
+        blocks = prefetch(iter_values(
+            self.sheet_id,
+            table.name,
+            window_rows,
+            row_count=grid.get('rowCount', 0),
+            column_count=grid.get('columnCount', 0),
+            typed=self.typed
+        ))
+        transformer = self._get_transformer(table)
+        row_count = 0
+        for block_num, block in enumerate(blocks):
+            if block_num == 0:
+                row_count = len(block)
+                block = layout.get_rows(block)
+            elif block:
+                # API не возвращает пустые строки в конце окна
+                row_count = block_num * window_rows + len(block)
+            yield from transformer.transform(block)
+        self._set_tab_state(table.name, header, row_count)
+
+    def _transfer_streaming(self) -> Report:
+        '''
+        Переносит листы в новый датасет, не собирая таблицы целиком.
+
+        По заголовкам листов создается датасет, затем строки каждого
+        листа читаются окнами, преобразуются генератором и частями
+        по PBI_ROWS_CHUNK_SIZE попадают в ограниченную очередь
+        загрузки. Чтение, преобразование и загрузка идут
+        одновременно, в памяти остаются только окна и части
+        в очереди, независимо от размера листа.
+        '''
+        sheets_properties = get_sheets_properties(self.sheet_id)
+        sheet_titles = self._select_titles(list(sheets_properties))
+        headers = self._get_headers(sheet_titles)
+
+        tables = []
+        for title in sheet_titles:
+            try:
+                tables.append(self._create_pbi_table(headers[title], title))
+            except Exception as err:
+                logger.error(f'Error create table {err}', exc_info=True)
+        dataset = self._push_dataset(self._assemble_dataset(tables))
+
+        def iter_table_chunks() -> Iterator[Tuple[str, List[Dict]]]:
+            for table in tables:
+                logger.info(f'Streaming rows to table {table.name}')
+                rows = self._iter_table_rows(
+                    table, headers[table.name], sheets_properties[table.name]
+                )
+                for chunk in iter_chunks(rows, settings.PBI_ROWS_CHUNK_SIZE):
+                    yield table.name, chunk
+
+        chunks = pbi.post_group_dataset_rows_stream(
+            group_id=dataset.group_id,
+            dataset_id=dataset.id,
+            chunks=iter_table_chunks(),
+            max_workers=settings.PBI_UPLOAD_MAX_CONCURRENCY,
+            queue_size=settings.PBI_UPLOAD_QUEUE_CHUNKS
+        )
+        for table in tables:
+            self._log_chunks(table.name, [
+                chunk for chunk in chunks if chunk['table'] == table.name
+            ])
+        logger.info('Data transfer finished.')
+
+        report = self._get_report(dataset)
+        self._save_state(dataset.id, report.id)
+
+        return report
+
+    def _get_existing_dataset(
+            self,
+            tables: List[Table]
+    ) -> Optional[Tuple[Dataset, str]]:
+        '''
+        Возвращает датасет и отчет прошлой синхронизации.
+
+        Возвращает None, если датасета нет или набор таблиц изменился
+        и нужен новый датасет.
+        '''
+        state = sync_state.get_sheet_state(self.sheet_id, self.report_id)
+        if not state or not state.get('dataset_id'):
+            logger.info('No previous sync found, new dataset required.')
+            return None
+
+        dataset = Dataset(
+            state.get('dataset_id'),
+            pbi.session,
+            group_id=settings.PBI_GROUP
+        )
+        try:
+            existing_tables = pbi.get_group_tables(
+                group_id=dataset.group_id,
+                dataset_id=dataset.id
+            )
+        except Exception as err:
+            logger.warning(
+                f'Dataset {dataset.id} unavailable {err}, '
+                'new dataset required.'
+            )
+            return None
+
+        if (
+            {table.name for table in tables}
+            != {table.get('name') for table in existing_tables}
+        ):
+            logger.info('Tables set changed, new dataset required.')
+            return None
+
+        return dataset, state.get('report_id')
+
+    def _rewrite_table(self, dataset: Dataset, table: Table) -> None:
+        '''Обновляет схему таблицы, удаляет строки и отправляет заново.'''
+        pbi.put_group_dataset(
+            group_id=dataset.group_id,
+            dataset_id=dataset.id,
+            table_name=table.name,
+            table=table
+        )
+        pbi.delete_group_dataset_rows(
+            group_id=dataset.group_id,
+            dataset_id=dataset.id,
+            table_name=table.name
+        )
+        self._post_dataset_rows(
+            dataset, table.name, self._table_rows.get(table.name, [])
+        )
+
+    def _reload(self, new_dataset: DatasetCreate) -> Optional[Report]:
+        '''
+        Перезаливает строки в ранее созданный датасет.
+
+        Схемы таблиц обновляются, строки удаляются и отправляются
+        заново, отчет не клонируется. Возвращает None, если нужен
+        новый датасет.
+        '''
+        tables = list(new_dataset.tables)
+        existing_dataset = self._get_existing_dataset(tables)
+        if existing_dataset is None:
+            return None
+        dataset, report_id = existing_dataset
+
+        for table in tables:
+            self._rewrite_table(dataset, table)
+        logger.info(f'Dataset {dataset.id} reloaded.')
+
+        self._save_state(dataset.id, report_id)
+
+        return Report(report_id, pbi.session, group_id=settings.PBI_GROUP)
+
+    def _push_delta(self, new_dataset: DatasetCreate) -> Optional[Report]:
+        '''
+        Отправляет в ранее созданный датасет только новые строки.
+
+        Строки сравниваются с сохраненными отпечатками по бизнес ключу.
+        Push датасет не позволяет изменить или удалить отдельные строки,
+        поэтому измененные и удаленные строки копятся со старыми
+        отпечатками, пока их доля не превысит delta_threshold, после
+        чего таблица перезаписывается целиком. При ненулевом
+        delta_threshold отчет до перезаписи показывает устаревшие
+        значения измененных строк и удаленные строки. Чтобы такие
+        строки не оставались в отчете бесконечно, таблица
+        перезаписывается и после ROW_DELTA_MAX_STALE_RUNS запусков
+        подряд с незаписанными изменениями. Возвращает None, если
+        нужен новый датасет.
+        '''
+        tables = list(new_dataset.tables)
+        existing_dataset = self._get_existing_dataset(tables)
+        if existing_dataset is None:
+            return None
+        dataset, report_id = existing_dataset
+
+        stale_runs = sync_state.get_stale_runs(self.sheet_id, self.report_id)
+        for table in tables:
+            stored = sync_state.get_row_fingerprints(
+                self.sheet_id, self.report_id, table.name, dataset.id
+            )
+            delta = compute_row_delta(
+                self._table_rows.get(table.name, []), self.delta_key, stored
+            )
+            logger.info(
+                f'Table {table.name}: {len(delta.inserted)} inserted, '
+                f'{len(delta.changed)} changed, {len(delta.deleted)} deleted'
+            )
+
+            runs = stale_runs.get(table.name, 0)
+            max_pending = self.delta_threshold * len(stored)
+            too_stale = (
+                delta.pending > 0
+                and runs >= settings.ROW_DELTA_MAX_STALE_RUNS
+            )
+            if not stored or delta.pending > max_pending or too_stale:
+                self._rewrite_table(dataset, table)
+                self._row_fingerprints[table.name] = delta.fingerprints
+                self._stale_runs[table.name] = 0
+                continue
+
+            if delta.inserted:
+                self._post_dataset_rows(
+                    dataset, table.name, list(delta.inserted.values())
+                )
+            # Отпечатки измененных и удаленных строк не обновляются,
+            # чтобы они учитывались при следующей синхронизации
+            self._row_fingerprints[table.name] = {
+                **stored,
+                **{key: delta.fingerprints[key] for key in delta.inserted},
+            }
+            self._stale_runs[table.name] = runs + 1 if delta.pending else 0
+            if delta.pending:
+                logger.warning(
+                    f'Table {table.name}: {len(delta.changed)} changed and '
+                    f'{len(delta.deleted)} deleted rows are not written, '
+                    f'stale for {runs + 1} of '
+                    f'{settings.ROW_DELTA_MAX_STALE_RUNS} runs.'
+                )
+
+        self._save_state(dataset.id, report_id)
+
+        return Report(report_id, pbi.session, group_id=settings.PBI_GROUP)
+
+    def _get_appended_rows(
+            self,
+            tab_states: Dict[str, Dict[str, Any]]
+    ) -> Optional[Dict[str, List[List]]]:
+        '''
+        Запрашивает строки, добавленные в листы после сохраненной отметки.
+
+        Заголовки и новые строки всех листов читаются одним запросом.
+        Возвращает None, если набор листов или заголовок какого-либо
+        листа изменился и нужна полная перезагрузка.
+        '''
+        sheet_titles = self._select_titles(get_sheet_titles(self.sheet_id))
+        if set(sheet_titles) != set(tab_states):
+            logger.info('Sheets set changed, full reload required.')
+            return None
+
+        last_column = column_letter(LAST_COLUMN)
+        cell_ranges = []
+        for title in sheet_titles:
+            layout = self._get_layout(title).layout
+            header_row = layout.header_row
+            first_row = max(
+                tab_states[title]['row_count'] + 1, layout.data_start_row
+            )
+            cell_ranges.append(
+                f"'{title}'!A{header_row}:{last_column}{header_row}"
+            )
+            cell_ranges.append(f"'{title}'!A{first_row}:{last_column}")
+
+        ranges_values = get_batch_ranges(
+            self.sheet_id, cell_ranges, typed=self.typed
+        )
+
+        appended_rows = {}
+        for title_num, title in enumerate(sheet_titles):
+            header_values = ranges_values[2 * title_num]
+            header = header_values[0] if header_values else []
+            if get_header_hash(header) != tab_states[title]['header_hash']:
+                logger.info(f'Header of {title} changed, full reload needed.')
+                return None
+            appended_rows[title] = (header, ranges_values[2 * title_num + 1])
+        return appended_rows
+
+    def _append(self) -> Optional[Report]:
+        '''
+        Дозагружает новые строки листов в ранее созданный датасет.
+
+        Работает для листов, которые растут только снизу: строки выше
+        сохраненной отметки повторно не читаются и не проверяются.
+        Возвращает None, если нужна полная перезагрузка.
+        '''
+        state = sync_state.get_sheet_state(self.sheet_id, self.report_id)
+        tab_states = sync_state.get_tab_states(self.sheet_id, self.report_id)
+        if not state or not state.get('dataset_id') or not tab_states:
+            logger.info('No previous sync found, full reload required.')
+            return None
+        if state.get('sync_options') != self._get_sync_options():
+            logger.info('Sync options changed, full reload required.')
+            return None
+
+        appended_rows = self._get_appended_rows(tab_states)
+        if appended_rows is None:
+            return None
+
+        dataset = Dataset(
+            state.get('dataset_id'),
+            pbi.session,
+            group_id=settings.PBI_GROUP
+        )
+        new_tab_states = {}
+        for title, (header, rows) in appended_rows.items():
+            tab_state = tab_states[title]
+            if rows:
+                pbi_table = self._create_pbi_table(header, title)
+                self._post_dataset_rows(
+                    dataset,
+                    title,
+                    list(self._transform_rows(pbi_table, rows))
+                )
+            # Первая запрошенная строка идет сразу за отметкой
+            row_count = max(
+                tab_state['row_count'], self._get_layout(title).data_start_idx
+            )
+            new_tab_states[title] = {
+                'row_count': row_count + len(rows),
+                'header_hash': tab_state['header_hash'],
+            }
+            logger.info(f'Appended {len(rows)} rows to {title}')
+
+        sync_state.save_sheet_state(
+            sheet_id=self.sheet_id,
+            template_report_id=self.report_id,
+            revision=self.revision,
+            modified_time=self.modified_time,
+            dataset_id=state.get('dataset_id'),
+            report_id=state.get('report_id'),
+            sync_options=self._get_sync_options()
+        )
+        sync_state.save_tab_states(
+            self.sheet_id, self.report_id, new_tab_states
+        )
+        if any(rows for _, rows in appended_rows.values()):
+            # Дозагруженных строк нет в отпечатках режима delta
+            sync_state.clear_delta_state(self.sheet_id, self.report_id)
+
+        return Report(
+            state.get('report_id'),
+            pbi.session,
+            group_id=settings.PBI_GROUP
         )
-        logger.info('Added rows to table.')
 
     def run(self) -> Report:
         '''
         Запускает процесс переноса данных из гугл таблицы.
 
         Создается таблица с данными в PowerBI и
-        подключается к клонированному отчету.
+        подключается к клонированному отчету. Если таблица не менялась
+        с последней синхронизации, возвращается ранее созданный отчет.
         '''
         try:
             logger.info('Starting data transfer.')
-            dataset = self._push_dataset()
-            for table, rows in self._table_rows.items():
-                self._post_dataset_rows(dataset, table, rows)
-            logger.info('Data transfer finished.')
+            self._set_file_info(self._get_file(self.sheet_id))
+            synced_report = self._get_synced_report()
+            if synced_report is not None:
+                return synced_report
 
-            logger.info(f'Cloning report {self.report_id}')
+            if self.mode == SyncMode.APPEND:
+                appended_report = self._append()
+                if appended_report is not None:
+                    return appended_report
 
-            cloned_report = pbi.report(
-                report=self.report_id, group=settings.PBI_GROUP
-            ).clone(name=self.table_file, target_dataset=dataset.id)
+            if self.stream and self.mode in (SyncMode.FULL, SyncMode.APPEND):
+                return self._transfer_streaming()
 
-            logger.info(f'Report {self.report_id} cloned.')
+            new_dataset = self._create_dataset()
+            if self.mode == SyncMode.RELOAD:
+                reloaded_report = self._reload(new_dataset)
+                if reloaded_report is not None:
+                    return reloaded_report
+            elif self.mode == SyncMode.DELTA:
+                delta_report = self._push_delta(new_dataset)
+                if delta_report is not None:
+                    return delta_report
+
+            return self._transfer(new_dataset)
+
+        except Exception as err:
+            logger.error(f'Error in data transfer {err}.', exc_info=True)
+
+    async def arun(self) -> Report:
+        '''
+        Асинхронный вариант run для вызова из обработчиков FastAPI.
+
+        Данные из гугл таблицы запрашиваются и отправляются в PowerBI
+        без блокировки event loop.
+        '''
+        try:
+            logger.info('Starting data transfer.')
+            self._set_file_info(await self._aget_file(self.sheet_id))
+            # Состояние читается из SQLite, выносим из event loop
+            synced_report = await asyncio.to_thread(self._get_synced_report)
+            if synced_report is not None:
+                return synced_report
+
+            if self.mode == SyncMode.APPEND:
+                appended_report = await asyncio.to_thread(self._append)
+                if appended_report is not None:
+                    return appended_report
+
+            if self.stream and self.mode in (SyncMode.FULL, SyncMode.APPEND):
+                return await asyncio.to_thread(self._transfer_streaming)
+
+            new_dataset = await self._acreate_dataset()
+            if self.mode == SyncMode.RELOAD:
+                reloaded_report = await asyncio.to_thread(
+                    self._reload, new_dataset
+                )
+                if reloaded_report is not None:
+                    return reloaded_report
+            elif self.mode == SyncMode.DELTA:
+                delta_report = await asyncio.to_thread(
+                    self._push_delta, new_dataset
+                )
+                if delta_report is not None:
+                    return delta_report
 
-            return cloned_report
+            return await self._atransfer(new_dataset)
 
         except Exception as err:
             logger.error(f'Error in data transfer {err}.', exc_info=True)
@@ -0,0 +1,220 @@
+import gc
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import (
+    Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple, Union
+)
+
+import numpy as np
+
+# Число строк, которые собираются в словари за один раз при обходе
+ROWS_BLOCK = 10000
+# Доля различных значений столбца, выше которой он не кодируется словарем
+MAX_DISTINCT_SHARE = 0.5
+
+
+class DictionaryColumn(NamedTuple):
+    '''Столбец, закодированный словарем: номера значений и сами значения.'''
+    codes: np.ndarray
+    values: np.ndarray
+
+
+EncodedColumn = Union[np.ndarray, DictionaryColumn]
+
+
+@contextmanager
+def paused_gc() -> Iterator[None]:
+    '''
+    Отключает сборщик циклических ссылок на время блока.
+
+    Используется, пока создаются тысячи словарей строк без циклических
+    ссылок: иначе сборщик многократно обходит все живые объекты.
+    '''
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def encode_column(values: Sequence[Any]) -> EncodedColumn:
+    '''
+    Кодирует столбец значений.
+
+    Столбцы только из целых, дробных или логических значений хранятся
+    массивами numpy, остальные кодируются словарем, если значения
+    в столбце повторяются. Значения разных типов, равные друг другу
+    (1, 1.0 и True), в словаре не смешиваются, поэтому строки
+    восстанавливаются без изменений.
+    '''
+    types = set(map(type, values))
+    if types == {bool}:
+        return np.array(values, dtype=np.bool_)
+    if types == {float}:
+        return np.array(values, dtype=np.float64)
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+
+    only_str = types <= {str}
+    keys = values if only_str else list(zip(map(type, values), values))
+    index = dict.fromkeys(keys)
+    if len(index) > len(values) * MAX_DISTINCT_SHARE:
+        # Словарь почти не сокращает столбец из уникальных значений
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+    distinct = np.empty(len(index), dtype=object)
+    distinct[:] = list(index) if only_str else [value for _, value in index]
+    for code, key in enumerate(index):
+        index[key] = code
+    return DictionaryColumn(
+        codes=np.fromiter(
+            map(index.__getitem__, keys),
+            dtype=np.min_scalar_type(len(index)),
+            count=len(keys)
+        ),
+        values=distinct
+    )
+
+
+def decode_column(column: EncodedColumn, start: int, stop: int) -> List:
+    '''Возвращает значения столбца с start по stop не включительно.'''
+    if isinstance(column, DictionaryColumn):
+        return column.values[column.codes[start:stop]].tolist()
+    return column[start:stop].tolist()
+
+
+def get_column_nbytes(column: EncodedColumn) -> int:
+    '''Возвращает размер массивов столбца в байтах.'''
+    if isinstance(column, DictionaryColumn):
+        return column.codes.nbytes + column.values.nbytes
+    return column.nbytes
+
+
+class RecordBatch(NamedTuple):
+    '''Закодированная пачка строк таблицы.'''
+    # Столбцы в порядке столбцов таблицы PowerBI
+    columns: Tuple[EncodedColumn, ...]
+    # Число ячеек строки листа, по нему выбираются названия столбцов
+    sizes: np.ndarray
+    # Значения столбца Undefined по номеру строки в пачке
+    undefined: Dict[int, Any]
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+
+class ColumnarTable:
+    '''
+    Преобразованные строки таблицы PowerBI в виде столбцов.
+
+    Строки хранятся пачками, как их выдает RowTransformer: названия
+    столбцов не повторяются в каждой строке, числа хранятся массивами
+    numpy, повторяющиеся строки - словарем значений. Словари строк для
+    push API собираются только при обращении к срезу таблицы, поэтому
+    при загрузке частями в памяти есть только отправляемая часть.
+    Сборка части дороже ее сериализации: таблица экономит память,
+    а не время, и нужна там, где строк больше, чем помещается
+    словарями.
+
+    Поддерживает len, срезы и обход, как список строк.
+    '''
+
+    def __init__(self, names_by_size: Sequence[Tuple[str, ...]]):
+        self.names_by_size = tuple(names_by_size)
+        self.batches: List[RecordBatch] = []
+        # Номер первой строки каждой пачки
+        self._offsets: List[int] = []
+        self._length = 0
+
+    def append(
+            self,
+            columns: Sequence[Sequence[Any]],
+            sizes: Sequence[int],
+            undefined: Dict[int, Any] = None
+    ) -> None:
+        '''Кодирует и добавляет пачку строк, заданную столбцами.'''
+        if not sizes:
+            return
+        self.batches.append(RecordBatch(
+            columns=tuple(map(encode_column, columns)),
+            sizes=np.array(
+                sizes,
+                dtype=np.min_scalar_type(len(self.names_by_size))
+            ),
+            undefined=dict(undefined or {})
+        ))
+        self._offsets.append(self._length)
+        self._length += len(sizes)
+
+    def rows(self, start: int = 0, stop: int = None) -> List[Dict[str, Any]]:
+        '''Собирает строки таблицы с start по stop не включительно.'''
+        start, stop, _ = slice(start, stop).indices(self._length)
+        rows = []
+        if start >= stop:
+            return rows
+        batch_num = bisect_right(self._offsets, start) - 1
+        while batch_num < len(self.batches) and len(rows) < stop - start:
+            batch = self.batches[batch_num]
+            offset = self._offsets[batch_num]
+            first = max(start - offset, 0)
+            last = min(stop - offset, len(batch))
+            rows.extend(self._batch_rows(batch, first, last))
+            batch_num += 1
+        return rows
+
+    def _batch_rows(
+            self,
+            batch: RecordBatch,
+            start: int,
+            stop: int
+    ) -> List[Dict[str, Any]]:
+        '''Собирает строки пачки с start по stop не включительно.'''
+        values = [
+            decode_column(column, start, stop) for column in batch.columns
+        ]
+        with paused_gc():
+            rows = list(map(dict, map(
+                zip,
+                map(
+                    self.names_by_size.__getitem__,
+                    batch.sizes[start:stop].tolist()
+                ),
+                zip(*values)
+            )))
+        for row_num, value in batch.undefined.items():
+            if start <= row_num < stop:
+                rows[row_num - start]['Undefined'] = value
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        '''Размер массивов таблицы в байтах без самих строковых значений.'''
+        return sum(
+            batch.sizes.nbytes + sum(map(get_column_nbytes, batch.columns))
+            for batch in self.batches
+        )
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('Slice step is not supported')
+            return self.rows(key.start, key.stop)
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('Row index out of range')
+        return self.rows(key, key + 1)[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for start in range(0, self._length, ROWS_BLOCK):
+            yield from self.rows(start, start + ROWS_BLOCK)
@@ -1,75 +1,468 @@
+import hashlib
+import json
 import logging
-from typing import Any, Dict
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
 
 # from google.auth.transport.requests import Request
 # from google.oauth2.credentials import Credentials
 # from google_auth_oauthlib.flow import InstalledAppFlow
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build, Resource
 # from googleapiclient.errors import HttpError
 from google.oauth2.service_account import Credentials
 
 from src.core.config import settings
+from .rate_limiter import execute_with_backoff, sheets_read_limiter
+from .values_cache import values_cache
 
 logger = logging.getLogger(__name__)
 
+# Последний запрашиваемый столбец листа (AL)
+LAST_COLUMN = 38
+# Маски полей для частичных ответов API
+FILE_FIELDS = 'id,name'
+FILE_REVISION_FIELDS = 'id,name,modifiedTime,version,headRevisionId'
+SHEET_PROPERTIES_FIELDS = 'sheets.properties(title,gridProperties)'
+# Параметры запроса значений в исходных типах без форматирования
+TYPED_RENDER_OPTIONS = {
+    'valueRenderOption': 'UNFORMATTED_VALUE',
+    'dateTimeRenderOption': 'SERIAL_NUMBER',
+}
+# Пути API относительно GAPI_ENDPOINT, api_endpoint заменяет
+# базовый адрес сервиса вместе с путем
+SERVICE_PATHS = {'sheets': '', 'drive': 'drive/v3/'}
+# Дата, от которой гугл таблицы отсчитывают серийные номера дат
+SERIAL_NUMBER_EPOCH = datetime(1899, 12, 30)
+
+
+class SheetReadError(Exception):
+    '''
+    Значения листов не удалось прочитать после всех повторов.
+
+    Перенос с такой ошибкой прерывается, чтобы не опубликовать
+    датасет без части листов.
+    '''
+
+
+class GoogleClientRegistry:
+    '''
+    Реестр долгоживущих клиентов Google API на процесс.
+
+    Credentials читаются из файла один раз и переиспользуются всеми
+    потоками, google-auth сам обновляет токен перед истечением.
+    Объекты Resource и их httplib2-соединения не потокобезопасны,
+    поэтому хранятся отдельно для каждого потока и держат keep-alive
+    соединение между вызовами.
+    '''
+
+    def __init__(self, creds_file: str, scopes: str):
+        self.creds_file = creds_file
+        self.scopes = scopes.split()
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def get_credentials(self) -> Credentials:
+        '''Возвращает общий объект Credentials сервисного аккаунта.'''
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = (
+                        Credentials.from_service_account_file(
+                            filename=self.creds_file,
+                            scopes=self.scopes
+                        )
+                    )
+        return self._credentials
+
+    def get_service(self, service_name: str, version: str) -> Resource:
+        '''Возвращает закешированный для текущего потока Resource.'''
+        services: Dict[Tuple[str, str], Resource] = getattr(
+            self._local, 'services', None
+        )
+        if services is None:
+            services = self._local.services = {}
+
+        key = (service_name, version)
+        service = services.get(key)
+        if service is not None:
+            with self._lock:
+                self.hits += 1
+            return service
+
+        http = AuthorizedHttp(self.get_credentials(), http=httplib2.Http())
+        # Адрес API переопределяется для работы с локальным стендом
+        client_options = None
+        if settings.GAPI_ENDPOINT:
+            client_options = {
+                'api_endpoint': (
+                    f'{settings.GAPI_ENDPOINT.rstrip("/")}/'
+                    f'{SERVICE_PATHS.get(service_name, "")}'
+                )
+            }
+        service = build(
+            service_name,
+            version,
+            http=http,
+            cache_discovery=False,
+            client_options=client_options
+        )
+        services[key] = service
+        with self._lock:
+            self.misses += 1
+        logger.debug(
+            f'Built {service_name} {version} client '
+            f'for thread {threading.get_ident()}'
+        )
+        return service
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает счетчики попаданий и промахов реестра.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset(self) -> None:
+        '''
+        Сбрасывает credentials и счетчики.
+
+        Клиенты других потоков пересоздаются при следующем обращении.
+        '''
+        with self._lock:
+            self._credentials = None
+            self._local = threading.local()
+            self.hits = 0
+            self.misses = 0
+
+
+client_registry = GoogleClientRegistry(
+    creds_file=settings.GAPI_CREDS,
+    scopes=settings.GAPI_SCOPES
+)
+
 
 def get_credentials() -> Credentials:
     '''Возвращает объект с данными для авторизации через сервисный аккаунт.'''
-    creds = Credentials.from_service_account_file(
-      filename=settings.GAPI_CREDS,
-      scopes=settings.GAPI_SCOPES.split()
-    )
-    return creds
+    return client_registry.get_credentials()
 
 
 def get_tables_service() -> Resource:
     '''Возврщает объект для взаимодействия Google API.'''
-    creds = get_credentials()
-    return build('sheets', 'v4', credentials=creds)
+    return client_registry.get_service('sheets', 'v4')
 
 
 def get_drive_service() -> Resource:
     '''Возврщает объект для взаимодействия Google API.'''
-    creds = get_credentials()
-    return build('drive', 'v3', credentials=creds)
+    return client_registry.get_service('drive', 'v3')
 
 
-def get_file(file_id: str) -> Dict[str, Any]:
-    '''Возвращает инфо о файле с гугл диска по id файла.'''
+def get_file(file_id: str, fields: str = FILE_FIELDS) -> Dict[str, Any]:
+    '''
+    Возвращает инфо о файле с гугл диска по id файла.
+
+    В ответ попадают только поля из маски fields.
+    '''
     client = get_drive_service()
-    file = client.files().get(fileId=file_id).execute()
+    file = execute_with_backoff(
+        client.files().get(fileId=file_id, fields=fields)
+    )
     return file
 
 
-def get_values(sheet_id: str, cell_range: str = None) -> Dict[str, Any]:
+def column_letter(column_number: int) -> str:
+    '''Возвращает буквенное обозначение столбца по его номеру с 1.'''
+    letters = ''
+    while column_number > 0:
+        column_number, remainder = divmod(column_number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def get_cell_range(sheet_title: str = None) -> str:
+    '''Возвращает диапазон ячеек в нотации A1 для листа.'''
+    if sheet_title is None:
+        return 'A:Z'
+    return f"'{sheet_title}'!A:AL"
+
+
+def get_render_options(typed: bool) -> Dict[str, str]:
+    '''Возвращает параметры отображения значений для запроса.'''
+    return TYPED_RENDER_OPTIONS if typed else {}
+
+
+def get_cache_range(cell_range: str, typed: bool) -> str:
+    '''Возвращает ключ диапазона для кеша с учетом режима значений.'''
+    return f'{cell_range}#typed' if typed else cell_range
+
+
+def serial_number_to_iso(serial_number: float) -> str:
+    '''Переводит серийный номер даты гугл таблиц в строку ISO 8601.'''
+    return (
+        SERIAL_NUMBER_EPOCH + timedelta(days=serial_number)
+    ).isoformat()
+
+
+def get_file_revision(file: Dict[str, Any]) -> str:
+    '''
+    Возвращает идентификатор ревизии файла по ответу files.get.
+
+    headRevisionId есть только у загруженных файлов, для гугл таблиц
+    используется монотонно растущий version.
+    '''
+    return (
+        file.get('headRevisionId')
+        or file.get('version')
+        or file.get('modifiedTime')
+    )
+
+
+def get_values(
+        sheet_id: str,
+        cell_range: str = None,
+        revision: str = None,
+        typed: bool = False
+) -> Dict[str, Any]:
     '''
     Возвращает список со значениями заданных ячеек из заданной таблицы.
 
     По умолчанию cell_range охватывает все стобцы и строки от A до ZZZZZZZZ.
+    Если передана ревизия файла, значения читаются из кеша на диске.
+    При typed=True значения приходят в исходных типах: числа, bool и
+    серийные номера дат вместо отформатированных строк.
+    Если значения не удалось прочитать, вызывает SheetReadError.
     '''
     try:
-        if cell_range is None:
-            cell_range = 'A:Z'
-        else:
-            cell_range = f"'{cell_range}'!A:AL"
+        cell_range = get_cell_range(cell_range)
+        cache_range = get_cache_range(cell_range, typed)
+        if revision:
+            cached = values_cache.get(sheet_id, cache_range, revision)
+            if cached is not None:
+                return {'range': cell_range, 'values': cached}
+
         client = get_tables_service()
         sheet = client.spreadsheets()
-        values = sheet.values().get(
-            spreadsheetId=sheet_id, range=cell_range
-        ).execute()
+        values = execute_with_backoff(
+            sheet.values().get(
+                spreadsheetId=sheet_id,
+                range=cell_range,
+                **get_render_options(typed)
+            ),
+            sheets_read_limiter
+        )
+
+        if revision:
+            values_cache.set(
+                sheet_id, cache_range, revision, values.get('values', [])
+            )
         return values
     except Exception as err:
         logger.error(f'Error getting values {err}', exc_info=True)
+        raise SheetReadError(f'Cannot read {cell_range}: {err}') from err
 
 
-def get_sheet_titles(sheet_id: str) -> Dict:
-    '''Возвращает генератор с именем всех листов в файле.'''
+def get_batch_values(
+        sheet_id: str,
+        sheet_titles: List[str],
+        revision: str = None,
+        typed: bool = False
+) -> Dict[str, List[List]]:
+    '''
+    Возвращает значения нескольких листов одним запросом batchGet.
+
+    Ключ словаря - название листа, значение - список строк листа.
+    Если передана ревизия файла, из гугл запрашиваются только листы,
+    которых нет в кеше на диске. Если какой-либо лист не удалось
+    прочитать, вызывает SheetReadError.
+    '''
+    tables_values = {}
+    missing_titles = []
+    for title in sheet_titles:
+        cached = None
+        if revision:
+            cached = values_cache.get(
+                sheet_id, get_cache_range(get_cell_range(title), typed),
+                revision
+            )
+        if cached is None:
+            missing_titles.append(title)
+        else:
+            tables_values[title] = cached
+
+    if missing_titles:
+        try:
+            client = get_tables_service()
+            sheet = client.spreadsheets()
+            response = execute_with_backoff(
+                sheet.values().batchGet(
+                    spreadsheetId=sheet_id,
+                    ranges=[get_cell_range(title) for title in missing_titles],
+                    **get_render_options(typed)
+                ),
+                sheets_read_limiter
+            )
+
+            # valueRanges возвращаются в порядке запрошенных диапазонов
+            value_ranges = response.get('valueRanges', [])
+            for title, value_range in zip(missing_titles, value_ranges):
+                values = value_range.get('values', [])
+                tables_values[title] = values
+                if revision:
+                    values_cache.set(
+                        sheet_id,
+                        get_cache_range(get_cell_range(title), typed),
+                        revision,
+                        values
+                    )
+        except Exception as err:
+            logger.error(f'Error getting batch values {err}', exc_info=True)
+            raise SheetReadError(
+                f'Cannot read sheets {missing_titles}: {err}'
+            ) from err
+
+    return get_requested_values(tables_values, sheet_titles)
+
+
+def get_requested_values(
+        tables_values: Dict[str, List[List]],
+        sheet_titles: List[str]
+) -> Dict[str, List[List]]:
+    '''
+    Возвращает значения листов в порядке sheet_titles.
+
+    Если значений какого-либо листа нет в ответе, вызывает
+    SheetReadError.
+    '''
+    missing = [title for title in sheet_titles if title not in tables_values]
+    if missing:
+        raise SheetReadError(f'No values received for sheets {missing}')
+    return {title: tables_values[title] for title in sheet_titles}
+
+
+def get_batch_ranges(
+        sheet_id: str,
+        cell_ranges: List[str],
+        typed: bool = False
+) -> List[List[List]]:
+    '''
+    Возвращает значения произвольных диапазонов одним запросом batchGet.
+
+    Значения возвращаются в порядке запрошенных диапазонов, кеш на диске
+    не используется.
+    '''
+    client = get_tables_service()
+    response = execute_with_backoff(
+        client.spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=cell_ranges,
+            **get_render_options(typed)
+        ),
+        sheets_read_limiter
+    )
+    return [
+        value_range.get('values', [])
+        for value_range in response.get('valueRanges', [])
+    ]
+
+
+def get_header_hash(header: List[Any]) -> str:
+    '''Возвращает хеш строки заголовка листа.'''
+    return hashlib.sha256(
+        json.dumps([str(value) for value in header]).encode()
+    ).hexdigest()
+
+
+def get_grid_properties(sheet_id: str, sheet_title: str) -> Dict[str, int]:
+    '''Возвращает rowCount и columnCount листа.'''
+    client = get_tables_service()
+    sheets = execute_with_backoff(
+        client.spreadsheets().get(
+            spreadsheetId=sheet_id,
+            ranges=[f"'{sheet_title}'"],
+            fields=SHEET_PROPERTIES_FIELDS
+        ),
+        sheets_read_limiter
+    )
+    properties = sheets.get('sheets')[0].get('properties')
+    return properties.get('gridProperties', {})
+
+
+def iter_values(
+        sheet_id: str,
+        sheet_title: str,
+        window_rows: int = settings.GAPI_WINDOW_ROWS,
+        row_count: int = None,
+        column_count: int = None,
+        typed: bool = False
+) -> Iterator[List[List]]:
+    '''
+    Постранично читает лист окнами по window_rows строк.
+
+    Возвращает генератор блоков строк, например A1:AL5000,
+    затем A5001:AL10000, и останавливается на реальном rowCount листа.
+    Если размеры листа не переданы, они запрашиваются отдельно.
+    Пустые строки в конце окна API не возвращает.
+    '''
+    if row_count is None or column_count is None:
+        grid = get_grid_properties(sheet_id, sheet_title)
+        row_count = grid.get('rowCount', 0)
+        column_count = grid.get('columnCount', LAST_COLUMN)
+
+    last_column = column_letter(min(column_count, LAST_COLUMN))
+    sheet = get_tables_service().spreadsheets()
+
+    for first_row in range(1, row_count + 1, window_rows):
+        last_row = min(first_row + window_rows - 1, row_count)
+        cell_range = f"'{sheet_title}'!A{first_row}:{last_column}{last_row}"
+        try:
+            values = execute_with_backoff(
+                sheet.values().get(
+                    spreadsheetId=sheet_id,
+                    range=cell_range,
+                    **get_render_options(typed)
+                ),
+                sheets_read_limiter
+            )
+        except Exception as err:
+            logger.error(f'Error getting window {err}', exc_info=True)
+            raise SheetReadError(f'Cannot read {cell_range}: {err}') from err
+        logger.debug(f'Received window {cell_range}')
+        yield values.get('values', [])
+
+
+def get_sheets_properties(sheet_id: str) -> Dict[str, Dict[str, int]]:
+    '''
+    Возвращает размеры листов файла по их названиям.
+
+    Запрашивает только title и gridProperties листов, значение
+    словаря содержит rowCount и columnCount листа. Если метаданные
+    не удалось прочитать, вызывает SheetReadError.
+    '''
+    sheets_properties = {}
     try:
         client = get_tables_service()
-        sheet = client.spreadsheets()
-        sheets = sheet.get(spreadsheetId=sheet_id).execute()
+        sheets = execute_with_backoff(
+            client.spreadsheets().get(
+                spreadsheetId=sheet_id,
+                fields=SHEET_PROPERTIES_FIELDS
+            ),
+            sheets_read_limiter
+        )
 
-        for sheet in sheets.get('sheets')[:1]:
-            yield sheet.get('properties').get('title')
+        for sheet in sheets.get('sheets', []):
+            properties = sheet.get('properties')
+            sheets_properties[properties.get('title')] = properties.get(
+                'gridProperties', {}
+            )
     except Exception as err:
         logger.error(f'Error get sheets {err}', exc_info=True)
+        raise SheetReadError(f'Cannot read sheets of {sheet_id}') from err
+    return sheets_properties
+
+
+def get_sheet_titles(sheet_id: str) -> Dict:
+    '''Возвращает генератор с именем всех листов в файле.'''
+    yield from get_sheets_properties(sheet_id)
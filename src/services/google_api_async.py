@@ -0,0 +1,280 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+from google.auth.transport.requests import Request
+
+from src.core.config import settings
+from .google_api import (
+    FILE_FIELDS, SHEET_PROPERTIES_FIELDS, SheetReadError, get_cache_range,
+    get_cell_range, get_credentials, get_render_options,
+    get_requested_values
+)
+from .rate_limiter import (
+    RETRY_STATUSES, QuotaLimiter, get_retry_delay, parse_retry_after,
+    sheets_read_limiter
+)
+from .values_cache import values_cache
+
+logger = logging.getLogger(__name__)
+
+SHEETS_API_URL = (
+    f'{settings.GAPI_ENDPOINT or "https://sheets.googleapis.com"}'
+    '/v4/spreadsheets'
+)
+DRIVE_API_URL = (
+    f'{settings.GAPI_ENDPOINT or "https://www.googleapis.com"}'
+    '/drive/v3/files'
+)
+
+
+class AsyncGoogleClient:
+    '''
+    Асинхронный клиент Google Sheets/Drive API.
+
+    Работает через общий пул keep-alive соединений httpx.AsyncClient и
+    использует те же credentials сервисного аккаунта, что и синхронный
+    клиент. Обновление токена выполняется в отдельном потоке, чтобы не
+    блокировать event loop.
+    '''
+
+    def __init__(
+            self,
+            max_connections: int = settings.GAPI_MAX_CONNECTIONS,
+            max_keepalive_connections: int = settings.GAPI_MAX_CONNECTIONS,
+            timeout: float = settings.GAPI_TIMEOUT
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        '''Возвращает общий httpx.AsyncClient, создавая его при первом вызове.'''
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout
+            )
+        return self._client
+
+    async def _get_token(self) -> str:
+        '''Возвращает действующий токен, обновляя его при необходимости.'''
+        creds = get_credentials()
+        if creds.valid:
+            return creds.token
+
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if not creds.valid:
+                await asyncio.to_thread(creds.refresh, Request())
+        return creds.token
+
+    async def _get(
+            self,
+            url: str,
+            params: Dict[str, Any] = None,
+            limiter: Optional[QuotaLimiter] = None
+    ) -> Dict[str, Any]:
+        '''
+        Выполняет авторизованный GET запрос и возвращает json ответа.
+
+        Перед каждой попыткой ждет токен лимитера, на 429 и 5xx
+        повторяет запрос с учетом Retry-After и экспоненциальной паузы.
+        '''
+        max_retries = settings.GAPI_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            if limiter is not None:
+                await limiter.aacquire()
+            token = await self._get_token()
+            response = await self._get_client().get(
+                url,
+                params=params,
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            if (
+                response.status_code in RETRY_STATUSES
+                and attempt < max_retries
+            ):
+                delay = get_retry_delay(
+                    attempt,
+                    parse_retry_after(response.headers.get('retry-after'))
+                )
+                if limiter is not None:
+                    limiter.record_retry()
+                logger.warning(
+                    f'Google API responded {response.status_code}, '
+                    f'retry {attempt + 1} in {delay:.1f}s'
+                )
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def get_file(
+            self,
+            file_id: str,
+            fields: str = FILE_FIELDS
+    ) -> Dict[str, Any]:
+        '''Возвращает инфо о файле с гугл диска по id файла.'''
+        return await self._get(
+            f'{DRIVE_API_URL}/{file_id}', params={'fields': fields}
+        )
+
+    async def get_spreadsheet(
+            self,
+            sheet_id: str,
+            fields: str = None
+    ) -> Dict[str, Any]:
+        '''Возвращает метаданные таблицы (spreadsheets.get).'''
+        params = {'fields': fields} if fields else None
+        return await self._get(
+            f'{SHEETS_API_URL}/{sheet_id}', params, sheets_read_limiter
+        )
+
+    async def get_values(
+            self,
+            sheet_id: str,
+            cell_range: str = None,
+            revision: str = None,
+            typed: bool = False
+    ) -> Dict[str, Any]:
+        '''
+        Возвращает значения заданных ячеек из заданной таблицы.
+
+        Если передана ревизия файла, значения читаются из кеша на диске.
+        Если значения не удалось прочитать, вызывает SheetReadError.
+        '''
+        try:
+            cell_range = get_cell_range(cell_range)
+            cache_range = get_cache_range(cell_range, typed)
+            if revision:
+                cached = await asyncio.to_thread(
+                    values_cache.get, sheet_id, cache_range, revision
+                )
+                if cached is not None:
+                    return {'range': cell_range, 'values': cached}
+
+            values = await self._get(
+                f'{SHEETS_API_URL}/{sheet_id}/values/'
+                f'{quote(cell_range, safe="")}',
+                params=get_render_options(typed),
+                limiter=sheets_read_limiter
+            )
+
+            if revision:
+                await asyncio.to_thread(
+                    values_cache.set,
+                    sheet_id, cache_range, revision, values.get('values', [])
+                )
+            return values
+        except Exception as err:
+            logger.error(f'Error getting values {err}', exc_info=True)
+            raise SheetReadError(f'Cannot read {cell_range}: {err}') from err
+
+    async def get_batch_values(
+            self,
+            sheet_id: str,
+            sheet_titles: List[str],
+            revision: str = None,
+            typed: bool = False
+    ) -> Dict[str, List[List]]:
+        '''
+        Возвращает значения нескольких листов одним запросом batchGet.
+
+        Если передана ревизия файла, из гугл запрашиваются только листы,
+        которых нет в кеше на диске. Если какой-либо лист не удалось
+        прочитать, вызывает SheetReadError.
+        '''
+        tables_values = {}
+        missing_titles = []
+        for title in sheet_titles:
+            cached = None
+            if revision:
+                cached = await asyncio.to_thread(
+                    values_cache.get,
+                    sheet_id,
+                    get_cache_range(get_cell_range(title), typed),
+                    revision
+                )
+            if cached is None:
+                missing_titles.append(title)
+            else:
+                tables_values[title] = cached
+
+        if missing_titles:
+            try:
+                response = await self._get(
+                    f'{SHEETS_API_URL}/{sheet_id}/values:batchGet',
+                    params={
+                        'ranges': [
+                            get_cell_range(title) for title in missing_titles
+                        ],
+                        **get_render_options(typed)
+                    },
+                    limiter=sheets_read_limiter
+                )
+                value_ranges = response.get('valueRanges', [])
+                for title, value_range in zip(missing_titles, value_ranges):
+                    values = value_range.get('values', [])
+                    tables_values[title] = values
+                    if revision:
+                        await asyncio.to_thread(
+                            values_cache.set,
+                            sheet_id,
+                            get_cache_range(get_cell_range(title), typed),
+                            revision,
+                            values
+                        )
+            except Exception as err:
+                logger.error(
+                    f'Error getting batch values {err}', exc_info=True
+                )
+                raise SheetReadError(
+                    f'Cannot read sheets {missing_titles}: {err}'
+                ) from err
+
+        return get_requested_values(tables_values, sheet_titles)
+
+    async def get_sheets_properties(
+            self,
+            sheet_id: str
+    ) -> Dict[str, Dict[str, int]]:
+        '''
+        Возвращает размеры листов файла по их названиям.
+
+        Если метаданные не удалось прочитать, вызывает SheetReadError.
+        '''
+        sheets_properties = {}
+        try:
+            sheets = await self.get_spreadsheet(
+                sheet_id, fields=SHEET_PROPERTIES_FIELDS
+            )
+            for sheet in sheets.get('sheets', []):
+                properties = sheet.get('properties')
+                sheets_properties[properties.get('title')] = properties.get(
+                    'gridProperties', {}
+                )
+        except Exception as err:
+            logger.error(f'Error get sheets {err}', exc_info=True)
+            raise SheetReadError(f'Cannot read sheets of {sheet_id}') from err
+        return sheets_properties
+
+    async def get_sheet_titles(self, sheet_id: str) -> List[str]:
+        '''Возвращает список с именем всех листов в файле.'''
+        return list(await self.get_sheets_properties(sheet_id))
+
+    async def aclose(self) -> None:
+        '''Закрывает пул соединений.'''
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async_google_client = AsyncGoogleClient()
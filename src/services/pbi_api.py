@@ -1,41 +1,49 @@
 import logging
-from typing import Any, Dict, List
-
-from msal import ConfidentialClientApplication
 
 from extended_pbipy.pbi_client import ExtendedPowerBI
+from extended_pbipy.pbi_client_async import AsyncExtendedPowerBI
+from extended_pbipy.retry import AimdLimiter, RetryPolicy
 from src.core.config import settings
+from .pbi_token import token_manager
 
 logger = logging.getLogger(__name__)
 
 
-def get_token(
-        scope: List[str],
-        auth_url: str,
-        client_id: str,
-        client_secret: str
-) -> Dict[str, Any]:
-    '''Возвращает токен для работы с API PowerBI.'''
-
-    try:
-        app = ConfidentialClientApplication(
-            client_id=client_id,
-            client_credential=client_secret,
-            authority=auth_url
-        )
-        result = app.acquire_token_silent(scopes=scope, account=None)
-        if not result:
-            result = app.acquire_token_for_client(scopes=scope)
-        return result.get('access_token')
-    except Exception as err:
-        logger.error(f'Error get token {err}', exc_info=True)
-
-
-pbi_token = get_token(
-    scope=settings.PBI_SCOPES.split(),
-    auth_url=settings.PBI_AUTH_URL,
-    client_id=settings.PBI_CLIENT_ID,
-    client_secret=settings.PBI_CLIENT_SECRET
+def get_upload_limiter() -> AimdLimiter:
+    '''
+    Возвращает ограничитель параллельных загрузок строк.
+
+    Начинает с PBI_UPLOAD_CONCURRENCY запросов и подстраивает их число
+    до PBI_UPLOAD_MAX_CONCURRENCY по ответам API о превышении лимита.
+    '''
+    return AimdLimiter(
+        initial=settings.PBI_UPLOAD_CONCURRENCY,
+        maximum=settings.PBI_UPLOAD_MAX_CONCURRENCY
+    )
+
+
+retry_policy = RetryPolicy(
+    max_retries=settings.PBI_MAX_RETRIES,
+    backoff_base=settings.PBI_BACKOFF_BASE,
+    backoff_max=settings.PBI_BACKOFF_MAX
 )
 
-pbi = ExtendedPowerBI(bearer_token=pbi_token)
+pbi = ExtendedPowerBI(
+    base_url=settings.PBI_API_URL,
+    retry_policy=retry_policy,
+    upload_limiter=get_upload_limiter()
+)
+# Запросы сессии клиента получают токен у token_manager при отправке
+token_manager.attach(pbi.session)
+
+async_pbi = AsyncExtendedPowerBI(
+    token_provider=lambda: token_manager.token,
+    token_refresher=token_manager.get_token,
+    base_url=settings.PBI_API_URL,
+    session=pbi.session,
+    max_connections=settings.PBI_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.PBI_MAX_CONNECTIONS,
+    timeout=settings.PBI_TIMEOUT,
+    retry_policy=retry_policy,
+    upload_limiter=get_upload_limiter()
+)
@@ -0,0 +1,257 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from msal import ConfidentialClientApplication, SerializableTokenCache
+from requests import PreparedRequest, Session
+from requests.auth import AuthBase
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BearerAuth(AuthBase):
+    '''
+    Авторизация запросов requests токеном, который берется у get_token
+    при отправке каждого запроса.
+    '''
+
+    def __init__(self, get_token: Callable[[], str]):
+        self.get_token = get_token
+
+    def __call__(self, request: PreparedRequest) -> PreparedRequest:
+        request.headers['Authorization'] = f'Bearer {self.get_token()}'
+        return request
+
+
+class PbiTokenManager:
+    '''
+    Менеджер токена доступа к API PowerBI.
+
+    Держит одно приложение MSAL с кешем токенов, сохраняемым на диск,
+    и в фоновом потоке обновляет токен заранее, до истечения срока.
+    Подключенные сессии requests берут токен перед каждым запросом
+    через get_token, поэтому работают и без запуска фонового потока,
+    например в скриптах: первый запрос получит токен сам.
+    '''
+
+    def __init__(
+            self,
+            scopes: str,
+            auth_url: str,
+            client_id: str,
+            client_secret: str,
+            cache_path: str = None,
+            refresh_margin: float = 300.0,
+            retry_delay: float = 30.0
+    ):
+        self.scopes = scopes.split()
+        self.cache_path = cache_path
+        # За сколько секунд до истечения токен обновляется, MSAL выдает
+        # новый токен вместо закешированного за 5 минут до истечения
+        self.refresh_margin = refresh_margin
+        # Пауза перед повторной попыткой после ошибки обновления
+        self.retry_delay = retry_delay
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.auth_url = auth_url
+        self._cache = SerializableTokenCache()
+        self._load_cache()
+        self._app = None
+        # Токен и срок его действия меняются под _lock, запрос нового
+        # токена идет под _refresh_lock, чтобы не блокировать чтение
+        # токена на время запроса
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_cache(self) -> None:
+        '''Загружает кеш токенов MSAL с диска, если он есть.'''
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as cache_file:
+                self._cache.deserialize(cache_file.read())
+        except (OSError, ValueError) as err:
+            logger.warning(f'Error load token cache {err}')
+
+    def _save_cache(self) -> None:
+        '''Сохраняет кеш токенов MSAL на диск, если он изменился.'''
+        if not self.cache_path or not self._cache.has_state_changed:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.cache_path}.tmp'
+        # Кеш содержит токен доступа, читать его может только владелец
+        descriptor = os.open(
+            tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+        )
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as cache_file:
+            cache_file.write(self._cache.serialize())
+        os.replace(tmp_path, self.cache_path)
+        self._cache.has_state_changed = False
+
+    def _get_app(self) -> ConfidentialClientApplication:
+        '''
+        Возвращает приложение MSAL, создавая его при первом обращении.
+
+        При создании MSAL запрашивает конфигурацию authority по сети.
+        '''
+        if self._app is None:
+            self._app = ConfidentialClientApplication(
+                client_id=self.client_id,
+                client_credential=self.client_secret,
+                authority=self.auth_url,
+                token_cache=self._cache
+            )
+        return self._app
+
+    def _acquire_token(self) -> Dict[str, Any]:
+        '''
+        Запрашивает токен по client credentials.
+
+        MSAL принимает только https authority, поэтому у локального
+        стенда по http токен запрашивается напрямую, без кеша.
+        '''
+        if not self.auth_url.startswith('http://'):
+            return self._get_app().acquire_token_for_client(
+                scopes=self.scopes
+            )
+        response = requests.post(
+            f'{self.auth_url}/oauth2/v2.0/token',
+            data={
+                'grant_type': 'client_credentials',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'scope': ' '.join(self.scopes),
+            },
+            timeout=30
+        )
+        return response.json()
+
+    def refresh(self) -> str:
+        '''
+        Запрашивает токен и сохраняет его для следующих запросов.
+
+        MSAL сначала ищет действующий токен в кеше и обращается
+        к Azure AD только при его отсутствии или скором истечении.
+        Одновременные вызовы делают один запрос: остальные дожидаются
+        его и получают уже обновленный токен.
+        '''
+        with self._refresh_lock:
+            if not self._is_expiring():
+                return self._token
+            result = self._acquire_token()
+            if 'access_token' not in result:
+                raise RuntimeError(
+                    f'Error get token {result.get("error")}: '
+                    f'{result.get("error_description")}'
+                )
+            self._save_cache()
+            token = result['access_token']
+            with self._lock:
+                self._token = token
+                self._expires_at = time.monotonic() + int(
+                    result.get('expires_in', 0)
+                )
+        logger.info(
+            f'PowerBI token from {result.get("token_source", "identity")} '
+            f'expires in {result.get("expires_in")}s'
+        )
+        return token
+
+    def _is_expiring(self) -> bool:
+        '''Проверяет, что токена нет или он скоро истекает.'''
+        return (
+            self._token is None
+            or time.monotonic() >= self._expires_at - self.refresh_margin
+        )
+
+    @property
+    def token(self) -> Optional[str]:
+        '''
+        Текущий токен без обращения к сети.
+
+        Возвращает None, если токена нет или его срок истек.
+        '''
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._expires_at:
+                return None
+            return self._token
+
+    def get_token(self) -> str:
+        '''Возвращает действующий токен, при необходимости обновляя его.'''
+        if self._is_expiring():
+            return self.refresh()
+        return self._token
+
+    def attach(self, session: Session) -> None:
+        '''Подключает сессию, запросы которой получают актуальный токен.'''
+        session.auth = BearerAuth(self.get_token)
+
+    def _refresh_loop(self) -> None:
+        '''Обновляет токен перед истечением, пока менеджер не остановлен.'''
+        while not self._stop.is_set():
+            try:
+                self.get_token()
+                delay = max(
+                    self._expires_at - self.refresh_margin - time.monotonic(),
+                    1.0
+                )
+            except Exception as err:
+                logger.error(f'Error refresh token {err}', exc_info=True)
+                delay = self.retry_delay
+            self._stop.wait(delay)
+
+    def start(self) -> None:
+        '''
+        Получает первый токен и запускает фоновое обновление.
+
+        Ошибка первого запроса только логируется, фоновый поток
+        повторяет его через retry_delay.
+        '''
+        if self._thread is not None and self._thread.is_alive():
+            return
+        try:
+            self.get_token()
+        except Exception as err:
+            logger.error(f'Error get token {err}', exc_info=True)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop,
+            name='pbi-token-refresh',
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        '''Останавливает фоновое обновление токена.'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def expires_in(self) -> Optional[float]:
+        '''Секунды до истечения текущего токена.'''
+        if self._token is None:
+            return None
+        return self._expires_at - time.monotonic()
+
+
+token_manager = PbiTokenManager(
+    scopes=settings.PBI_SCOPES,
+    auth_url=settings.PBI_AUTH_URL,
+    client_id=settings.PBI_CLIENT_ID,
+    client_secret=settings.PBI_CLIENT_SECRET,
+    cache_path=settings.PBI_TOKEN_CACHE,
+    refresh_margin=settings.PBI_TOKEN_REFRESH_MARGIN
+)
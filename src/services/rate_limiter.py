@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Статусы ответов, после которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(Exception):
+    '''Очередь ожидания лимитера переполнена или ждать слишком долго.'''
+
+
+class TokenBucket:
+    '''
+    Потокобезопасный token bucket.
+
+    Токены резервируются заранее: если их не хватает, баланс уходит в
+    минус и вызывающий получает время ожидания своей очереди. Так
+    ожидающие обслуживаются по порядку без повторных попыток.
+    '''
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or max(1.0, rate_per_minute / 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self) -> float:
+        '''Резервирует токен и возвращает время ожидания в секундах.'''
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self) -> None:
+        '''Возвращает ранее зарезервированный токен.'''
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class QuotaLimiter:
+    '''
+    Лимитер запросов по нескольким квотам одновременно.
+
+    Запрос ждет, пока токен освободится во всех bucket, например в
+    квоте проекта и в квоте пользователя. Число ожидающих запросов и
+    время ожидания ограничены, сверх них вызывается RateLimitExceeded.
+    '''
+
+    def __init__(
+            self,
+            buckets: List[TokenBucket],
+            max_waiters: int,
+            max_wait: float
+    ):
+        self.buckets = buckets
+        self.max_waiters = max_waiters
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._waiters = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.retries = 0
+
+    def _reserve(self) -> float:
+        '''Резервирует токены во всех bucket и возвращает ожидание.'''
+        with self._lock:
+            if self._waiters >= self.max_waiters:
+                self.rejected += 1
+                raise RateLimitExceeded(
+                    f'Too many requests waiting for quota: {self._waiters}'
+                )
+            wait = max(bucket.reserve() for bucket in self.buckets)
+            if wait > self.max_wait:
+                for bucket in self.buckets:
+                    bucket.refund()
+                self.rejected += 1
+                raise RateLimitExceeded(
+                    f'Quota wait {wait:.1f}s exceeds {self.max_wait}s'
+                )
+            self._waiters += 1
+            self.acquired += 1
+            return wait
+
+    def _release(self) -> None:
+        with self._lock:
+            self._waiters -= 1
+
+    def acquire(self) -> None:
+        '''Блокирует поток до получения права на запрос.'''
+        wait = self._reserve()
+        try:
+            if wait:
+                time.sleep(wait)
+        finally:
+            self._release()
+
+    async def aacquire(self) -> None:
+        '''Асинхронно ждет права на запрос.'''
+        wait = self._reserve()
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+        finally:
+            self._release()
+
+    def record_retry(self) -> None:
+        '''Учитывает повтор запроса после ответа 429 или 5xx.'''
+        with self._lock:
+            self.retries += 1
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает счетчики лимитера.'''
+        with self._lock:
+            return {
+                'waiters': self._waiters,
+                'acquired': self.acquired,
+                'rejected': self.rejected,
+                'retries': self.retries,
+            }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''Разбирает заголовок Retry-After: секунды или HTTP дата.'''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_delay(
+        attempt: int,
+        retry_after: Optional[float] = None,
+        base_delay: float = settings.GAPI_BACKOFF_BASE,
+        max_delay: float = settings.GAPI_BACKOFF_MAX
+) -> float:
+    '''
+    Возвращает паузу перед повтором запроса.
+
+    Если сервер прислал Retry-After, ждем указанное время, иначе -
+    экспоненциальная пауза со случайным разбросом (full jitter).
+    '''
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def execute_with_backoff(
+        request: Any,
+        limiter: Optional[QuotaLimiter] = None,
+        max_retries: int = settings.GAPI_MAX_RETRIES,
+        sleep: Callable[[float], None] = time.sleep
+) -> Dict[str, Any]:
+    '''
+    Выполняет запрос googleapiclient с учетом квоты и повторами.
+
+    Перед каждой попыткой ждет токен лимитера, на 429 и 5xx
+    повторяет запрос после паузы из get_retry_delay.
+    '''
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return request.execute()
+        except HttpError as err:
+            status = err.resp.status
+            if status not in RETRY_STATUSES or attempt == max_retries:
+                raise
+            delay = get_retry_delay(
+                attempt, parse_retry_after(err.resp.get('retry-after'))
+            )
+            if limiter is not None:
+                limiter.record_retry()
+            logger.warning(
+                f'Google API responded {status}, '
+                f'retry {attempt + 1} in {delay:.1f}s'
+            )
+            sleep(delay)
+
+
+sheets_read_limiter = QuotaLimiter(
+    buckets=[
+        TokenBucket(
+            settings.GAPI_READS_PER_MINUTE * settings.GAPI_QUOTA_UTILIZATION
+        ),
+        TokenBucket(
+            settings.GAPI_USER_READS_PER_MINUTE
+            * settings.GAPI_QUOTA_UTILIZATION
+        ),
+    ],
+    max_waiters=settings.GAPI_MAX_WAITERS,
+    max_wait=settings.GAPI_MAX_WAIT
+)
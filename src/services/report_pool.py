@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+from pbipy.reports import Report
+from requests import HTTPError
+
+from src.core.config import settings
+from .pbi_api import async_pbi, pbi
+from .sync_state import sync_state
+
+logger = logging.getLogger(__name__)
+
+# Ключ копий шаблона, не привязанных к названию таблицы
+GENERIC_NAME = ''
+
+
+class ReportPool:
+    '''
+    Пул заранее склонированных отчетов PowerBI.
+
+    Клонирование отчета - одна из самых медленных операций API, поэтому
+    для каждой пары шаблон отчета - название держится до size копий
+    шаблона. При синхронизации копия забирается из пула и через Rebind
+    привязывается к новому датасету, а пул пополняется в фоновом
+    потоке. Id копий хранятся в sync_state и переживают перезапуск.
+
+    API PowerBI не позволяет переименовать отчет. Если задан
+    generic_name, для таблиц, которые еще не синхронизировались, по
+    каждому шаблону держатся копии с этим общим названием: они
+    выдаются, когда копий с названием таблицы нет, и заполняются при
+    запуске сервиса для известных шаблонов. Такой отчет остается
+    с общим названием, поэтому по умолчанию копии отключены.
+    '''
+
+    def __init__(
+            self,
+            group_id: str,
+            size: int = 1,
+            workers: int = 2,
+            generic_name: str = ''
+    ):
+        self.group_id = group_id
+        self.size = size
+        self.generic_name = generic_name
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(workers, 1),
+            thread_name_prefix='pbi-report-pool'
+        )
+        self._lock = threading.Lock()
+        # Пары шаблон - название, пополнение которых уже запущено
+        self._refilling: Set[Tuple[str, str]] = set()
+        self.hits = 0
+        self.misses = 0
+        self.clones = 0
+        self.errors = 0
+
+    def _pop(self, template_report_id: str, name: str) -> Optional[str]:
+        '''
+        Забирает id копии шаблона из пула и учитывает попадание.
+
+        Если копий с названием name нет, забирает копию с общим
+        названием.
+        '''
+        report_id = sync_state.pop_pooled_report(template_report_id, name)
+        if report_id is None and self.generic_name:
+            report_id = sync_state.pop_pooled_report(
+                template_report_id, GENERIC_NAME
+            )
+            if report_id is not None:
+                logger.info(
+                    f'Pooled report {report_id} named {self.generic_name} '
+                    f'used for {name}'
+                )
+        with self._lock:
+            if report_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return report_id
+
+    def _count_error(self) -> None:
+        '''Учитывает ошибку работы с копией из пула.'''
+        with self._lock:
+            self.errors += 1
+
+    def acquire(
+            self,
+            template_report_id: str,
+            name: str,
+            dataset_id: str
+    ) -> Optional[Report]:
+        '''
+        Привязывает копию шаблона из пула к датасету и возвращает ее.
+
+        Копии, которые не удалось привязать, например удаленные
+        в PowerBI, пропускаются. Если пул пуст, возвращает None.
+        '''
+        if self.size <= 0:
+            return None
+        while True:
+            report_id = self._pop(template_report_id, name)
+            if report_id is None:
+                return None
+            try:
+                report = pbi.rebind_group_report(
+                    group_id=self.group_id,
+                    report_id=report_id,
+                    dataset_id=dataset_id
+                )
+            except HTTPError as err:
+                self._count_error()
+                logger.warning(f'Error rebind pooled report {report_id} {err}')
+                continue
+            logger.info(f'Pooled report {report_id} rebound to {dataset_id}')
+            return report
+
+    async def aacquire(
+            self,
+            template_report_id: str,
+            name: str,
+            dataset_id: str
+    ) -> Optional[Report]:
+        '''Асинхронный вариант acquire.'''
+        if self.size <= 0:
+            return None
+        while True:
+            report_id = await asyncio.to_thread(
+                self._pop, template_report_id, name
+            )
+            if report_id is None:
+                return None
+            try:
+                report = await async_pbi.rebind_group_report(
+                    group_id=self.group_id,
+                    report_id=report_id,
+                    dataset_id=dataset_id
+                )
+            except httpx.HTTPStatusError as err:
+                self._count_error()
+                logger.warning(f'Error rebind pooled report {report_id} {err}')
+                continue
+            logger.info(f'Pooled report {report_id} rebound to {dataset_id}')
+            return report
+
+    def _fill(self, template_report_id: str, name: str) -> None:
+        '''Клонирует шаблон, пока в пуле не станет size копий.'''
+        try:
+            while (
+                sync_state.count_pooled_reports(template_report_id, name)
+                < self.size
+            ):
+                report = pbi.clone_group_report(
+                    group_id=self.group_id,
+                    report_id=template_report_id,
+                    name=name or self.generic_name
+                )
+                sync_state.add_pooled_report(
+                    template_report_id, name, report.id
+                )
+                with self._lock:
+                    self.clones += 1
+                logger.info(
+                    f'Report {template_report_id} cloned to pool as '
+                    f'{report.id}'
+                )
+        except Exception as err:
+            self._count_error()
+            logger.error(
+                f'Error refill report pool of {template_report_id} {err}',
+                exc_info=True
+            )
+        finally:
+            with self._lock:
+                self._refilling.discard((template_report_id, name))
+
+    def _submit_fill(self, template_report_id: str, name: str) -> None:
+        '''Запускает пополнение копий с названием, если оно еще не идет.'''
+        key = (template_report_id, name)
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+        self._executor.submit(self._fill, template_report_id, name)
+
+    def refill(self, template_report_id: str, name: str) -> None:
+        '''
+        Запускает фоновое пополнение копий с названием name и копий
+        с общим названием, если оно еще не идет.
+        '''
+        if self.size <= 0:
+            return
+        self._submit_fill(template_report_id, name)
+        if self.generic_name:
+            self._submit_fill(template_report_id, GENERIC_NAME)
+
+    def prewarm(self) -> None:
+        '''
+        Запускает пополнение копий с общим названием для шаблонов,
+        по которым уже были синхронизации.
+        '''
+        if self.size <= 0 or not self.generic_name:
+            return
+        template_report_ids = sync_state.get_template_report_ids()
+        for template_report_id in template_report_ids:
+            self._submit_fill(template_report_id, GENERIC_NAME)
+        logger.info(
+            f'Prewarming report pool for {len(template_report_ids)} '
+            'templates'
+        )
+
+    def stats(self) -> Dict[str, int]:
+        '''Возвращает счетчики пула.'''
+        with self._lock:
+            return {
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'clones': self.clones,
+                'errors': self.errors,
+                'refilling': len(self._refilling),
+            }
+
+    def shutdown(self) -> None:
+        '''Останавливает пополнение пула, не дожидаясь клонирования.'''
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+report_pool = ReportPool(
+    group_id=settings.PBI_GROUP,
+    size=settings.PBI_REPORT_POOL_SIZE,
+    workers=settings.PBI_REPORT_POOL_WORKERS,
+    generic_name=settings.PBI_REPORT_POOL_GENERIC_NAME
+)
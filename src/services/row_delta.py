@@ -0,0 +1,81 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+
+class RowDelta(NamedTuple):
+    '''Разница между строками таблицы и сохраненными отпечатками.'''
+    # Строки с новыми ключами по ключу
+    inserted: Dict[str, Dict[str, Any]]
+    # Ключи строк, содержимое которых изменилось
+    changed: List[str]
+    # Ключи строк, которых больше нет в таблице
+    deleted: List[str]
+    # Отпечатки всех текущих строк по ключу
+    fingerprints: Dict[str, str]
+
+    @property
+    def pending(self) -> int:
+        '''Число изменений, которые нельзя дописать в push датасет.'''
+        return len(self.changed) + len(self.deleted)
+
+
+def get_row_fingerprint(row: Dict[str, Any]) -> str:
+    '''Возвращает отпечаток преобразованной строки таблицы.'''
+    return hashlib.blake2b(
+        json.dumps(
+            row, sort_keys=True, ensure_ascii=False, default=str
+        ).encode(),
+        digest_size=16
+    ).hexdigest()
+
+
+def iter_row_keys(
+        rows: List[Dict[str, Any]],
+        key_column: str
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    '''
+    Возвращает генератор пар ключ - строка.
+
+    Повторяющиеся и пустые ключи дополняются номером повтора,
+    чтобы каждая строка получила свой ключ.
+    '''
+    seen = {}
+    for row in rows:
+        key = str(row.get(key_column, ''))
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        yield (f'{key}#{occurrence}' if occurrence else key), row
+
+
+def get_row_fingerprints(
+        rows: List[Dict[str, Any]],
+        key_column: str
+) -> Dict[str, str]:
+    '''Возвращает отпечатки строк по ключу.'''
+    return {
+        key: get_row_fingerprint(row)
+        for key, row in iter_row_keys(rows, key_column)
+    }
+
+
+def compute_row_delta(
+        rows: List[Dict[str, Any]],
+        key_column: str,
+        stored: Dict[str, str]
+) -> RowDelta:
+    '''Сравнивает строки таблицы с сохраненными отпечатками.'''
+    inserted = {}
+    changed = []
+    fingerprints = {}
+    for key, row in iter_row_keys(rows, key_column):
+        fingerprint = get_row_fingerprint(row)
+        fingerprints[key] = fingerprint
+        stored_fingerprint = stored.get(key)
+        if stored_fingerprint is None:
+            inserted[key] = row
+        elif stored_fingerprint != fingerprint:
+            changed.append(key)
+
+    deleted = [key for key in stored if key not in fingerprints]
+    return RowDelta(inserted, changed, deleted, fingerprints)
@@ -0,0 +1,320 @@
+import logging
+from itertools import islice
+from typing import (
+    Any, Callable, Collection, Dict, Iterable, Iterator, List, Optional,
+    Sequence, Tuple
+)
+
+from .columnar import ColumnarTable, paused_gc
+from .google_api import serial_number_to_iso
+
+logger = logging.getLogger(__name__)
+
+# Разделитель значений при обработке столбца одной строкой
+SEPARATOR = '\x00'
+# Число строк, которые преобразуются за один проход по столбцам
+BATCH_ROWS = 10000
+
+ColumnConverter = Callable[[Sequence[Any]], Sequence[Any]]
+
+
+def _join(column: Sequence[Any]) -> Optional[str]:
+    '''
+    Склеивает строковые значения столбца через SEPARATOR.
+
+    Возвращает None, если в столбце есть не строки или разделитель
+    встречается в значениях, такие столбцы обрабатываются по ячейкам.
+    '''
+    try:
+        joined = SEPARATOR.join(column)
+    except TypeError:
+        return None
+    if joined.count(SEPARATOR) != len(column) - 1:
+        return None
+    return joined
+
+
+def _clean_value(value: Any) -> Any:
+    '''Убирает знак рубля, пустые значения приводит к пустой строке.'''
+    if not value:
+        return ''
+    if isinstance(value, str):
+        return value.replace('₽', '')
+    return value
+
+
+def _strip_spaces(value: Any, default: Any) -> Any:
+    '''Убирает пробелы из числа, пустое значение заменяет на default.'''
+    if not value:
+        return default
+    if isinstance(value, str):
+        return ''.join(value.split())
+    return value
+
+
+def _clean_column(column: Sequence[Any]) -> Sequence[Any]:
+    '''Убирает знак рубля из значений столбца.'''
+    joined = _join(column)
+    if joined is None:
+        return [_clean_value(value) for value in column]
+    if '₽' not in joined:
+        return column
+    return joined.replace('₽', '').split(SEPARATOR)
+
+
+def _get_stripped_column(default: Any) -> ColumnConverter:
+    '''
+    Возвращает удаление знака рубля и пробелов из значений столбца
+    с заменой пустых значений на default.
+    '''
+    def convert(column: Sequence[Any]) -> Sequence[Any]:
+        joined = _join(column)
+        if joined is None:
+            return [
+                _strip_spaces(_clean_value(value), default)
+                for value in column
+            ]
+        # Пробельные символы удаляются во всем столбце сразу,
+        # SEPARATOR к ним не относится и разделяет значения
+        values = ''.join(joined.replace('₽', '').split()).split(SEPARATOR)
+        return [value or default for value in values]
+    return convert
+
+
+def _get_default_column(default: Any) -> ColumnConverter:
+    '''Возвращает замену пустых строковых значений столбца на default.'''
+    def convert(column: Sequence[Any]) -> Sequence[Any]:
+        return [value or default for value in _clean_column(column)]
+    return convert
+
+
+def _get_typed_default_column(default: Any) -> ColumnConverter:
+    '''Возвращает замену пустых ячеек в исходных типах на default.'''
+    def convert(column: Sequence[Any]) -> Sequence[Any]:
+        return [default if value == '' else value for value in column]
+    return convert
+
+
+def _get_typed_datetime_column(default: Any) -> ColumnConverter:
+    '''
+    Возвращает замену пустых ячеек и перевод серийных номеров дат.
+
+    Даты в столбце повторяются, каждая переводится один раз.
+    '''
+    def convert(column: Sequence[Any]) -> Sequence[Any]:
+        dates = {
+            value: serial_number_to_iso(value)
+            for value in set(column)
+            if isinstance(value, (int, float))
+        }
+        return [
+            default if value == '' else dates.get(value, value)
+            for value in column
+        ]
+    return convert
+
+
+class RowTransformer:
+    '''
+    Преобразователь строк листа в строки таблицы PowerBI.
+
+    План преобразования составляется один раз при создании: для каждой
+    позиции ячейки в строке листа заранее известны название столбца
+    и функция преобразования всего столбца, для делимого столбца -
+    названия его частей. Строки обрабатываются пачками: пачка
+    транспонируется в столбцы, к каждому столбцу применяется его
+    функция, затем строки собираются обратно через zip по названиям.
+    Знак рубля и пробелы в числах убираются одной строковой операцией
+    на столбец. transform_table сохраняет столбцы в ColumnarTable,
+    не собирая строки.
+
+    В режиме typed значения приходят в исходных типах (UNFORMATTED_VALUE):
+    строки не разбираются, пустые ячейки заменяются значениями по
+    умолчанию, серийные номера дат переводятся в ISO 8601.
+    Ячеек, которых нет в конце строки листа, нет и в строке таблицы.
+    '''
+
+    def __init__(
+            self,
+            names: Sequence[str],
+            defaults: Dict[int, Any] = None,
+            stripped: Collection[int] = (),
+            datetime_columns: Collection[int] = (),
+            split_column: Optional[int] = None,
+            split_names: Sequence[str] = (),
+            separator: str = '/',
+            typed: bool = False,
+            batch_rows: int = BATCH_ROWS
+    ):
+        '''
+        names - названия столбцов таблицы по позиции ячейки строки листа,
+        defaults - значения пустых ячеек, stripped - позиции чисел
+        с пробелами, datetime_columns - позиции дат, split_column -
+        позиция столбца, который делится по separator на столбцы
+        split_names, они вставляются сразу после него.
+        '''
+        self.typed = typed
+        self.batch_rows = max(batch_rows, 1)
+        self.width = len(names)
+        self.empty_row = [''] * self.width
+        defaults = defaults or {}
+
+        converters: List[Optional[ColumnConverter]] = []
+        for value_num in range(self.width):
+            default = defaults.get(value_num)
+            if typed and value_num in datetime_columns:
+                converters.append(_get_typed_datetime_column(
+                    '' if default is None else default
+                ))
+            elif typed and default is not None:
+                converters.append(_get_typed_default_column(default))
+            elif typed:
+                converters.append(None)
+            elif value_num in stripped:
+                converters.append(_get_stripped_column(
+                    '' if default is None else default
+                ))
+            elif default is not None:
+                converters.append(_get_default_column(default))
+            else:
+                converters.append(_clean_column)
+        self.converters: Tuple[Optional[ColumnConverter], ...] = tuple(
+            converters
+        )
+
+        self.separator = separator
+        if split_column is None or split_column >= self.width:
+            self.split_idx = None
+            self.split_names = ()
+            full_names = tuple(names)
+        else:
+            self.split_idx = split_column
+            self.split_names = tuple(split_names)
+            full_names = (
+                tuple(names[:split_column + 1])
+                + self.split_names
+                + tuple(names[split_column + 1:])
+            )
+        self.empty_parts = [''] * len(self.split_names)
+        # Названия столбцов строки таблицы по числу ячеек строки листа,
+        # части есть, только если в строке есть делимый столбец
+        self.names_by_size = tuple(
+            full_names[:size]
+            if self.split_idx is None or size <= self.split_idx
+            else full_names[:size + len(self.split_names)]
+            for size in range(self.width + 1)
+        )
+
+    def _split_column(
+            self,
+            column: Sequence[Any]
+    ) -> List[Tuple[Any, ...]]:
+        '''
+        Возвращает столбцы частей по делимому столбцу.
+
+        Значений делимого столбца немного, каждое делится один раз.
+        '''
+        count = len(self.split_names)
+        parts = {
+            value: tuple(
+                (str(value).split(self.separator) + self.empty_parts)[:count]
+            )
+            for value in set(column)
+        }
+        return list(zip(*map(parts.__getitem__, column)))
+
+    def _convert_batch(
+            self,
+            rows: List[List[Any]]
+    ) -> Tuple[List[Sequence[Any]], List[int], Dict[int, Any]]:
+        '''
+        Преобразует пачку строк листа по столбцам.
+
+        Возвращает столбцы таблицы PowerBI, число ячеек каждой строки
+        листа и значения столбца Undefined по номеру строки: ячейки
+        за пределами таблицы записываются в этот столбец.
+        '''
+        width = self.width
+        sizes = list(map(len, rows))
+        undefined = {}
+        if max(sizes) > width:
+            undefined = {
+                row_num: row[-1]
+                for row_num, row in enumerate(rows)
+                if len(row) > width
+            }
+            logger.error(
+                f'Index error in add rows: {len(undefined)} rows longer '
+                f'than {width} columns'
+            )
+            sizes = [min(size, width) for size in sizes]
+        if min(sizes) < width or undefined:
+            empty_row = self.empty_row
+            rows = [
+                row[:width] if len(row) >= width else row + empty_row[size:]
+                for row, size in zip(rows, sizes)
+            ]
+
+        columns: List[Sequence[Any]] = list(zip(*rows))
+        for column_num, convert in enumerate(self.converters):
+            if convert is not None:
+                columns[column_num] = convert(columns[column_num])
+
+        split_idx = self.split_idx
+        if split_idx is not None:
+            first_part_idx = split_idx + 1
+            columns[first_part_idx:first_part_idx] = self._split_column(
+                columns[split_idx]
+            )
+        return columns, sizes, undefined
+
+    def transform_batch(self, rows: List[List[Any]]) -> List[Dict[str, Any]]:
+        '''Преобразует пачку строк листа в строки таблицы.'''
+        if not rows:
+            return []
+        with paused_gc():
+            columns, sizes, undefined = self._convert_batch(rows)
+            # Строки собираются без байткода на каждую строку
+            batch = list(map(dict, map(
+                zip,
+                map(self.names_by_size.__getitem__, sizes),
+                zip(*columns)
+            )))
+        for row_num, value in undefined.items():
+            batch[row_num]['Undefined'] = value
+        return batch
+
+    def transform(self, rows: Iterable[List[Any]]) -> Iterator[Dict]:
+        '''Возвращает генератор строк таблицы PowerBI по строкам листа.'''
+        for batch in self._iter_batches(rows):
+            yield from self.transform_batch(batch)
+
+    def transform_table(
+            self,
+            rows: Iterable[List[Any]],
+            table: ColumnarTable = None
+    ) -> ColumnarTable:
+        '''
+        Преобразует строки листа в таблицу из столбцов.
+
+        Строки добавляются в table, если она передана, иначе в новую
+        таблицу. Словари строк не создаются.
+        '''
+        if table is None:
+            table = ColumnarTable(self.names_by_size)
+        for batch in self._iter_batches(rows):
+            with paused_gc():
+                table.append(*self._convert_batch(batch))
+        return table
+
+    def _iter_batches(
+            self,
+            rows: Iterable[List[Any]]
+    ) -> Iterator[List[List[Any]]]:
+        '''Делит строки листа на пачки по batch_rows строк.'''
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_rows))
+            if not batch:
+                return
+            yield batch
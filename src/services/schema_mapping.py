@@ -0,0 +1,259 @@
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from extended_pbipy.entities import Table
+from extended_pbipy.enums import ColumnDataTypes
+from extended_pbipy.table_items import Column
+from src.core.config import settings
+from src.schemas.mapping import ANY, ColumnSpec, MappingFile, SheetLayout
+from .row_transform import RowTransformer
+
+logger = logging.getLogger(__name__)
+
+# Число преобразователей строк, которые хранятся для одной разметки
+MAX_TRANSFORMERS = 64
+
+
+def read_mapping_file(path: str) -> MappingFile:
+    '''
+    Читает и проверяет файл соответствия листов и таблиц PowerBI.
+
+    Поддерживаются JSON и YAML, для YAML нужен пакет PyYAML.
+    '''
+    with open(path, encoding='utf-8') as mapping_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError as err:
+                raise RuntimeError(
+                    f'Mapping file {path} is YAML, install PyYAML or set '
+                    'SHEET_SCHEMAS_PATH to a JSON file'
+                ) from err
+            data = yaml.safe_load(mapping_file)
+        else:
+            data = json.load(mapping_file)
+    return MappingFile.model_validate(data)
+
+
+class CompiledLayout:
+    '''
+    Разметка листа, разобранная в план создания таблицы и строк.
+
+    Описания столбцов по номеру дополняются описаниями по заголовку.
+    Преобразователи строк хранятся по названиям столбцов таблицы и
+    режиму значений, поэтому при повторных синхронизациях и чтении
+    окнами план заново не составляется.
+    '''
+
+    def __init__(self, name: str, layout: SheetLayout):
+        self.name = name
+        self.layout = layout
+        self.header_idx = layout.header_row - 1
+        self.data_start_idx = layout.data_start_row - 1
+        self.split = layout.split
+        self._transformers: Dict[
+            Tuple[Tuple[str, ...], bool], RowTransformer
+        ] = {}
+        self._lock = threading.Lock()
+
+    def get_header(self, values: List[List]) -> List:
+        '''Возвращает строку заголовка из значений листа.'''
+        if len(values) > self.header_idx:
+            return values[self.header_idx]
+        return []
+
+    def get_rows(self, values: List[List]) -> List[List]:
+        '''Возвращает строки данных из значений листа.'''
+        return values[self.data_start_idx:]
+
+    def get_specs(self, header: Sequence) -> List[ColumnSpec]:
+        '''
+        Возвращает описания столбцов листа по его заголовку.
+
+        Поля, не заданные для номера столбца, берутся из описания
+        столбца по заголовку.
+        '''
+        columns = self.layout.columns
+        named_columns = self.layout.named_columns
+        specs = []
+        for column_num, header_value in enumerate(header):
+            spec = columns.get(column_num)
+            named_spec = named_columns.get(str(header_value))
+            if spec is None:
+                spec = named_spec or ColumnSpec()
+            elif named_spec is not None:
+                spec = named_spec.model_copy(
+                    update=spec.model_dump(exclude_unset=True)
+                )
+            specs.append(spec)
+        return specs
+
+    def validate_header(self, header: Sequence, title: str) -> bool:
+        '''Сверяет заголовок листа с ожидаемым, расхождения логирует.'''
+        valid = True
+        for column_num, spec in self.layout.columns.items():
+            if spec.header is None:
+                continue
+            actual = (
+                str(header[column_num]) if column_num < len(header) else None
+            )
+            if actual != spec.header:
+                logger.warning(
+                    f'{title}: column {column_num} is {actual!r}, '
+                    f'{spec.header!r} expected by layout {self.name}'
+                )
+                valid = False
+        return valid
+
+    def get_names(self, header: Sequence) -> List[str]:
+        '''Возвращает названия столбцов по позиции ячейки строки листа.'''
+        # В режиме typed заголовки могут прийти числами
+        return [
+            spec.name or str(header_value)
+            for spec, header_value in zip(self.get_specs(header), header)
+        ]
+
+    def get_columns(self, header: Sequence) -> List[str]:
+        '''Возвращает названия столбцов таблицы PowerBI.'''
+        names = self.get_names(header)
+        split = self.split
+        if split is None or split.column >= len(names):
+            return names
+        return (
+            names[:split.column + 1] + split.names + names[split.column + 1:]
+        )
+
+    def create_table(self, header: Sequence, table_name: str) -> Table:
+        '''Создает таблицу PowerBI со столбцами и типами по заголовку.'''
+        table = Table(name=table_name)
+        specs = self.get_specs(header)
+        split = self.split
+        if split is not None and split.column < len(specs):
+            first_part_idx = split.column + 1
+            specs[first_part_idx:first_part_idx] = [
+                ColumnSpec() for _ in split.names
+            ]
+        for column_name, spec in zip(self.get_columns(header), specs):
+            data_type = spec.type
+            format_string = spec.format
+            if data_type == ColumnDataTypes.Currency:
+                data_type = ColumnDataTypes.Double
+                format_string = format_string or 'Currency'
+            table.add_column(Column(
+                name=column_name,
+                data_type=data_type,
+                format_string=format_string
+            ))
+        return table
+
+    def get_transformer(
+            self,
+            column_names: Sequence[str],
+            typed: bool = False
+    ) -> RowTransformer:
+        '''
+        Возвращает преобразователь строк таблицы с заданными столбцами.
+
+        Преобразователь составляется один раз для названий столбцов
+        и режима значений.
+        '''
+        key = (tuple(column_names), typed)
+        transformer = self._transformers.get(key)
+        if transformer is not None:
+            return transformer
+
+        names = list(column_names)
+        split = self.split
+        if split is not None and split.column + 1 < len(names):
+            first_part_idx = split.column + 1
+            del names[first_part_idx:first_part_idx + len(split.names)]
+        specs = self.get_specs(names)
+        transformer = RowTransformer(
+            names=names,
+            defaults={
+                column_num: spec.empty
+                for column_num, spec in enumerate(specs)
+                if spec.empty is not None
+            },
+            stripped={
+                column_num
+                for column_num, spec in enumerate(specs)
+                if spec.strip_spaces
+            },
+            datetime_columns={
+                column_num
+                for column_num, spec in enumerate(specs)
+                if spec.type == ColumnDataTypes.Datetime
+            },
+            split_column=split.column if split else None,
+            split_names=split.names if split else (),
+            separator=split.separator if split else '/',
+            typed=typed
+        )
+        with self._lock:
+            if len(self._transformers) >= MAX_TRANSFORMERS:
+                self._transformers.pop(next(iter(self._transformers)))
+            self._transformers[key] = transformer
+        return transformer
+
+
+class SchemaMapping:
+    '''
+    Соответствие листов гугл таблиц разметкам таблиц PowerBI.
+
+    Файл читается и проверяется при первом обращении, каждая разметка
+    разбирается один раз. Разметка листа ищется по id таблицы и
+    названию листа, затем по ANY вместо названия, id или обоих.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mapping: Optional[MappingFile] = None
+        self._layouts: Dict[str, CompiledLayout] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> MappingFile:
+        '''Возвращает файл соответствия, читая его при первом обращении.'''
+        if self._mapping is None:
+            with self._lock:
+                if self._mapping is None:
+                    self._mapping = read_mapping_file(self.path)
+                    logger.info(
+                        f'Loaded {len(self._mapping.layouts)} sheet '
+                        f'layouts from {self.path}'
+                    )
+        return self._mapping
+
+    def reload(self) -> None:
+        '''Сбрасывает прочитанный файл и разобранные разметки.'''
+        with self._lock:
+            self._mapping = None
+            self._layouts = {}
+
+    def get_layout_name(self, sheet_id: str, title: str) -> str:
+        '''Возвращает название разметки листа.'''
+        sheets = self.load().sheets
+        for sheet_key, title_key in (
+            (sheet_id, title), (sheet_id, ANY), (ANY, title), (ANY, ANY)
+        ):
+            layout_name = sheets.get(sheet_key, {}).get(title_key)
+            if layout_name is not None:
+                return layout_name
+        raise KeyError(f'No sheet layout for {sheet_id}/{title}')
+
+    def get(self, sheet_id: str, title: str) -> CompiledLayout:
+        '''Возвращает разобранную разметку листа.'''
+        layout_name = self.get_layout_name(sheet_id, title)
+        layout = self._layouts.get(layout_name)
+        if layout is None:
+            layout = CompiledLayout(
+                layout_name, self.load().layouts[layout_name]
+            )
+            with self._lock:
+                layout = self._layouts.setdefault(layout_name, layout)
+        return layout
+
+
+schema_mapping = SchemaMapping(settings.SHEET_SCHEMAS_PATH)
@@ -0,0 +1,65 @@
+import queue
+import threading
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+# Как часто поток чтения проверяет, не закрыт ли генератор
+PUT_TIMEOUT = 0.1
+# Признак окончания данных в очереди prefetch
+_DONE = object()
+
+
+def prefetch(iterable: Iterable[T], depth: int = 1) -> Iterator[T]:
+    '''
+    Обходит iterable в отдельном потоке на depth элементов вперед.
+
+    Пока вызывающий код обрабатывает элемент, следующий уже
+    запрашивается, например, следующее окно строк листа. Ошибка
+    потока чтения поднимается в вызывающем коде, при закрытии
+    генератора поток чтения останавливается.
+    '''
+    items = queue.Queue(maxsize=max(1, depth))
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as err:
+            put((_DONE, err))
+            return
+        put((_DONE, None))
+
+    threading.Thread(target=produce, name='prefetch', daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def iter_chunks(items: Iterable[T], chunk_size: int) -> Iterator[List[T]]:
+    '''Собирает элементы в списки по chunk_size элементов.'''
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,427 @@
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SyncStateStorage:
+    '''
+    Хранилище состояния синхронизации гугл таблиц в SQLite.
+
+    Для каждой пары таблица - шаблон отчета хранит последнюю
+    синхронизированную ревизию файла, созданный датасет и отчет.
+    Для каждого листа хранится число синхронизированных строк и хеш
+    заголовка для дозагрузки новых строк, а также отпечатки строк
+    по бизнес ключу для отправки только изменений и число запусков,
+    в течение которых измененные строки не записаны. Кроме того, хранит
+    пул заранее склонированных отчетов по шаблону и названию.
+    '''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._create_tables()
+
+    def _connect(self) -> sqlite3.Connection:
+        '''Открывает новое соединение с базой.'''
+        connection = sqlite3.connect(self.db_path)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _create_tables(self) -> None:
+        '''Создает таблицы хранилища, если их нет.'''
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS sheet_state (
+                    sheet_id TEXT NOT NULL,
+                    template_report_id TEXT NOT NULL,
+                    revision TEXT,
+                    modified_time TEXT,
+                    dataset_id TEXT,
+                    report_id TEXT,
+                    synced_at TEXT,
+                    sync_options TEXT,
+                    PRIMARY KEY (sheet_id, template_report_id)
+                )
+                '''
+            )
+            self._add_column(connection, 'sheet_state', 'sync_options TEXT')
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS tab_state (
+                    sheet_id TEXT NOT NULL,
+                    template_report_id TEXT NOT NULL,
+                    sheet_title TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    header_hash TEXT NOT NULL,
+                    synced_at TEXT,
+                    PRIMARY KEY (sheet_id, template_report_id, sheet_title)
+                )
+                '''
+            )
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS row_fingerprint (
+                    sheet_id TEXT NOT NULL,
+                    template_report_id TEXT NOT NULL,
+                    sheet_title TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    dataset_id TEXT,
+                    PRIMARY KEY (
+                        sheet_id, template_report_id, sheet_title, row_key
+                    )
+                )
+                '''
+            )
+            self._add_column(connection, 'row_fingerprint', 'dataset_id TEXT')
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS delta_state (
+                    sheet_id TEXT NOT NULL,
+                    template_report_id TEXT NOT NULL,
+                    sheet_title TEXT NOT NULL,
+                    stale_runs INTEGER NOT NULL,
+                    PRIMARY KEY (sheet_id, template_report_id, sheet_title)
+                )
+                '''
+            )
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS report_pool (
+                    template_report_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    report_id TEXT NOT NULL PRIMARY KEY,
+                    created_at TEXT
+                )
+                '''
+            )
+
+    @staticmethod
+    def _add_column(
+            connection: sqlite3.Connection,
+            table: str,
+            column: str
+    ) -> None:
+        '''Добавляет столбец в таблицу, созданную прошлой версией.'''
+        name = column.split()[0]
+        columns = {
+            row['name']
+            for row in connection.execute(f'PRAGMA table_info({table})')
+        }
+        if name not in columns:
+            connection.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+
+    def get_sheet_state(
+            self,
+            sheet_id: str,
+            template_report_id: str
+    ) -> Optional[Dict[str, Any]]:
+        '''Возвращает последнее сохраненное состояние таблицы.'''
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                '''
+                SELECT * FROM sheet_state
+                WHERE sheet_id = ? AND template_report_id = ?
+                ''',
+                (sheet_id, template_report_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_sheet_state(
+            self,
+            sheet_id: str,
+            template_report_id: str,
+            revision: str,
+            modified_time: str,
+            dataset_id: str,
+            report_id: str,
+            sync_options: str = None
+    ) -> None:
+        '''
+        Сохраняет состояние таблицы после успешной синхронизации.
+
+        sync_options - параметры синхронизации, с которыми получена
+        ревизия, например выбранные листы.
+        '''
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                INSERT OR REPLACE INTO sheet_state (
+                    sheet_id, template_report_id, revision, modified_time,
+                    dataset_id, report_id, synced_at, sync_options
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (
+                    sheet_id, template_report_id, revision, modified_time,
+                    dataset_id, report_id,
+                    datetime.now(timezone.utc).isoformat(), sync_options
+                )
+            )
+        logger.info(f'Saved sync state for {sheet_id} at revision {revision}')
+
+    def get_tab_states(
+            self,
+            sheet_id: str,
+            template_report_id: str
+    ) -> Dict[str, Dict[str, Any]]:
+        '''Возвращает сохраненные состояния листов по их названиям.'''
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                '''
+                SELECT * FROM tab_state
+                WHERE sheet_id = ? AND template_report_id = ?
+                ''',
+                (sheet_id, template_report_id)
+            ).fetchall()
+        return {row['sheet_title']: dict(row) for row in rows}
+
+    def save_tab_states(
+            self,
+            sheet_id: str,
+            template_report_id: str,
+            tab_states: Dict[str, Dict[str, Any]]
+    ) -> None:
+        '''
+        Заменяет состояния листов таблицы.
+
+        tab_states - словарь с row_count и header_hash по названию листа,
+        состояния листов, которых в нем нет, удаляются.
+        '''
+        synced_at = datetime.now(timezone.utc).isoformat()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                DELETE FROM tab_state
+                WHERE sheet_id = ? AND template_report_id = ?
+                ''',
+                (sheet_id, template_report_id)
+            )
+            connection.executemany(
+                '''
+                INSERT INTO tab_state (
+                    sheet_id, template_report_id, sheet_title,
+                    row_count, header_hash, synced_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ''',
+                [
+                    (
+                        sheet_id, template_report_id, title,
+                        state['row_count'], state['header_hash'], synced_at
+                    )
+                    for title, state in tab_states.items()
+                ]
+            )
+        logger.info(
+            f'Saved state of {len(tab_states)} sheets for {sheet_id}'
+        )
+
+    def get_row_fingerprints(
+            self,
+            sheet_id: str,
+            template_report_id: str,
+            sheet_title: str,
+            dataset_id: str
+    ) -> Dict[str, str]:
+        '''
+        Возвращает сохраненные отпечатки строк листа по ключу.
+
+        Отпечатки, сохраненные для другого датасета, не возвращаются:
+        они не описывают строки датасета dataset_id.
+        '''
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                '''
+                SELECT row_key, fingerprint FROM row_fingerprint
+                WHERE sheet_id = ? AND template_report_id = ?
+                    AND sheet_title = ? AND dataset_id = ?
+                ''',
+                (sheet_id, template_report_id, sheet_title, dataset_id)
+            ).fetchall()
+        return {row['row_key']: row['fingerprint'] for row in rows}
+
+    def save_row_fingerprints(
+            self,
+            sheet_id: str,
+            template_report_id: str,
+            sheet_title: str,
+            dataset_id: str,
+            fingerprints: Dict[str, str]
+    ) -> None:
+        '''Заменяет отпечатки строк листа в датасете dataset_id.'''
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                DELETE FROM row_fingerprint
+                WHERE sheet_id = ? AND template_report_id = ?
+                    AND sheet_title = ?
+                ''',
+                (sheet_id, template_report_id, sheet_title)
+            )
+            connection.executemany(
+                '''
+                INSERT INTO row_fingerprint (
+                    sheet_id, template_report_id, sheet_title,
+                    row_key, fingerprint, dataset_id
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ''',
+                [
+                    (
+                        sheet_id, template_report_id, sheet_title,
+                        row_key, fingerprint, dataset_id
+                    )
+                    for row_key, fingerprint in fingerprints.items()
+                ]
+            )
+        logger.info(
+            f'Saved {len(fingerprints)} row fingerprints of {sheet_title}'
+        )
+
+    def clear_delta_state(
+            self,
+            sheet_id: str,
+            template_report_id: str
+    ) -> None:
+        '''
+        Удаляет отпечатки строк и счетчики запусков всех листов.
+
+        Вызывается, когда строки датасета записаны не в режиме delta:
+        отпечатки больше не описывают строки датасета, и следующая
+        синхронизация в режиме delta перезапишет таблицы целиком.
+        '''
+        with closing(self._connect()) as connection, connection:
+            for table in ('row_fingerprint', 'delta_state'):
+                connection.execute(
+                    f'''
+                    DELETE FROM {table}
+                    WHERE sheet_id = ? AND template_report_id = ?
+                    ''',
+                    (sheet_id, template_report_id)
+                )
+
+    def get_stale_runs(
+            self,
+            sheet_id: str,
+            template_report_id: str
+    ) -> Dict[str, int]:
+        '''
+        Возвращает по названию листа число запусков подряд, после
+        которых в датасете остались неактуальные строки.
+        '''
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                '''
+                SELECT sheet_title, stale_runs FROM delta_state
+                WHERE sheet_id = ? AND template_report_id = ?
+                ''',
+                (sheet_id, template_report_id)
+            ).fetchall()
+        return {row['sheet_title']: row['stale_runs'] for row in rows}
+
+    def save_stale_runs(
+            self,
+            sheet_id: str,
+            template_report_id: str,
+            stale_runs: Dict[str, int]
+    ) -> None:
+        '''
+        Заменяет число запусков с неактуальными строками листов,
+        счетчики листов, которых нет в stale_runs, удаляются.
+        '''
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                DELETE FROM delta_state
+                WHERE sheet_id = ? AND template_report_id = ?
+                ''',
+                (sheet_id, template_report_id)
+            )
+            connection.executemany(
+                '''
+                INSERT INTO delta_state (
+                    sheet_id, template_report_id, sheet_title, stale_runs
+                ) VALUES (?, ?, ?, ?)
+                ''',
+                [
+                    (sheet_id, template_report_id, title, runs)
+                    for title, runs in stale_runs.items()
+                ]
+            )
+
+    def add_pooled_report(
+            self,
+            template_report_id: str,
+            name: str,
+            report_id: str
+    ) -> None:
+        '''Добавляет склонированный отчет в пул.'''
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                '''
+                INSERT OR REPLACE INTO report_pool (
+                    template_report_id, name, report_id, created_at
+                ) VALUES (?, ?, ?, ?)
+                ''',
+                (
+                    template_report_id, name, report_id,
+                    datetime.now(timezone.utc).isoformat()
+                )
+            )
+
+    def pop_pooled_report(
+            self,
+            template_report_id: str,
+            name: str
+    ) -> Optional[str]:
+        '''Забирает из пула самый старый отчет и возвращает его id.'''
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute(
+                '''
+                DELETE FROM report_pool
+                WHERE rowid = (
+                    SELECT rowid FROM report_pool
+                    WHERE template_report_id = ? AND name = ?
+                    ORDER BY created_at
+                    LIMIT 1
+                )
+                RETURNING report_id
+                ''',
+                (template_report_id, name)
+            ).fetchone()
+        return row['report_id'] if row else None
+
+    def get_template_report_ids(self) -> List[str]:
+        '''Возвращает id шаблонов отчетов из состояний и пула.'''
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                '''
+                SELECT template_report_id FROM sheet_state
+                UNION
+                SELECT template_report_id FROM report_pool
+                '''
+            ).fetchall()
+        return [row['template_report_id'] for row in rows]
+
+    def count_pooled_reports(
+            self,
+            template_report_id: str,
+            name: str
+    ) -> int:
+        '''Возвращает число отчетов в пуле.'''
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                '''
+                SELECT COUNT(*) AS pooled FROM report_pool
+                WHERE template_report_id = ? AND name = ?
+                ''',
+                (template_report_id, name)
+            ).fetchone()
+        return row['pooled']
+
+
+sync_state = SyncStateStorage(settings.SYNC_STATE_DB)
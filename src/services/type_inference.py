@@ -0,0 +1,334 @@
+import logging
+import threading
+from datetime import datetime
+from typing import (
+    Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+)
+
+import numpy as np
+
+from extended_pbipy.enums import ColumnDataTypes
+from src.core.config import settings
+from .google_api import get_header_hash
+
+logger = logging.getLogger(__name__)
+
+# Доля непустых значений выборки, которую должен разобрать парсер типа
+MIN_CONFIDENCE = 0.95
+# Доля значений со знаком валюты, с которой числовой столбец денежный
+MIN_CURRENCY_SHARE = 0.5
+# Число заголовков, для которых хранятся выведенные типы
+MAX_CACHED_HEADERS = 256
+# Больше цифр не помещается в Int64
+MAX_INT_DIGITS = 18
+# Знаки валют, которые убираются из денежных значений
+CURRENCY_SIGNS = ('₽', '$', '€', 'руб.', 'р.')
+# Пробелы, которыми гугл таблицы разделяют разряды чисел
+NUMBER_SPACES = (' ', '\xa0', '\u202f')
+# Логические значения в английской и русской локали таблицы
+BOOL_VALUES = {'true': True, 'false': False, 'истина': True, 'ложь': False}
+# Все цифры заменяются нулем, чтобы сравнивать значения с шаблоном
+DIGITS_TO_ZERO = str.maketrans('0123456789', '0' * 10)
+# Шаблон даты, где группы цифр сжаты до одного нуля: формат для
+# разбора значения и формат столбца PowerBI
+DATE_FORMATS = {
+    '0.0.0': ('%d.%m.%Y', 'dd.MM.yyyy'),
+    '0.0.0 0:0': ('%d.%m.%Y %H:%M', 'dd.MM.yyyy HH:mm'),
+    '0.0.0 0:0:0': ('%d.%m.%Y %H:%M:%S', 'dd.MM.yyyy HH:mm:ss'),
+    '0-0-0': ('%Y-%m-%d', 'yyyy-MM-dd'),
+    '0-0-0 0:0:0': ('%Y-%m-%d %H:%M:%S', 'yyyy-MM-dd HH:mm:ss'),
+    '0-0-0T0:0:0': ('%Y-%m-%dT%H:%M:%S', 'yyyy-MM-dd HH:mm:ss'),
+    '0/0/0': ('%m/%d/%Y', 'MM/dd/yyyy'),
+}
+
+ValueParser = Callable[[Any], Any]
+
+
+class InferredType(NamedTuple):
+    '''Выведенный тип столбца листа.'''
+    data_type: ColumnDataTypes
+    # Формат столбца PowerBI
+    format_string: str = ''
+    # Формат datetime.strptime для столбцов дат
+    date_format: str = ''
+
+
+STRING_TYPE = InferredType(ColumnDataTypes.String)
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == ''
+
+
+def _infer_native(values: Sequence[Any]) -> InferredType:
+    '''Выводит тип столбца из значений в исходных типах Python.'''
+    types = set(map(type, values))
+    if types == {bool}:
+        return InferredType(ColumnDataTypes.Boolean)
+    if types == {int}:
+        return InferredType(ColumnDataTypes.Int64)
+    if types <= {int, float}:
+        return InferredType(ColumnDataTypes.Double)
+    return STRING_TYPE
+
+
+def _normalize_numbers(values: np.ndarray) -> np.ndarray:
+    '''
+    Убирает из чисел пробелы разрядов и знаки валют, запятую дроби
+    заменяет точкой. Запятая рядом с точкой считается разделителем
+    разрядов и удаляется.
+    '''
+    for space in NUMBER_SPACES:
+        values = np.char.replace(values, space, '')
+    for sign in CURRENCY_SIGNS:
+        values = np.char.replace(values, sign, '')
+    with_point = np.char.find(values, '.') >= 0
+    return np.where(
+        with_point,
+        np.char.replace(values, ',', ''),
+        np.char.replace(values, ',', '.')
+    )
+
+
+def _has_currency(values: np.ndarray) -> np.ndarray:
+    '''Возвращает маску значений со знаком валюты.'''
+    mask = np.zeros(len(values), dtype=np.bool_)
+    for sign in CURRENCY_SIGNS:
+        mask |= np.char.find(values, sign) >= 0
+    return mask
+
+
+def _get_date_type(values: np.ndarray) -> Optional[InferredType]:
+    '''
+    Возвращает тип дат, если большинство значений подходит под один
+    из форматов DATE_FORMATS, иначе None.
+    '''
+    shapes = np.char.translate(values, DIGITS_TO_ZERO)
+    # Группы цифр разной длины сводятся к одному нулю
+    for _ in range(4):
+        shapes = np.char.replace(shapes, '00', '0')
+    shape_values, counts = np.unique(shapes, return_counts=True)
+    shape = shape_values[counts.argmax()]
+    if shape not in DATE_FORMATS:
+        return None
+    date_format, format_string = DATE_FORMATS[shape]
+    # Даты в столбце повторяются, каждая разбирается один раз
+    parsed = 0
+    for value, count in zip(
+            *np.unique(values[shapes == shape], return_counts=True)
+    ):
+        try:
+            datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        parsed += count
+    if parsed < len(values) * MIN_CONFIDENCE:
+        return None
+    return InferredType(ColumnDataTypes.Datetime, format_string, date_format)
+
+
+def infer_column_type(values: Sequence[Any]) -> InferredType:
+    '''
+    Выводит тип столбца по выборке его значений.
+
+    Парсеры целых, дробных, денежных значений, дат и логических
+    значений применяются ко всей выборке сразу. Тип выбирается, если
+    его парсер разбирает не меньше MIN_CONFIDENCE непустых значений,
+    иначе столбец остается строковым.
+    '''
+    values = [value for value in values if not _is_empty(value)]
+    if not values:
+        return STRING_TYPE
+    if not any(isinstance(value, str) for value in values):
+        return _infer_native(values)
+
+    strings = np.char.strip(np.array(list(map(str, values)), dtype=np.str_))
+    required = len(strings) * MIN_CONFIDENCE
+
+    if np.isin(np.char.lower(strings), list(BOOL_VALUES)).sum() >= required:
+        return InferredType(ColumnDataTypes.Boolean)
+
+    numbers = _normalize_numbers(strings)
+    unsigned = np.char.lstrip(numbers, '+-')
+    digits = np.char.str_len(unsigned)
+    # Числа с ведущим нулем - коды и артикулы, а не числа
+    is_code = (
+        np.char.startswith(unsigned, '0')
+        & ~np.char.startswith(unsigned, '0.')
+        & (digits > 1)
+    )
+    is_int = (
+        np.char.isdecimal(unsigned) & (digits <= MAX_INT_DIGITS) & ~is_code
+    )
+    is_float = (
+        np.char.isdecimal(np.char.replace(unsigned, '.', '', 1)) & ~is_code
+    )
+    if (is_int | is_float).sum() >= required:
+        if _has_currency(strings).sum() >= len(strings) * MIN_CURRENCY_SHARE:
+            return InferredType(ColumnDataTypes.Double, 'Currency')
+        if is_int.sum() >= required:
+            return InferredType(ColumnDataTypes.Int64)
+        return InferredType(ColumnDataTypes.Double)
+
+    return _get_date_type(strings) or STRING_TYPE
+
+
+def _clean_number(value: str) -> str:
+    '''Убирает из числа пробелы разрядов и знаки валют.'''
+    for space in NUMBER_SPACES:
+        value = value.replace(space, '')
+    for sign in CURRENCY_SIGNS:
+        value = value.replace(sign, '')
+    return value.replace(',', '' if '.' in value else '.')
+
+
+def _parse_number(value: Any) -> float:
+    if isinstance(value, str):
+        value = _clean_number(value)
+    return float(value)
+
+
+def _parse_int(value: Any) -> int:
+    if isinstance(value, str):
+        value = _clean_number(value)
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f'{value!r} is not an integer')
+    return int(value)
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    try:
+        return BOOL_VALUES[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f'{value!r} is not a boolean') from None
+
+
+def get_parser(inferred: InferredType) -> ValueParser:
+    '''
+    Возвращает преобразование значения листа в значение столбца
+    выведенного типа. Пустые значения становятся None, неразобранные
+    вызывают ValueError.
+    '''
+    if inferred.data_type == ColumnDataTypes.Int64:
+        parse = _parse_int
+    elif inferred.data_type == ColumnDataTypes.Double:
+        parse = _parse_number
+    elif inferred.data_type == ColumnDataTypes.Boolean:
+        parse = _parse_bool
+    elif inferred.data_type == ColumnDataTypes.Datetime:
+        def parse(value: Any) -> str:
+            return datetime.strptime(
+                str(value).strip(), inferred.date_format
+            ).isoformat()
+    else:
+        return lambda value: value
+
+    def parse_value(value: Any) -> Any:
+        if _is_empty(value):
+            return None
+        try:
+            return parse(value)
+        except (TypeError, ValueError) as err:
+            raise ValueError(
+                f'Cannot parse {value!r} as {inferred.data_type.value}'
+            ) from err
+    return parse_value
+
+
+def fits_column_type(inferred: InferredType, values: Sequence[Any]) -> bool:
+    '''
+    Проверяет, что парсер типа разбирает не меньше MIN_CONFIDENCE
+    непустых значений столбца.
+    '''
+    if inferred.data_type == ColumnDataTypes.String:
+        return True
+    parse = get_parser(inferred)
+    values = [value for value in values if not _is_empty(value)]
+    failed = 0
+    for value in values:
+        try:
+            parse(value)
+        except ValueError:
+            failed += 1
+    return failed <= len(values) * (1 - MIN_CONFIDENCE)
+
+
+def sample_rows(rows: Sequence[List], sample_size: int) -> List[List]:
+    '''Возвращает не больше sample_size строк, равномерно по листу.'''
+    if len(rows) <= sample_size:
+        return list(rows)
+    indexes = np.unique(
+        np.linspace(0, len(rows) - 1, sample_size).astype(np.int64)
+    )
+    return [rows[row_num] for row_num in indexes.tolist()]
+
+
+class TypeInference:
+    '''
+    Вывод типов столбцов листов, для которых нет разметки.
+
+    Типы выводятся по выборке строк и хранятся по хешу заголовка,
+    поэтому при повторных синхронизациях листа типы не выводятся
+    заново. Сохраненные типы проверяются на выборке текущих строк:
+    тип столбца, парсер которого не разбирает MIN_CONFIDENCE значений,
+    выводится заново, чтобы значения не отправлялись пустыми.
+    '''
+
+    def __init__(self, sample_size: int):
+        self.sample_size = sample_size
+        self._types: Dict[str, List[InferredType]] = {}
+        self._lock = threading.Lock()
+
+    def infer(
+            self,
+            header: Sequence[Any],
+            rows: Sequence[List]
+    ) -> List[InferredType]:
+        '''Возвращает типы столбцов листа по заголовку и строкам.'''
+        key = get_header_hash(list(header))
+        sample = sample_rows(rows, self.sample_size)
+        columns = [
+            [row[column_num] for row in sample if column_num < len(row)]
+            for column_num in range(len(header))
+        ]
+
+        types = self._types.get(key)
+        if types is not None:
+            stale = [
+                column_num for column_num, inferred in enumerate(types)
+                if not fits_column_type(inferred, columns[column_num])
+            ]
+            if not stale:
+                return types
+            logger.warning(
+                f'Cached types of columns {stale} do not fit current rows, '
+                'inferring them again'
+            )
+            types = list(types)
+            for column_num in stale:
+                types[column_num] = infer_column_type(columns[column_num])
+        else:
+            types = list(map(infer_column_type, columns))
+            logger.info(
+                f'Inferred {len(types)} column types from {len(sample)} rows'
+            )
+        with self._lock:
+            self._types.pop(key, None)
+            if len(self._types) >= MAX_CACHED_HEADERS:
+                self._types.pop(next(iter(self._types)))
+            self._types[key] = types
+        return types
+
+    def clear(self) -> None:
+        '''Сбрасывает выведенные типы.'''
+        with self._lock:
+            self._types = {}
+
+
+type_inference = TypeInference(settings.TYPE_INFERENCE_SAMPLE_ROWS)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ValuesCache:
+    '''
+    Кеш значений листов гугл таблиц на диске.
+
+    Ключ записи - id таблицы, диапазон листа и ревизия файла на
+    Google Drive, поэтому после изменения таблицы старые записи просто
+    перестают запрашиваться и вытесняются. Значения хранятся в сжатом
+    zlib компактном json, общий размер ограничен max_bytes, при
+    превышении удаляются давно не читанные записи (LRU по mtime).
+    '''
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def _get_key(sheet_id: str, cell_range: str, revision: str) -> str:
+        '''Возвращает имя файла записи кеша.'''
+        raw_key = f'{sheet_id}\n{cell_range}\n{revision}'.encode('utf-8')
+        return hashlib.sha256(raw_key).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json.z')
+
+    def get(
+            self,
+            sheet_id: str,
+            cell_range: str,
+            revision: str
+    ) -> Optional[List[List]]:
+        '''Возвращает значения диапазона из кеша или None.'''
+        path = self._get_path(self._get_key(sheet_id, cell_range, revision))
+        try:
+            with open(path, 'rb') as cache_file:
+                raw = zlib.decompress(cache_file.read())
+            # Обновляем время доступа для LRU вытеснения
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as err:
+            logger.error(f'Error reading values cache {err}', exc_info=True)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(raw)
+        return json.loads(raw)
+
+    def set(
+            self,
+            sheet_id: str,
+            cell_range: str,
+            revision: str,
+            values: List[List]
+    ) -> None:
+        '''Сохраняет значения диапазона в кеш.'''
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._get_path(
+                self._get_key(sheet_id, cell_range, revision)
+            )
+            raw = json.dumps(
+                values, ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as cache_file:
+                cache_file.write(zlib.compress(raw))
+            os.replace(tmp_path, path)
+            self._evict()
+        except Exception as err:
+            logger.error(f'Error writing values cache {err}', exc_info=True)
+
+    def _evict(self) -> None:
+        '''Удаляет давно не читанные записи сверх max_bytes.'''
+        with self._lock:
+            entries = []
+            total_size = 0
+            with os.scandir(self.cache_dir) as dir_entries:
+                for entry in dir_entries:
+                    if not entry.name.endswith('.json.z'):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, float]:
+        '''Возвращает счетчики кеша: попадания, промахи и экономию.'''
+        with self._lock:
+            requests_count = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (
+                    self.hits / requests_count if requests_count else 0.0
+                ),
+                'bytes_saved': self.bytes_saved,
+            }
+
+
+values_cache = ValuesCache(
+    cache_dir=settings.VALUES_CACHE_DIR,
+    max_bytes=settings.VALUES_CACHE_MAX_BYTES
+)
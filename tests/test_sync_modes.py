@@ -0,0 +1,97 @@
+'''
+Смена режима синхронизации одной гугл таблицы между запусками.
+
+Таблица переносится на локальный стенд Google Sheets и PowerBI
+(src.fake_server), после каждого запуска число строк таблицы
+датасета должно совпадать с числом строк листа.
+
+Запуск из корня репозитория:
+    python -m unittest tests.test_sync_modes
+'''
+import os
+import tempfile
+import unittest
+
+from src.fake_server.server import FakeServer, make_all_market_tab
+
+SHEET_ID = 'sync-modes-sheet'
+SHEET_NAME = 'sync modes'
+TAB = 'Весь рынок'
+# Служебная строка, заголовок и пустая строка перед данными
+HEADER_ROWS = 3
+
+server = None
+temp_dir = None
+
+
+def setUpModule() -> None:
+    '''
+    Запускает стенд и направляет на него сервис.
+
+    Настройки читаются при импорте сервиса, поэтому он импортируется
+    после того, как окружение указывает на стенд.
+    '''
+    global server, temp_dir
+    temp_dir = tempfile.TemporaryDirectory()
+    server = FakeServer().start()
+    os.environ.update(server.env(
+        creds_path=os.path.join(temp_dir.name, 'creds.json')
+    ))
+    os.environ.update({
+        'SYNC_STATE_DB': os.path.join(temp_dir.name, 'sync_state.sqlite3'),
+        'VALUES_CACHE_DIR': os.path.join(temp_dir.name, 'values'),
+        'PBI_TOKEN_CACHE': os.path.join(temp_dir.name, 'pbi_token.json'),
+        'PBI_REPORT_POOL_SIZE': '0',
+    })
+    for name in (
+            'HOST', 'PORT', 'ALLOWED_ORIGINS', 'GAPI_SCOPES', 'GAPI_URL',
+            'PBI_SCOPES', 'SHEETS_URL'
+    ):
+        os.environ.setdefault(name, '0' if name == 'PORT' else '')
+
+
+def tearDownModule() -> None:
+    server.stop()
+    temp_dir.cleanup()
+
+
+class SyncModesTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.values = make_all_market_tab(80)
+        server.store.put_spreadsheet(SHEET_ID, SHEET_NAME, {TAB: self.values})
+
+    def sync(self, mode: str) -> None:
+        '''Синхронизирует таблицу и сверяет строки датасета с листом.'''
+        from src.services.api_exchange_v2 import ApiExchangeFlowAllMarket
+        from src.services.sync_state import sync_state
+
+        flow = ApiExchangeFlowAllMarket(SHEET_ID, SHEET_NAME, mode=mode)
+        self.assertIsNotNone(flow.run(), mode)
+        state = sync_state.get_sheet_state(SHEET_ID, flow.report_id)
+        table = server.store.get_table(state['dataset_id'], TAB)
+        self.assertEqual(
+            table['row_count'], len(self.values) - HEADER_ROWS, mode
+        )
+
+    def append_rows(self, count: int) -> None:
+        '''Дописывает строки в конец листа.'''
+        first_num = len(self.values) - HEADER_ROWS + 1
+        rows = make_all_market_tab(count, seed=first_num)[HEADER_ROWS:]
+        for row_num, row in enumerate(rows, start=first_num):
+            row[0] = str(row_num)
+        self.values.extend(rows)
+        server.store.append_rows(SHEET_ID, TAB, rows)
+
+    def test_modes_switch_between_syncs(self) -> None:
+        # Перед каждым запуском лист растет, иначе запуск пропускается
+        # как неизмененный. Режим delta дописывает только новые строки
+        # и не должен повторить строки, записанные в других режимах.
+        self.sync('delta')
+        for mode in ('append', 'delta', 'full', 'delta', 'reload', 'delta'):
+            self.append_rows(5)
+            self.sync(mode)
+
+
+if __name__ == '__main__':
+    unittest.main()